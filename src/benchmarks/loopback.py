@@ -0,0 +1,346 @@
+"""
+Loopback benchmark of the scan engine.
+
+Stand-in targets are started on a 127.0.0.0/8 alias (every address of the
+block reaches the loopback interface on Linux) and scanned with
+PortScanner.scan_port_range for every combination of the configured port
+ranges, timeouts and thread counts:
+
+    python -m benchmarks.loopback --ports 20000-21999 --timeouts 0.2 --threads 50,200 --save baseline.json
+    python -m benchmarks.loopback --ports 20000-21999 --timeouts 0.2 --threads 50,200 --compare baseline.json
+
+Run it from the src directory. With --compare, the exit code is 1 when a run
+is slower than its baseline by more than the tolerance.
+"""
+import argparse
+import errno
+import json
+import logging
+import math
+import os
+import resource
+import selectors
+import socket
+import sys
+import threading
+import time
+from datetime import datetime
+from typing import Dict, List, Optional, Sequence, Tuple
+from core.scanner import PortScanner
+from core.results import ScanResultSet
+
+logger = logging.getLogger(__name__)
+
+class LoopbackTargets:
+    """
+    Open, closed and blackhole ports on one loopback address.
+
+    Every open_every-th port of the range gets a listener that accepts and
+    closes connections. Every blackhole_every-th port gets a listener with a
+    backlog of 0 whose accept queue is filled up front and never drained, so
+    the kernel drops further SYNs and connects to it time out, like a
+    filtered port. The other ports are closed and answer with a RST.
+
+    Ports already bound by another process are left out of the layout.
+    """
+
+    # Constructor
+    def __init__(self, address: str = "127.0.0.2", start_port: int = 20000, end_port: int = 21999,
+                 open_every: int = 10, blackhole_every: int = 100):
+        self.address = address # Loopback alias the targets listen on
+        self.start_port = start_port # First port of the range
+        self.end_port = end_port # Last port of the range
+        self.open_every = open_every # Interval between open ports (0: none)
+        self.blackhole_every = blackhole_every # Interval between blackhole ports (0: none)
+        self.open_ports: List[int] = [] # Ports with a listener that accepts
+        self.blackhole_ports: List[int] = [] # Ports that never answer
+        self._sockets: List[socket.socket] = [] # Every socket to close on stop
+        self._selector: Optional[selectors.BaseSelector] = None
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self) -> "LoopbackTargets":
+        """Bind the listeners and start accepting connections on the open ports"""
+        self._selector = selectors.DefaultSelector()
+        for port in range(self.start_port, self.end_port + 1):
+            offset = port - self.start_port
+            if self.blackhole_every and offset % self.blackhole_every == self.blackhole_every // 2:
+                if self._blackhole(port):
+                    self.blackhole_ports.append(port)
+            elif self.open_every and offset % self.open_every == 0:
+                listener = self._listen(port, 128)
+                if listener:
+                    listener.setblocking(False)
+                    self._selector.register(listener, selectors.EVENT_READ)
+                    self.open_ports.append(port)
+        self._thread = threading.Thread(target=self._accept_loop, name="loopback-targets", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        """Stop accepting and close every socket"""
+        self._stop.set()
+        if self._thread:
+            self._thread.join()
+        for sock in self._sockets:
+            sock.close()
+        self._sockets.clear()
+        if self._selector:
+            self._selector.close()
+
+    def __enter__(self) -> "LoopbackTargets":
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+    def expected_state(self, port: int) -> str:
+        """State the scanner should report for a port of the range"""
+        if port in self.open_ports:
+            return "open"
+        if port in self.blackhole_ports:
+            return "filtered"
+        return "closed"
+
+    def _listen(self, port: int, backlog: int) -> Optional[socket.socket]:
+        listener = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        listener.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1) # Ports of the previous run are in TIME_WAIT
+        try:
+            listener.bind((self.address, port))
+            listener.listen(backlog)
+        except OSError as e:
+            logger.warning(f"Port {port} left out of the benchmark: {str(e)}")
+            listener.close()
+            return None
+        self._sockets.append(listener)
+        return listener
+
+    def _blackhole(self, port: int) -> bool:
+        listener = self._listen(port, 0)
+        if listener is None:
+            return False
+        for _ in range(8): # Connect until the accept queue is full and SYNs are dropped
+            client = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+            client.settimeout(0.05)
+            result = client.connect_ex((self.address, port))
+            if result in (errno.EAGAIN, errno.ETIMEDOUT):
+                client.close()
+                return True
+            self._sockets.append(client)
+        logger.warning(f"Port {port} left out of the benchmark: accept queue never filled")
+        return False
+
+    def _accept_loop(self):
+        while not self._stop.is_set():
+            for key, _ in self._selector.select(0.05):
+                try:
+                    conn, _ = key.fileobj.accept()
+                    conn.close()
+                except OSError:
+                    pass
+
+class ResourceMonitor:
+    """Sample the thread count and resident memory of the process while it runs"""
+
+    # Constructor
+    def __init__(self, interval: float = 0.01):
+        self.interval = interval # Seconds between samples
+        self.peak_threads = 0 # Highest number of live threads seen
+        self.peak_rss = 0 # Highest resident memory seen, in bytes
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def __enter__(self) -> "ResourceMonitor":
+        self._sample()
+        self._thread = threading.Thread(target=self._run, name="resource-monitor", daemon=True)
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self._stop.set()
+        self._thread.join()
+        self._sample()
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self._sample()
+
+    def _sample(self):
+        self.peak_threads = max(self.peak_threads, threading.active_count())
+        self.peak_rss = max(self.peak_rss, current_rss())
+
+def current_rss() -> int:
+    """
+    Resident memory of the process in bytes.
+
+    Read from /proc on Linux. Elsewhere, the peak of the whole process from
+    getrusage is the closest available value.
+    """
+    try:
+        with open("/proc/self/statm") as statm:
+            return int(statm.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError):
+        maxrss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return maxrss if sys.platform == "darwin" else maxrss * 1024 # Bytes on macOS, KB elsewhere
+
+def percentile(values: Sequence[float], fraction: float) -> float:
+    """Nearest-rank percentile of a list of values (0 when empty)"""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = max(0, min(len(ordered), math.ceil(fraction * len(ordered))) - 1)
+    return ordered[index]
+
+def run_benchmark(targets: LoopbackTargets, timeout: float, threads: int) -> Dict:
+    """
+    Scan the range of the targets once and measure the scan.
+
+    Args:
+        targets: Started stand-in targets
+        timeout: Connect timeout of the scanner, in seconds
+        threads: Worker threads of the scanner
+
+    Returns:
+        Dictionary with the parameters of the run, probes/sec, p50 and p99
+        probe latency (ms), peak RSS (MB), peak thread count, the number of
+        ports by state and the number of ports whose state was wrong
+    """
+    scanner = PortScanner(timeout=timeout, max_threads=threads)
+    latencies: List[float] = []
+    scan_tcp_port = scanner.scan_tcp_port
+
+    def timed_probe(target, port):
+        started = time.perf_counter()
+        result = scan_tcp_port(target, port)
+        latencies.append(time.perf_counter() - started) # list.append is atomic
+        return result
+
+    scanner.scan_tcp_port = timed_probe # The scheduler calls the probe through the instance
+
+    with ResourceMonitor() as monitor:
+        started = time.perf_counter()
+        results = scanner.scan_port_range(targets.address, targets.start_port, targets.end_port, "tcp")
+        elapsed = time.perf_counter() - started
+
+    result_set = ScanResultSet().update((targets.address, result) for result in results)
+    mismatches = sum(1 for result in results if result["state"] != targets.expected_state(result["port"]))
+    return {
+        "ports": f"{targets.start_port}-{targets.end_port}",
+        "timeout": timeout,
+        "threads": threads,
+        "probes": len(results),
+        "seconds": round(elapsed, 4),
+        "probes_per_sec": round(len(results) / elapsed, 1) if elapsed else 0.0,
+        "latency_p50_ms": round(percentile(latencies, 0.50) * 1000, 3),
+        "latency_p99_ms": round(percentile(latencies, 0.99) * 1000, 3),
+        "peak_rss_mb": round(monitor.peak_rss / 2**20, 1),
+        "peak_threads": monitor.peak_threads,
+        "states": result_set.counts(),
+        "mismatches": mismatches,
+    }
+
+def run_key(run: Dict) -> str:
+    """Name of a run in a baseline file"""
+    return f"ports={run['ports']},timeout={run['timeout']},threads={run['threads']}"
+
+def save_baseline(path: str, runs: List[Dict]):
+    """
+    Write the results of the runs to a JSON baseline file.
+
+    Args:
+        path: File to write
+        runs: Results returned by run_benchmark
+    """
+    baseline = {
+        "created": datetime.now().isoformat(timespec="seconds"),
+        "python": sys.version.split()[0],
+        "platform": sys.platform,
+        "runs": {run_key(run): run for run in runs},
+    }
+    with open(path, "w") as baseline_file:
+        json.dump(baseline, baseline_file, indent=2)
+
+def load_baseline(path: str) -> Dict[str, Dict]:
+    """Read the runs of a JSON baseline file, by run name"""
+    with open(path) as baseline_file:
+        return json.load(baseline_file)["runs"]
+
+def compare(runs: List[Dict], baseline: Dict[str, Dict], tolerance: float = 0.2) -> List[str]:
+    """
+    Find the runs that regressed against a baseline.
+
+    Args:
+        runs: Results returned by run_benchmark
+        baseline: Runs of a baseline file, as returned by load_baseline
+        tolerance: Relative change allowed before a run counts as a regression
+
+    Returns:
+        List of messages, one per regression (empty when there is none)
+    """
+    regressions = []
+    for run in runs:
+        key = run_key(run)
+        before = baseline.get(key)
+        if before is None:
+            continue
+        if run["probes_per_sec"] < before["probes_per_sec"] * (1 - tolerance):
+            regressions.append(f"{key}: {run['probes_per_sec']} probes/sec, baseline {before['probes_per_sec']}")
+        for metric in ("latency_p99_ms", "peak_rss_mb", "peak_threads"):
+            if run[metric] > before[metric] * (1 + tolerance):
+                regressions.append(f"{key}: {metric} {run[metric]}, baseline {before[metric]}")
+        if run["mismatches"] > before["mismatches"]:
+            regressions.append(f"{key}: {run['mismatches']} ports with a wrong state, baseline {before['mismatches']}")
+    return regressions
+
+def parse_range(value: str) -> Tuple[int, int]:
+    """Parse a start-end port range"""
+    start, end = (int(port) for port in value.split("-"))
+    if not 1 <= start <= end <= 65535:
+        raise argparse.ArgumentTypeError(f"Invalid port range: {value}")
+    return start, end
+
+def parse_list(kind):
+    """Parse a comma separated list of values of a type"""
+    def parse(value: str):
+        return [kind(item) for item in value.split(",")]
+    return parse
+
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description="Loopback benchmark of the scan engine")
+    parser.add_argument("--address", default="127.0.0.2", help="Loopback address of the stand-in targets")
+    parser.add_argument("--ports", type=parse_range, action="append", help="Port range to scan, can be repeated (default: 20000-21999)")
+    parser.add_argument("--timeouts", type=parse_list(float), default=[0.2], help="Comma separated connect timeouts (default: 0.2)")
+    parser.add_argument("--threads", type=parse_list(int), default=[100], help="Comma separated thread counts (default: 100)")
+    parser.add_argument("--open-every", type=int, default=10, help="One open port every N ports (default: 10)")
+    parser.add_argument("--blackhole-every", type=int, default=100, help="One port that never answers every N ports (default: 100)")
+    parser.add_argument("--save", metavar="FILE", help="Write the results as a JSON baseline")
+    parser.add_argument("--compare", metavar="FILE", help="Compare the results with a JSON baseline")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="Relative regression allowed by --compare (default: 0.2)")
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.WARNING, format="%(asctime)s - %(levelname)s - %(message)s")
+
+    runs = []
+    for start_port, end_port in args.ports or [(20000, 21999)]:
+        with LoopbackTargets(args.address, start_port, end_port, args.open_every, args.blackhole_every) as targets:
+            for timeout in args.timeouts:
+                for threads in args.threads:
+                    run = run_benchmark(targets, timeout, threads)
+                    runs.append(run)
+                    print(
+                        f"{run_key(run)}\t{run['probes_per_sec']} probes/sec\t"
+                        f"p50 {run['latency_p50_ms']} ms\tp99 {run['latency_p99_ms']} ms\t"
+                        f"RSS {run['peak_rss_mb']} MB\t{run['peak_threads']} threads\t"
+                        f"{run['mismatches']} mismatches"
+                    )
+
+    if args.save:
+        save_baseline(args.save, runs)
+    if args.compare:
+        regressions = compare(runs, load_baseline(args.compare), args.tolerance)
+        for regression in regressions:
+            print(f"REGRESSION {regression}")
+        if regressions:
+            sys.exit(1)
+
+if __name__ == "__main__":
+    main()
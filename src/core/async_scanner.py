@@ -0,0 +1,287 @@
+import asyncio
+import errno
+import queue
+import socket
+import threading
+from concurrent.futures import Future
+from collections import defaultdict, deque
+from typing import Awaitable, Callable, List, Dict, Union, Iterable, Iterator, Optional, Tuple
+from core.resolver import Resolver, ResolvedTarget
+from core.services import ServiceRegistry
+from core.timing import AdaptiveTiming
+from core.congestion import CongestionController
+from core.metrics import ScanMetrics
+from core.fingerprint import ServiceDetector
+from core.resources import ResourceGovernor
+from core.engine import ScanEngine
+
+_DONE = object() # End of scan marker for the result queue
+
+class AsyncPortScanner(ScanEngine):
+
+    protocols = ("tcp",) # UDP scans go through the threaded engine
+
+    # Constructor
+    def __init__(self, timeout: float = 1, max_concurrency: int = 5000, resolver: Optional[Resolver] = None,
+                 max_per_host: Optional[int] = None, services: Optional[ServiceRegistry] = None,
+                 timing: Optional[AdaptiveTiming] = None, adaptive_concurrency: bool = False,
+                 metrics: Optional[ScanMetrics] = None, detector: Optional[ServiceDetector] = None,
+                 governor: Optional[ResourceGovernor] = None):
+        super().__init__(
+            timeout=timeout, resolver=resolver, max_per_host=max_per_host, services=services, timing=timing,
+            adaptive_concurrency=adaptive_concurrency, metrics=metrics, detector=detector, governor=governor,
+        )
+        self.max_concurrency = max_concurrency # Maximum number of connections in flight (up to it with adaptive_concurrency)
+        self.max_requeues = 3 # Times a probe is tried again after failing for lack of local resources
+
+    async def scan_tcp_port(self, target: Union[str, ResolvedTarget], port: int) -> Dict[str, Union[int, str, bool]]:
+        """
+        Scan an specific port in the given target using a non-blocking TCP connect.
+
+        Args:
+            target: Target already resolved by self.resolver, or an IP literal
+            port: Number of port to scan
+
+        Returns:
+            Dictionary with the same keys as PortScanner.scan_tcp_port
+        """
+        result = await self._probe_tcp_port(target, port)
+        return await asyncio.wrap_future(result) if isinstance(result, Future) else result
+
+    async def _probe_tcp_port(self, target: Union[str, ResolvedTarget], port: int) -> Union[Dict, Future]:
+        """Scan a port, open ports go on to the detector and give a Future of the result"""
+        started = self._probe_started(target)
+        result, sock = await self._scan_tcp_port(target, port)
+        return self._probe_finished(target, result, sock, started)
+
+    async def _scan_tcp_port(self, target: Union[str, ResolvedTarget], port: int) -> Tuple[Dict, Optional[socket.socket]]:
+        """Scan a port, return the result and, for an open port with a detector, the connected socket"""
+        sock = None
+        try:
+            resolved, timeout, attempts = self._tcp_start(target)
+            for _ in range(attempts):
+                result, rtt, sock = await self._connect(resolved, port, timeout)
+                timeout = self._tcp_retry(result, rtt, timeout)
+                if timeout is None:
+                    break
+            return self._tcp_result(resolved, port, result, rtt), sock
+        except Exception as e: # Resolution, socket or generic error
+            return self._tcp_error(target, port, e, sock), None
+
+    async def _connect(self, resolved: ResolvedTarget, port: int, timeout: float) -> Tuple[int, float, Optional[socket.socket]]:
+        """
+        Try a TCP connection, return an errno like connect_ex, the time it
+        took and, when it succeeded and there is a detector, the connected
+        socket for the caller to close.
+        """
+        loop = asyncio.get_running_loop()
+        sock = self.governor.open(resolved.family)
+        result = None
+        try:
+            sock.setblocking(False) # The event loop drives the connection, never block the thread
+            started = loop.time()
+            try:
+                await asyncio.wait_for(loop.sock_connect(sock, (resolved.address, port)), timeout)
+                result = 0
+            except asyncio.TimeoutError: # No answer in time
+                result = errno.ETIMEDOUT
+            except OSError as e: # Refused, unreachable...
+                result = e.errno or errno.ECONNREFUSED
+            rtt = loop.time() - started
+        finally:
+            if result != 0 or self.detector is None:
+                self.governor.close(sock, connected=result == 0)
+        return result, rtt, sock if result == 0 and self.detector else None
+
+    async def scan_tcp_probes(self, probes: Iterable[Tuple[str, int]],
+                              on_result: Callable[[str, Dict], Awaitable[None]]):
+        """
+        Scan (host, port) probes on a single event loop, with at most
+        max_concurrency connections in flight and at most max_per_host
+        connections against the same host. With adaptive_concurrency, the
+        connections in flight follow the window of a CongestionController.
+
+        Probes are scheduled like ProbeScheduler does on threads: they are
+        pulled only when there is a free slot, and probes for a busy host
+        are parked until one of its connections ends, while the other
+        hosts keep going.
+
+        Args:
+            probes: Iterable of (host, port) tuples
+            on_result: Coroutine function called with (host, result) as
+                soon as each probe completes
+        """
+        probes = iter(probes)
+        # Every connection holds a socket, and so does every open port waiting for detection
+        detection_backlog = 4 * self.detector.max_workers if self.detector else 0
+        max_concurrency = max(1, self.governor.max_in_flight(self.max_concurrency, extra_fds=detection_backlog))
+        max_per_host = self.max_per_host or max_concurrency
+        max_parked = 64 * max_concurrency # Probes waiting for a busy host before we stop pulling new ones
+        controller = None
+        if self.adaptive_concurrency:
+            controller = self.controller = CongestionController(maximum=max_concurrency)
+        running = {} # Task -> (host, port) of the connection
+        deferred = {} # Detection of an open port -> host
+        in_flight = defaultdict(int) # Host -> connections in flight
+        parked = defaultdict(deque) # Host -> ports waiting for a free slot on that host
+        ready = deque() # Hosts with parked ports that got a free slot back
+        requeues = {} # (host, port) -> times queued again
+        parked_count = 0
+        exhausted = False
+        # Connections and detections report here as they end, so only the
+        # host whose slot was freed is looked at
+        completed = asyncio.Queue()
+
+        def start(host, port):
+            in_flight[host] += 1
+            task = asyncio.ensure_future(self._probe_tcp_port(host, port))
+            running[task] = (host, port)
+            task.add_done_callback(completed.put_nowait)
+
+        try:
+            while True:
+                limit = max_concurrency if controller is None else min(max_concurrency, controller.window)
+                if detection_backlog and len(deferred) >= detection_backlog: # Let the detections catch up
+                    limit = 0
+
+                # Parked probes first, their hosts have a free slot now
+                while ready and len(running) < limit:
+                    host = ready.popleft()
+                    ports = parked[host]
+                    while ports and len(running) < limit and in_flight[host] < max_per_host:
+                        start(host, ports.popleft())
+                        parked_count -= 1
+                    if not ports:
+                        del parked[host]
+                    elif in_flight[host] < max_per_host: # Out of global slots, try again later
+                        ready.appendleft(host)
+
+                # Then new probes, until the slots or the parking area are full
+                while not exhausted and len(running) < limit and parked_count < max_parked:
+                    try:
+                        host, port = next(probes)
+                    except StopIteration:
+                        exhausted = True
+                        break
+                    if in_flight[host] < max_per_host and host not in parked:
+                        start(host, port)
+                    else:
+                        parked[host].append(port)
+                        parked_count += 1
+
+                if not running and not deferred:
+                    break
+
+                done = [await completed.get()]
+                while not completed.empty():
+                    done.append(completed.get_nowait())
+                for future in done:
+                    if future in deferred:
+                        await on_result(deferred.pop(future), future.result())
+                        continue
+                    host, port = running.pop(future)
+                    in_flight[host] -= 1
+                    if not in_flight[host]:
+                        del in_flight[host]
+                    result = future.result()
+
+                    if isinstance(result, Future): # Open port handed to the detector, the slot is free
+                        detection = asyncio.wrap_future(result)
+                        deferred[detection] = host
+                        detection.add_done_callback(completed.put_nowait)
+                        if host in parked and host not in ready:
+                            ready.append(host)
+                        continue
+
+                    requeued = False
+                    if controller and controller.record(result):
+                        attempts = requeues.get((host, port), 0)
+                        if attempts < self.max_requeues: # Try again once the window has shrunk
+                            requeues[(host, port)] = attempts + 1
+                            parked[host].appendleft(port)
+                            parked_count += 1
+                            requeued = True
+                    if not requeued:
+                        requeues.pop((host, port), None)
+
+                    if host in parked and host not in ready:
+                        ready.append(host)
+                    if not requeued:
+                        await on_result(host, result)
+        finally:
+            # The consumer may stop early, do not leave connections or detections behind
+            for future in list(running) + list(deferred):
+                future.cancel()
+
+    async def scan_tcp_ports(self, target: Union[str, ResolvedTarget], ports: Iterable[int]) -> List[Dict]:
+        """
+        Scan the given ports on a single event loop, keeping at most
+        max_concurrency connections in flight.
+
+        Args:
+            target: IP or hostname to scan
+            ports: Ports to scan
+
+        Returns:
+            List of results by port
+        """
+        results = []
+
+        async def collect(host, result):
+            results.append(result)
+
+        await self.scan_tcp_probes(((target, port) for port in ports), collect)
+        return sorted(results, key=lambda x: x["port"])
+
+    def _run_probes(self, probes: Iterable[Tuple[str, int]], protocol: str) -> Iterator[Tuple[str, Dict]]:
+        """
+        Run TCP probes on an event loop and yield their results.
+
+        The event loop runs in a background thread and hands results over
+        through a bounded queue, so a slow consumer slows the scan down
+        instead of piling up results. Hosts are resolved as the loop pulls
+        the probes, once per scan: names missing from the resolver cache
+        (see resolve_targets) would block the loop for their first lookup.
+        """
+        stop = threading.Event() # Set when the consumer stops iterating
+        out = queue.Queue(maxsize=max(1, self.max_concurrency))
+
+        def until_stopped():
+            for probe in probes:
+                if stop.is_set():
+                    return
+                yield probe
+
+        async def publish(host, result):
+            while not stop.is_set():
+                try:
+                    out.put_nowait((host, result))
+                    return
+                except queue.Full: # Back-pressure, let the consumer catch up
+                    await asyncio.sleep(0.005)
+
+        def run_loop():
+            error = None
+            try:
+                asyncio.run(self.scan_tcp_probes(until_stopped(), publish))
+            except BaseException as e:
+                error = e
+            out.put((_DONE, error))
+
+        thread = threading.Thread(target=run_loop, name="async-scanner", daemon=True)
+        thread.start()
+        try:
+            while True:
+                host, result = out.get()
+                if host is _DONE:
+                    if result is not None:
+                        raise result
+                    return
+                yield host, result
+        finally:
+            stop.set()
+            while thread.is_alive(): # Unblock the loop thread if the queue is full
+                try:
+                    out.get(timeout=0.1)
+                except queue.Empty:
+                    pass
@@ -0,0 +1,90 @@
+from typing import Dict, Optional
+from core.errors import is_resource_error
+
+class CongestionController:
+    """
+    AIMD control of the number of probes in flight.
+
+    The window grows while probes get clean answers: by one probe per answer
+    up to the slow start threshold, then by about one probe per window. It
+    is halved when a probe fails for lack of local resources (EMFILE,
+    ENOBUFS, EADDRNOTAVAIL...) or when the share of probes timing out jumps
+    above its long term level, which usually means the target or a device in
+    the path started dropping us. At most one decrease happens per window of
+    results, so a burst of failures counts as a single congestion event.
+
+    The controller is not thread safe, it is fed from the thread that
+    collects the results.
+    """
+
+    FAST_ALPHA = 0.2 # Weight of a new result in the recent timeout rate
+    SLOW_ALPHA = 0.01 # Weight of a new result in the long term timeout rate
+
+    # Constructor
+    def __init__(self, maximum: int, minimum: int = 1, initial: Optional[int] = None,
+                 decrease: float = 0.5, timeout_spike: float = 0.3):
+        self.maximum = max(1, maximum) # Upper bound of the window
+        self.minimum = max(1, min(minimum, self.maximum)) # Lower bound of the window
+        self._window = float(min(self.maximum, max(self.minimum, initial or max(self.minimum, self.maximum // 10))))
+        self.ssthresh = float(self.maximum) # Slow start threshold
+        self.decrease = decrease # Factor applied to the window on congestion
+        self.timeout_spike = timeout_spike # Recent minus long term timeout rate that counts as congestion
+        self.recent_timeouts = 0.0 # Recent share of probes timing out
+        self.baseline_timeouts: Optional[float] = None # Long term share of probes timing out
+        self._until_next_decrease = 0 # Results to see before the window can shrink again
+        self.stats: Dict[str, int] = {"increases": 0, "decreases": 0, "requeued": 0}
+
+    @property
+    def window(self) -> int:
+        """Number of probes allowed in flight"""
+        return int(self._window)
+
+    def record(self, result: Dict) -> bool:
+        """
+        Update the window with the result of a probe.
+
+        Args:
+            result: Result dictionary as returned by the scanner
+
+        Returns:
+            True when the probe failed because of local resources and should
+            be queued again
+        """
+        if self._until_next_decrease:
+            self._until_next_decrease -= 1
+
+        if is_resource_error(result):
+            self._on_congestion()
+            self.stats["requeued"] += 1
+            return True
+
+        timed_out = 1.0 if result.get("reason") == "no-response" else 0.0
+        self.recent_timeouts += self.FAST_ALPHA * (timed_out - self.recent_timeouts)
+        if self.baseline_timeouts is None:
+            self.baseline_timeouts = timed_out
+        else:
+            self.baseline_timeouts += self.SLOW_ALPHA * (timed_out - self.baseline_timeouts)
+
+        if self.recent_timeouts - self.baseline_timeouts > self.timeout_spike:
+            self._on_congestion()
+        elif not timed_out:
+            self._on_success()
+        return False
+
+    def _on_success(self):
+        if self._window >= self.maximum:
+            return
+        if self._window < self.ssthresh:
+            self._window += 1 # Slow start
+        else:
+            self._window += 1 / self._window # Congestion avoidance
+        self._window = min(self._window, float(self.maximum))
+        self.stats["increases"] += 1
+
+    def _on_congestion(self):
+        if self._until_next_decrease:
+            return
+        self._window = max(float(self.minimum), self._window * self.decrease)
+        self.ssthresh = self._window
+        self._until_next_decrease = self.window
+        self.stats["decreases"] += 1
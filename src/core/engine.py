@@ -0,0 +1,352 @@
+import errno
+import socket
+import time
+from collections import deque
+from concurrent.futures import Future
+from functools import partial
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Sequence, Set, Tuple, Union
+import logging # Import logging module, used to log messages in the console
+from core.resolver import Resolver, ResolvedTarget
+from core.services import ServiceRegistry, get_service_registry
+from core.scheduler import interleave, shuffle
+from core.timing import AdaptiveTiming
+from core.congestion import CongestionController
+from core.results import ScanResultSet
+from core.metrics import ScanMetrics
+from core.fingerprint import ServiceDetector
+from core.resources import ResourceGovernor
+from core.errors import TIMEOUT_ERRNOS, RESOURCE_ERRNOS, classify_connect_errno
+
+class ScanEngine:
+    """
+    Base of the scan engines.
+
+    Everything but making the connections and scheduling the probes is
+    shared: the order of the probes and the exclusions, the resolution of
+    the targets, the steps of a TCP probe (timeouts, retries, metrics, the
+    state of the port, the handoff of open ports to the detector) and the
+    logging of the results. An engine provides:
+        - _connect: one TCP connection attempt
+        - _scan_tcp_port: the attempts of a probe, through the _tcp_* steps
+        - _run_probes: run (host, port) probes and yield their results
+    """
+
+    protocols = ("tcp", "udp") # Protocols the engine can scan
+
+    # Constructor
+    def __init__(self, timeout: float = 1, resolver: Optional[Resolver] = None, max_per_host: Optional[int] = None,
+                 services: Optional[ServiceRegistry] = None, timing: Optional[AdaptiveTiming] = None,
+                 adaptive_concurrency: bool = False, metrics: Optional[ScanMetrics] = None,
+                 detector: Optional[ServiceDetector] = None, governor: Optional[ResourceGovernor] = None):
+        self.timeout = timeout # Timeout for socket connection
+        self.max_per_host = max_per_host # Maximum number of probes in flight against one host (None: no limit of its own)
+        self.resolver = resolver or Resolver() # Shared DNS cache, targets are resolved once per scan
+        self.services = services or get_service_registry() # Port to service name table, loaded on first use
+        self.timing = timing # Adaptive per-host timeouts, self.timeout is used for every probe when None
+        self.adaptive_concurrency = adaptive_concurrency # Grow and shrink the probes in flight with the errors seen
+        self.controller: Optional[CongestionController] = None # Controller of the last scan, for its statistics
+        self.metrics = metrics # Counters and timers of the scan, nothing is measured when None
+        self.detector = detector # Identifies the service of open TCP ports on the scan connection, port table only when None
+        self.governor = governor or ResourceGovernor() # Opens and closes the TCP sockets, caps the probes in flight to the system limits
+        self.logger = logging.getLogger(type(self).__module__) # Logger object, named after the engine
+
+    def _probe_started(self, target: Union[str, ResolvedTarget]) -> float:
+        """Count a TCP probe in flight, return when it started"""
+        if self.metrics:
+            self.metrics.probe_started(_hostname(target))
+        return time.perf_counter()
+
+    def _probe_finished(self, target: Union[str, ResolvedTarget], result: Dict, sock: Optional[socket.socket],
+                        started: float) -> Union[Dict, Future]:
+        """Count a finished TCP probe, open ports go on to the detector and give a Future of the result"""
+        if self.metrics:
+            self.metrics.probe_finished(_hostname(target), result, time.perf_counter() - started)
+        if sock is None:
+            return result
+        return self.detector.submit(sock, result, close=partial(self.governor.close, connected=True)) # The connection is reused, no second connect
+
+    def _tcp_start(self, target: Union[str, ResolvedTarget]) -> Tuple[ResolvedTarget, float, int]:
+        """
+        First step of a TCP probe.
+
+        Returns:
+            The resolved target, the timeout of the first attempt and the
+            number of attempts
+
+        Raises:
+            socket.gaierror: If the target cannot be resolved
+        """
+        started = time.perf_counter()
+        resolved = self.resolver.resolve(target) # Cached, only the first probe of a scan pays for the lookup
+        if self.metrics:
+            self.metrics.add_phase("resolve", time.perf_counter() - started)
+        # Fixed timeout, or derived from the RTT measured on this host
+        timeout = self.timing.timeout_for(resolved.address) if self.timing else self.timeout
+        return resolved, timeout, 1 + (self.timing.retries if self.timing else 0)
+
+    def _tcp_retry(self, result: int, rtt: float, timeout: float) -> Optional[float]:
+        """Measure a connection attempt, return the timeout of the next one, None when there is no need for one"""
+        if self.metrics:
+            self.metrics.observe_connect(rtt)
+            self.metrics.add_phase("connect", rtt)
+        if result not in TIMEOUT_ERRNOS: # Only probes that got no answer are retried
+            return None
+        return self.timing.retry_timeout(timeout) if self.timing else timeout
+
+    def _tcp_result(self, resolved: ResolvedTarget, port: int, result: int, rtt: float) -> Dict[str, Union[int, str]]:
+        """Result of a TCP probe from the outcome of its last connection attempt"""
+        if self.timing and result in (0, errno.ECONNREFUSED): # Both a SYN/ACK and a RST measure the RTT
+            self.timing.record(resolved.address, rtt)
+        state, reason = classify_connect_errno(result) # Open, closed, filtered or local error
+
+        service = ""
+        if state == "open": # If the connection is successful, get the service name
+            started = time.perf_counter()
+            service = self.services.lookup(port, "tcp") # Get the service name by port
+            if self.metrics:
+                self.metrics.add_phase("service", time.perf_counter() - started)
+        return { # Return the dictionary with the port, state, and service if the connection is successful
+            "port": port,
+            "state": state,
+            "service": service,
+            "reason": reason,
+        }
+
+    def _tcp_error(self, target: Union[str, ResolvedTarget], port: int, error: Exception,
+                   sock: Optional[socket.socket]) -> Dict[str, Union[int, str]]:
+        """Result of a TCP probe that raised, the connected socket of an open port is closed"""
+        if sock:
+            self.governor.close(sock, connected=True)
+        if isinstance(error, socket.gaierror): # Handle the error of resolution of the hostname
+            self.logger.error(f"Error of resolution of the hostname: {_hostname(target)}") # Log the error
+            return {"port": port, "state": "error", "service": "", "reason": "resolution"}
+        if isinstance(error, OSError): # Socket errors, usually running out of local resources
+            if error.errno in RESOURCE_ERRNOS:
+                self.logger.debug(f"Out of resources scanning the port {port}: {str(error)}")
+            else:
+                self.logger.error(f"Error scanning the port {port}: {str(error)}")
+            state, reason = classify_connect_errno(error.errno) if error.errno else ("error", "oserror")
+            return {"port": port, "state": state, "service": "", "reason": reason}
+        self.logger.error(f"Error scanning the port {port}: {str(error)}") # Log the error
+        return {"port": port, "state": "error", "service": "", "reason": "exception"}
+
+    def iter_scan(self, target: str, start_port: int, end_port: int, protocol: str) -> Iterator[Dict]:
+        """
+        Scan a range of ports and yield the results as they complete.
+
+        Only a bounded window of probes is pending at any time, so memory
+        does not grow with the size of the range.
+
+        Args:
+            target: IP or hostname to scan
+            start_port: Start port
+            end_port: End Port
+            protocol: "tcp" or "udp", see protocols for those of the engine
+
+        Returns:
+            Iterator of results, in completion order
+        """
+        ports = range(start_port, end_port + 1)
+
+        # Resolve the target once, every probe gets the cached address
+        try:
+            self.resolver.resolve(target)
+        except socket.gaierror:
+            self.logger.error(f"Error of resolution of the hostname: {target}")
+            if protocol in self.protocols:
+                for port in ports:
+                    yield {"port": port, "state": "error", "service": "", "reason": "resolution"}
+            return
+
+        for _, result in self.iter_targets([target], ports, protocol, unresolved=set()):
+            yield result
+
+    def scan_port_range(self, target: str, start_port: int, end_port: int, protocol: str) -> List[Dict]:
+        """
+        Scan a range of ports.
+
+        Args:
+            target: IP or hostname to scan
+            start_port: Start port
+            end_port: End Port
+            protocol: "tcp" or "udp", see protocols for those of the engine
+
+        Returns:
+            List of results by port
+        """
+        return sorted(self.iter_scan(target, start_port, end_port, protocol), key=lambda x: x["port"])
+
+    def iter_targets(self, targets: Sequence[str], ports: Iterable[int], protocol: str,
+                     unresolved: Optional[Set[str]] = None,
+                     exclude: Optional[Callable[[str, int], bool]] = None, randomize: bool = False,
+                     seed: Optional[int] = None) -> Iterator[Tuple[str, Dict]]:
+        """
+        Scan the same ports on several hosts and yield the results as they
+        complete, interleaving probes across hosts.
+
+        Args:
+            targets: Hosts to scan, usually a TargetList built from IPs,
+                hostnames and CIDR blocks
+            ports: Ports to scan on every host
+            protocol: "tcp" or "udp", see protocols for those of the engine
+            unresolved: Names already known to fail resolution, as returned
+                by resolve_targets (resolved here when None)
+            exclude: Called with (host, port), probes for which it returns
+                True are skipped (already done in a resumed scan...)
+            randomize: Probe every (host, port) pair in pseudo-random order
+                instead of the likely open ports first
+            seed: Order of a randomized scan (random when None)
+
+        Returns:
+            Iterator of (host, result) tuples, in completion order. Hosts
+            whose name cannot be resolved are left out.
+        """
+        if protocol not in self.protocols:
+            self.logger.error(f"Invalid protocol: {protocol}")
+            return
+
+        # Resolve every name before the first probe, the probes only hit the cache
+        if unresolved is None:
+            unresolved = self.resolve_targets(targets)
+        if randomize: # Lazy permutation of the pairs, never built as a list
+            if not isinstance(ports, Sequence):
+                ports = list(ports)
+            order = shuffle(targets, ports, seed)
+        else:
+            order = interleave(targets, self.services.prioritize(ports, protocol)) # Likely open ports first
+        probes = (
+            (host, port) for host, port in order
+            if host not in unresolved and not (exclude and exclude(host, port))
+        )
+        yield from self.iter_probes(probes, protocol)
+
+    def iter_probes(self, probes: Iterable[Tuple[str, int]], protocol: str) -> Iterator[Tuple[str, Dict]]:
+        """
+        Scan arbitrary (host, port) probes and yield the results as they
+        complete.
+
+        Hosts are resolved here, once per scan, and the probes get the
+        ResolvedTarget (see _resolve_probes).
+
+        Args:
+            probes: Iterable of (host, port) tuples, consumed lazily. Hosts
+                may also be ResolvedTarget objects
+            protocol: "tcp" or "udp", see protocols for those of the engine
+
+        Returns:
+            Iterator of (host, result) tuples, in completion order
+        """
+        if protocol not in self.protocols:
+            self.logger.error(f"Invalid protocol: {protocol}")
+            return
+
+        unresolved = deque() # (host, result) of the probes whose host did not resolve
+        results = self._run_probes(self._resolve_probes(probes, unresolved), protocol)
+        if self.metrics:
+            self.metrics.scan_started()
+        try:
+            for target, result in results:
+                yield from self._report_unresolved(unresolved, protocol)
+                host = _hostname(target)
+                if self.metrics and protocol == "udp": # TCP probes are counted when they finish
+                    self.metrics.probe_finished(host, result, protocol="udp")
+                # Log in real time open ports
+                if result["state"] == "open":
+                    self.logger.info(
+                        f"{host}: Port {result['port']} open - "
+                        f"Service: {result['service']}"
+                    )
+                yield host, result
+            yield from self._report_unresolved(unresolved, protocol)
+        finally:
+            results.close() # Stop the engine when the consumer stops early
+            if self.metrics:
+                self.metrics.scan_finished()
+
+    def _resolve_probes(self, probes: Iterable[Tuple[Union[str, ResolvedTarget], int]],
+                        unresolved: deque) -> Iterator[Tuple[ResolvedTarget, int]]:
+        """
+        Turn the host of every probe into a ResolvedTarget, in the thread
+        that pulls the probes.
+
+        Names are resolved on their first probe (usually a hit of the cache
+        warmed by resolve_targets) and kept until the end of the scan, so
+        the probes never take the cache lock or look a name up again, and a
+        TTL expiring during a long sweep never blocks an event loop. IP
+        literals are parsed, which is cheaper than keeping every address of
+        a large block. Probes of hosts that do not resolve are appended to
+        unresolved with their error result instead.
+        """
+        names: Dict[str, Optional[ResolvedTarget]] = {} # Names resolved during this scan, None when they failed
+        for host, port in probes:
+            if isinstance(host, ResolvedTarget):
+                yield host, port
+                continue
+            resolved = names.get(host)
+            if resolved is None and host not in names:
+                try:
+                    resolved = self.resolver.resolve(host)
+                except socket.gaierror:
+                    self.logger.error(f"Error of resolution of the hostname: {host}")
+                    names[host] = None
+                else:
+                    if resolved.address != host: # A name, not an IP literal
+                        names[host] = resolved
+            if resolved is None:
+                unresolved.append((host, {"port": port, "state": "error", "service": "", "reason": "resolution"}))
+                continue
+            yield resolved, port
+
+    def _report_unresolved(self, unresolved: deque, protocol: str) -> Iterator[Tuple[str, Dict]]:
+        """Yield the results of the probes whose host did not resolve"""
+        while unresolved:
+            host, result = unresolved.popleft()
+            if self.metrics:
+                self.metrics.probe_finished(host, result, protocol=protocol)
+            yield host, result
+
+    def _run_probes(self, probes: Iterable[Tuple[str, int]], protocol: str) -> Iterator[Tuple[str, Dict]]:
+        """Run the probes with the scheduling of the engine and yield (host, result) as they complete"""
+        raise NotImplementedError
+
+    def scan_targets(self, targets: Sequence[str], ports: Iterable[int], protocol: str,
+                     unresolved: Optional[Set[str]] = None) -> ScanResultSet:
+        """
+        Scan the same ports on several hosts, interleaving probes across hosts.
+
+        Args:
+            targets: Hosts to scan, usually a TargetList built from IPs,
+                hostnames and CIDR blocks
+            ports: Ports to scan on every host
+            protocol: "tcp" or "udp", see protocols for those of the engine
+            unresolved: Names already known to fail resolution, as returned
+                by resolve_targets (resolved here when None)
+
+        Returns:
+            ScanResultSet mapping every host to its list of results by port.
+            Hosts whose name cannot be resolved are left out.
+        """
+        results = ScanResultSet(protocol)
+        return results.update(self.iter_targets(targets, ports, protocol, unresolved))
+
+    def resolve_targets(self, targets: Sequence[str]) -> Set[str]:
+        """
+        Resolve every hostname of the targets before scanning.
+
+        Args:
+            targets: Hosts to scan
+
+        Returns:
+            Set of names that could not be resolved
+        """
+        started = time.perf_counter()
+        unresolved = self.resolver.resolve_all(targets)
+        if self.metrics:
+            self.metrics.add_phase("resolve", time.perf_counter() - started)
+        for name in unresolved:
+            self.logger.error(f"Error of resolution of the hostname: {name}")
+        return unresolved
+
+def _hostname(target: Union[str, ResolvedTarget]) -> str:
+    """Host of a probe as the user gave it"""
+    return target.hostname if isinstance(target, ResolvedTarget) else target
@@ -0,0 +1,60 @@
+import errno
+from typing import Tuple
+
+# connect_ex results of a probe that got no answer before the timeout
+TIMEOUT_ERRNOS = frozenset({errno.EAGAIN, errno.EWOULDBLOCK, errno.ETIMEDOUT})
+
+# Failures caused by running out of local resources, not by the target.
+# The port state is unknown and the probe should be tried again later
+RESOURCE_ERRNOS = frozenset({
+    errno.EMFILE, # Process out of file descriptors
+    errno.ENFILE, # System out of file descriptors
+    errno.ENOBUFS, # Out of socket buffers
+    errno.ENOMEM,
+    errno.EADDRNOTAVAIL, # Out of ephemeral ports
+    errno.EADDRINUSE,
+})
+
+# Reasons that are not an errno name
+REASON_SYN_ACK = "syn-ack" # Connection accepted
+REASON_CONN_REFUSED = "conn-refused" # RST received
+REASON_NO_RESPONSE = "no-response" # Nothing before the timeout
+
+_UNREACHABLE = {
+    errno.EHOSTUNREACH: "host-unreach",
+    errno.ENETUNREACH: "net-unreach",
+}
+
+def errno_name(err: int) -> str:
+    """Symbolic name of an errno value (EMFILE, ECONNRESET...)"""
+    return errno.errorcode.get(err, str(err))
+
+def classify_connect_errno(err: int) -> Tuple[str, str]:
+    """
+    Turn the result of a TCP connect into a port state and a reason.
+
+    Args:
+        err: Value returned by connect_ex, or the errno of the exception
+
+    Returns:
+        Tuple (state, reason). The state is open, closed, filtered or error;
+        the reason says what the state is based on, an errno name when there
+        is no better description
+    """
+    if err == 0:
+        return "open", REASON_SYN_ACK
+    if err == errno.ECONNREFUSED:
+        return "closed", REASON_CONN_REFUSED
+    if err in TIMEOUT_ERRNOS:
+        return "filtered", REASON_NO_RESPONSE
+    if err in _UNREACHABLE:
+        return "filtered", _UNREACHABLE[err]
+    if err in RESOURCE_ERRNOS:
+        return "error", errno_name(err)
+    return "closed", errno_name(err)
+
+_RESOURCE_REASONS = frozenset(errno_name(err) for err in RESOURCE_ERRNOS)
+
+def is_resource_error(result: dict) -> bool:
+    """Whether a probe failed because of local resource exhaustion"""
+    return result["state"] == "error" and result.get("reason") in _RESOURCE_REASONS
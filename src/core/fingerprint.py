@@ -0,0 +1,212 @@
+import re
+import socket
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Callable, Dict, Iterable, NamedTuple, Optional
+import logging # Import logging module, used to log messages in the console
+
+class Signature(NamedTuple):
+    """A service recognized by the start of its answer"""
+    service: str # Name reported for the port
+    pattern: bytes # Regular expression matched at the start of the answer, a group named version captures the version
+
+# Matched in order, the first signature that matches wins
+DEFAULT_SIGNATURES = (
+    Signature("ssh", rb"SSH-[\d.]+-(?P<version>[^\r\n]+)"),
+    Signature("ftp", rb"220[- ][^\r\n]*(?P<version>vsFTPd [\w.]+|ProFTPD [\w.]+|Pure-FTPd|FileZilla Server[^\r\n]*)"),
+    Signature("ftp", rb"220[- ][^\r\n]*FTP"),
+    Signature("smtp", rb"220[- ][^\r\n]*(?P<version>Postfix|Exim [\w.]+|Sendmail [\w./]+|Microsoft ESMTP MAIL Service)"),
+    Signature("smtp", rb"220[- ][^\r\n]*SMTP"),
+    Signature("pop3", rb"\+OK[^\r\n]*(?P<version>Dovecot|POP3)"),
+    Signature("imap", rb"\* OK[^\r\n]*(?P<version>Dovecot|Courier-IMAP|IMAP4rev1)"),
+    Signature("http", rb"HTTP/1\.[01] \d{3}.*?\r\n[Ss]erver: (?P<version>[^\r\n]+)"),
+    Signature("http", rb"HTTP/1\.[01] \d{3}"),
+    Signature("rtsp", rb"RTSP/1\.0 \d{3}"),
+    Signature("mysql", rb".\x00\x00\x00\x0a(?P<version>[\d.]+[\w.-]*)\x00"),
+    Signature("mysql", rb".\x00\x00\x00\xffj\x04Host '"), # Host not allowed to connect
+    Signature("postgresql", rb"E\x00\x00\x00.S(?:FATAL|ERROR)"),
+    Signature("redis", rb"\$\d+\r\n# Server\r\nredis_version:(?P<version>[\w.]+)"),
+    Signature("redis", rb"-(?:ERR|NOAUTH|DENIED)[^\r\n]*\r\n"),
+    Signature("memcached", rb"VERSION (?P<version>[\w.]+)\r\n"),
+    Signature("vnc", rb"RFB (?P<version>\d{3}\.\d{3})\n"),
+    Signature("telnet", rb"\xff[\xfb-\xfe]"),
+    Signature("amqp", rb"AMQP\x00"),
+)
+
+_HTTP_GET = b"GET / HTTP/1.0\r\n\r\n"
+
+# Ports whose service waits for the client, the probe is sent right away
+PROBES = {port: _HTTP_GET for port in (80, 81, 591, 3000, 5000, 8000, 8008, 8080, 8081, 8088, 8888, 9000)}
+PROBES.update({
+    6379: b"INFO server\r\n", # Redis, -NOAUTH when protected
+    11211: b"version\r\n", # memcached
+})
+
+# Sent to ports that stay silent after connecting, many services answer it with an error
+DEFAULT_PROBE = _HTTP_GET
+
+class SignatureMatcher:
+    """
+    Match answers against a set of signatures with a single regular
+    expression, compiled once.
+
+    Every signature becomes an alternative wrapped in a group named after
+    its index, so one match both finds the first signature that applies and
+    tells which one it was.
+    """
+
+    # Constructor
+    def __init__(self, signatures: Iterable[Signature] = DEFAULT_SIGNATURES):
+        self.signatures = tuple(signatures) # Signatures by index
+        alternatives = []
+        for index, signature in enumerate(self.signatures):
+            pattern = signature.pattern.replace(b"(?P<version>", f"(?P<v{index}>".encode())
+            alternatives.append(b"(?P<s%d>%s)" % (index, pattern))
+        self._regex = re.compile(b"|".join(alternatives), re.DOTALL)
+
+    def match(self, answer: bytes) -> Optional[Dict[str, str]]:
+        """
+        Identify the service that sent an answer.
+
+        Args:
+            answer: First bytes received from the service
+
+        Returns:
+            Dictionary with the service and, when the signature captures
+            it, the version. None when no signature matches
+        """
+        match = self._regex.match(answer)
+        if match is None:
+            return None
+        index = int(match.lastgroup[1:]) # The outer group of the signature closes last
+        identified = {"service": self.signatures[index].service}
+        version = match.groupdict().get(f"v{index}")
+        if version:
+            identified["version"] = version.decode("latin-1").strip()
+        return identified
+
+_default_matcher: Optional[SignatureMatcher] = None
+
+def get_default_matcher() -> SignatureMatcher:
+    """Matcher of DEFAULT_SIGNATURES, compiled on first use and shared"""
+    global _default_matcher
+    if _default_matcher is None:
+        _default_matcher = SignatureMatcher()
+    return _default_matcher
+
+def printable(answer: bytes, limit: int = 256) -> str:
+    """Answer as text for reports, non printable bytes escaped"""
+    text = answer[:limit].decode("latin-1")
+    return "".join(char if char.isprintable() else f"\\x{ord(char):02x}" for char in text)
+
+class ServiceDetector:
+    """
+    Identify the service of open TCP ports on the connection the scan
+    already opened.
+
+    The detector reads the banner the service sends on its own, or sends a
+    small probe (HTTP GET, Redis INFO...) when it stays silent, and matches
+    the answer against the signatures. Reads are bounded in time and size.
+
+    Detection runs on its own thread pool, so slow or silent services do
+    not hold the slots of the port scan. The sockets handed to the detector
+    are closed by it.
+    """
+
+    # Constructor
+    def __init__(self, read_timeout: float = 1.0, max_banner: int = 2048, max_workers: int = 32,
+                 matcher: Optional[SignatureMatcher] = None):
+        self.read_timeout = read_timeout # Time to wait for each answer (banner, then probe answer)
+        self.max_banner = max_banner # Bytes read at most from a service
+        self.max_workers = max_workers # Detections running at the same time
+        self.matcher = matcher or get_default_matcher() # Compiled signatures
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self.logger = logging.getLogger(__name__) # Logger object
+
+    def submit(self, sock: socket.socket, result: Dict,
+               close: Optional[Callable[[socket.socket], None]] = None) -> Future:
+        """
+        Start the detection of an open port.
+
+        Args:
+            sock: Connected socket to the port, closed when the detection ends
+            result: Result of the port scan, completed with the detection
+            close: Called to close the socket (sock.close when None), the
+                scanners close it through their ResourceGovernor
+
+        Returns:
+            Future of the completed result dictionary
+        """
+        close = close or socket.socket.close
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="detect")
+        future = self._executor.submit(self.detect, sock, result, close)
+        future.add_done_callback(lambda done: done.cancelled() and close(sock)) # Never ran, close it here
+        return future
+
+    def detect(self, sock: socket.socket, result: Dict,
+               close: Optional[Callable[[socket.socket], None]] = None) -> Dict:
+        """
+        Identify the service behind a connected socket, in this thread.
+
+        Args:
+            sock: Connected socket to the port, closed when the detection ends
+            result: Result of the port scan
+            close: Called to close the socket, sock.close when None
+
+        Returns:
+            Copy of the result with the detected service and, when found,
+            its version and the first bytes of its answer (banner)
+        """
+        result = dict(result)
+        try:
+            sock.setblocking(True)
+            port = result["port"]
+            answer = b""
+            probe = PROBES.get(port)
+            if probe is None: # Services that talk first (SSH, FTP, SMTP...)
+                answer = self._read(sock)
+                probe = DEFAULT_PROBE if not answer else None
+            if probe is not None:
+                sock.sendall(probe)
+                answer += self._read(sock)
+        except OSError as e:
+            self.logger.debug(f"Error detecting the service of port {result['port']}: {str(e)}") # Match what was read
+        finally:
+            (close or socket.socket.close)(sock)
+
+        if answer:
+            result["banner"] = printable(answer)
+            identified = self.matcher.match(answer)
+            if identified:
+                result.update(identified)
+        return result
+
+    def shutdown(self):
+        """Stop the thread pool, waiting for the detections running"""
+        if self._executor:
+            self._executor.shutdown(wait=True)
+            self._executor = None
+
+    def _read(self, sock: socket.socket) -> bytes:
+        """Read until the answer matches, the peer closes, max_banner bytes or the timeout"""
+        answer = b""
+        deadline = time.monotonic() + self.read_timeout
+        while len(answer) < self.max_banner:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            sock.settimeout(remaining)
+            try:
+                chunk = sock.recv(self.max_banner - len(answer))
+            except socket.timeout:
+                break
+            if not chunk:
+                break
+            answer += chunk
+            identified = self.matcher.match(answer)
+            if identified and ("version" in identified or b"\r\n\r\n" in answer): # Nothing more to learn
+                break
+            if identified and b"\n" in answer: # Give the rest of the answer a moment, not the whole timeout
+                deadline = min(deadline, time.monotonic() + 0.1)
+        return answer
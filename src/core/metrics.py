@@ -0,0 +1,328 @@
+import os
+import threading
+import time
+from bisect import bisect_left
+from collections import defaultdict
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+import logging # Import logging module, used to log messages in the console
+
+# Upper bounds of the connect latency buckets, in seconds
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# Parts of a probe timed separately
+PHASES = ("resolve", "connect", "service", "output")
+
+Hook = Callable[[str, Dict], None] # Called with the event name and its fields
+
+class Histogram:
+    """Cumulative histogram with fixed buckets, as exported by Prometheus"""
+
+    __slots__ = ("bounds", "counts", "sum", "count")
+
+    # Constructor
+    def __init__(self, bounds: Sequence[float] = DEFAULT_BUCKETS):
+        self.bounds = tuple(sorted(bounds)) # Upper bound of every bucket, +Inf is implicit
+        self.counts = [0] * (len(self.bounds) + 1) # Observations by bucket, not cumulative
+        self.sum = 0.0 # Sum of the observations
+        self.count = 0 # Number of observations
+
+    def observe(self, value: float):
+        """Add an observation"""
+        self.counts[bisect_left(self.bounds, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def cumulative(self) -> List[Tuple[float, int]]:
+        """(upper bound, observations up to it) for every bucket, ending with +Inf"""
+        total = 0
+        buckets = []
+        for bound, count in zip(self.bounds + (float("inf"),), self.counts):
+            total += count
+            buckets.append((bound, total))
+        return buckets
+
+    def quantile(self, fraction: float) -> float:
+        """Upper bound of the bucket holding the given quantile (0 when empty)"""
+        if not self.count:
+            return 0.0
+        rank = fraction * self.count
+        for bound, total in self.cumulative():
+            if total >= rank:
+                return bound
+        return float("inf")
+
+class ScanMetrics:
+    """
+    Counters, gauges and timers of a running scan.
+
+    The scanners feed it when they are given one:
+        - probes completed by state and reason (the errno name for local
+          errors), for TCP and UDP
+        - a histogram of TCP connect latency, one observation per attempt
+        - TCP probes in flight, now and at the peak
+        - time spent by phase: resolve, connect, service (name lookup)
+          and output, summed over every thread
+
+    Hooks registered with add_hook are called with every event, so other
+    exporters can be plugged in. Every method is thread safe.
+    """
+
+    # Constructor
+    def __init__(self, buckets: Sequence[float] = DEFAULT_BUCKETS):
+        self.connect_latency = Histogram(buckets) # Connect attempts, in seconds
+        self.outcomes: Dict[Tuple[str, str, str], int] = defaultdict(int) # (protocol, state, reason) -> probes
+        self.phase_seconds: Dict[str, float] = defaultdict(float) # Phase -> total time
+        self.phase_calls: Dict[str, int] = defaultdict(int) # Phase -> number of timed calls
+        self.in_flight = 0 # Probes running now
+        self.max_in_flight = 0 # Highest number of probes running at once
+        self.started: Optional[float] = None # When the scan started (time.time)
+        self.finished: Optional[float] = None # When the scan finished (time.time)
+        self._hooks: List[Hook] = []
+        self._lock = threading.Lock()
+        self.logger = logging.getLogger(__name__) # Logger object
+
+    def add_hook(self, hook: Hook):
+        """
+        Register a callback for the events of the scan.
+
+        Args:
+            hook: Called with the event name and a dictionary of fields:
+                - scan_started, scan_finished: no fields
+                - probe_started: host
+                - probe_finished: host, protocol, result, seconds (None for UDP)
+                - phase: phase, seconds
+        """
+        self._hooks.append(hook)
+
+    def scan_started(self):
+        """Mark the start of the scan, or of its next part"""
+        if self.started is None:
+            self.started = time.time()
+        self.finished = None
+        self._emit("scan_started", {})
+
+    def scan_finished(self):
+        """Mark the end of the scan"""
+        self.finished = time.time()
+        self._emit("scan_finished", {})
+
+    def probe_started(self, host: str):
+        """Count a probe as in flight"""
+        with self._lock:
+            self.in_flight += 1
+            self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        if self._hooks:
+            self._emit("probe_started", {"host": host})
+
+    def probe_finished(self, host: str, result: Dict, seconds: Optional[float] = None, protocol: str = "tcp"):
+        """
+        Count a completed probe.
+
+        Args:
+            host: Host of the probe
+            result: Result dictionary as returned by the scanner
+            seconds: Duration of the probe, when it was counted as in flight
+                with probe_started
+            protocol: "tcp" or "udp"
+        """
+        with self._lock:
+            if seconds is not None:
+                self.in_flight -= 1
+            self.outcomes[(protocol, result["state"], result.get("reason", ""))] += 1
+        if self._hooks:
+            self._emit("probe_finished", {"host": host, "protocol": protocol, "result": result, "seconds": seconds})
+
+    def observe_connect(self, seconds: float):
+        """Add a connect attempt to the latency histogram"""
+        with self._lock:
+            self.connect_latency.observe(seconds)
+
+    def add_phase(self, phase: str, seconds: float):
+        """
+        Add time spent in a phase.
+
+        Args:
+            phase: One of PHASES
+            seconds: Time spent
+        """
+        with self._lock:
+            self.phase_seconds[phase] += seconds
+            self.phase_calls[phase] += 1
+        if self._hooks:
+            self._emit("phase", {"phase": phase, "seconds": seconds})
+
+    def elapsed(self) -> float:
+        """Seconds since the scan started, up to its end once finished"""
+        if self.started is None:
+            return 0.0
+        return (self.finished or time.time()) - self.started
+
+    def snapshot(self) -> Dict:
+        """
+        Get a consistent copy of every metric.
+
+        Returns:
+            Dictionary with elapsed, in_flight, max_in_flight, probes (by
+            "protocol/state/reason"), phases (seconds and calls by phase) and
+            connect latency (count, sum, p50 and p99 bucket bounds)
+        """
+        with self._lock:
+            return {
+                "elapsed": self.elapsed(),
+                "in_flight": self.in_flight,
+                "max_in_flight": self.max_in_flight,
+                "probes": {"/".join(key): count for key, count in self.outcomes.items()},
+                "phases": {
+                    phase: {"seconds": self.phase_seconds[phase], "calls": self.phase_calls[phase]}
+                    for phase in self.phase_seconds
+                },
+                "connect_latency": {
+                    "count": self.connect_latency.count,
+                    "sum": self.connect_latency.sum,
+                    "p50": self.connect_latency.quantile(0.5),
+                    "p99": self.connect_latency.quantile(0.99),
+                },
+            }
+
+    def render_prometheus(self) -> str:
+        """Render every metric in the Prometheus text exposition format"""
+        with self._lock:
+            lines = [
+                "# HELP portscan_probes_total Probes completed, by protocol, state and reason.",
+                "# TYPE portscan_probes_total counter",
+            ]
+            for (protocol, state, reason), count in sorted(self.outcomes.items()):
+                lines.append(
+                    f'portscan_probes_total{{protocol="{protocol}",state="{_escape(state)}",reason="{_escape(reason)}"}} {count}'
+                )
+            lines += [
+                "# HELP portscan_connect_seconds Latency of TCP connect attempts.",
+                "# TYPE portscan_connect_seconds histogram",
+            ]
+            for bound, total in self.connect_latency.cumulative():
+                lines.append(f'portscan_connect_seconds_bucket{{le="{_format_bound(bound)}"}} {total}')
+            lines += [
+                f"portscan_connect_seconds_sum {self.connect_latency.sum}",
+                f"portscan_connect_seconds_count {self.connect_latency.count}",
+                "# HELP portscan_probes_in_flight TCP probes running now.",
+                "# TYPE portscan_probes_in_flight gauge",
+                f"portscan_probes_in_flight {self.in_flight}",
+                "# HELP portscan_probes_in_flight_max Highest number of TCP probes running at once.",
+                "# TYPE portscan_probes_in_flight_max gauge",
+                f"portscan_probes_in_flight_max {self.max_in_flight}",
+                "# HELP portscan_phase_seconds_total Time spent by phase, summed over every thread.",
+                "# TYPE portscan_phase_seconds_total counter",
+            ]
+            for phase, seconds in sorted(self.phase_seconds.items()):
+                lines.append(f'portscan_phase_seconds_total{{phase="{phase}"}} {seconds}')
+            lines += [
+                "# HELP portscan_phase_calls_total Timed calls by phase.",
+                "# TYPE portscan_phase_calls_total counter",
+            ]
+            for phase, calls in sorted(self.phase_calls.items()):
+                lines.append(f'portscan_phase_calls_total{{phase="{phase}"}} {calls}')
+            lines += [
+                "# HELP portscan_scan_elapsed_seconds Time since the scan started.",
+                "# TYPE portscan_scan_elapsed_seconds gauge",
+                f"portscan_scan_elapsed_seconds {self.elapsed()}",
+            ]
+        return "\n".join(lines) + "\n"
+
+    def _emit(self, event: str, fields: Dict):
+        for hook in self._hooks:
+            try:
+                hook(event, fields)
+            except Exception as e: # A broken hook must not stop the scan
+                self.logger.error(f"Error in metrics hook {hook!r}: {str(e)}")
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+def _format_bound(bound: float) -> str:
+    return "+Inf" if bound == float("inf") else repr(bound)
+
+class MetricsFile:
+    """
+    Write the metrics to a file in the Prometheus text format at a fixed
+    interval, for the textfile collector of node_exporter or to be read by
+    hand while a long scan runs. The file is replaced atomically, readers
+    never see a partial write.
+    """
+
+    # Constructor
+    def __init__(self, metrics: ScanMetrics, path: str, interval: float = 5):
+        self.metrics = metrics # Metrics to write
+        self.path = path # Destination file
+        self.interval = interval # Seconds between writes
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self) -> "MetricsFile":
+        """Start writing in a background thread"""
+        self._thread = threading.Thread(target=self._run, name="metrics-file", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        """Stop the background thread and write the final metrics"""
+        self._stop.set()
+        if self._thread:
+            self._thread.join()
+        self.write()
+
+    def write(self):
+        """Write the metrics now"""
+        temporary = f"{self.path}.tmp"
+        with open(temporary, "w") as metrics_file:
+            metrics_file.write(self.metrics.render_prometheus())
+        os.replace(temporary, self.path)
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self.write()
+
+class MetricsServer:
+    """Serve the metrics over HTTP at /metrics, for Prometheus to scrape"""
+
+    # Constructor
+    def __init__(self, metrics: ScanMetrics, port: int, address: str = "127.0.0.1"):
+        self.metrics = metrics # Metrics to serve
+        self.address = address # Address to listen on
+        self.port = port # Port to listen on, 0 picks a free one
+        self._server: Optional[ThreadingHTTPServer] = None
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self) -> "MetricsServer":
+        """Start serving in a background thread"""
+        metrics = self.metrics
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.split("?")[0] != "/metrics":
+                    self.send_error(404)
+                    return
+                body = metrics.render_prometheus().encode()
+                self.send_response(200)
+                self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args): # Keep scrapes out of the scan output
+                pass
+
+        self._server = ThreadingHTTPServer((self.address, self.port), Handler)
+        self._server.daemon_threads = True
+        self.port = self._server.server_address[1]
+        self._thread = threading.Thread(target=self._server.serve_forever, name="metrics-server", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        """Stop serving"""
+        if self._server:
+            self._server.shutdown()
+            self._server.server_close()
+        if self._thread:
+            self._thread.join()
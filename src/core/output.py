@@ -0,0 +1,29 @@
+import json
+import sys
+from typing import Dict, Optional, TextIO
+
+class NdjsonWriter:
+    """
+    Write scan results as newline delimited JSON, one object per line.
+
+    Every line is flushed as soon as it is written, so downstream tools can
+    consume the results while the scan is still running.
+    """
+
+    # Constructor
+    def __init__(self, stream: Optional[TextIO] = None, protocol: str = "tcp"):
+        self.stream = stream or sys.stdout # Where the lines are written
+        self.protocol = protocol # Protocol added to every record
+
+    def write(self, host: str, result: Dict):
+        """
+        Write a single result.
+
+        Args:
+            host: Host the result belongs to
+            result: Result dictionary as returned by the scanner
+        """
+        record = {"host": host, "protocol": self.protocol}
+        record.update(result)
+        self.stream.write(json.dumps(record, separators=(",", ":")) + "\n")
+        self.stream.flush()
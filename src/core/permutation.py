@@ -0,0 +1,124 @@
+import random
+from typing import Iterator, List, Optional
+
+# Bases that make Miller-Rabin exact below 3.3 * 10**24
+_WITNESSES = (2, 3, 5, 7, 11, 13, 17, 19, 23, 29, 31, 37)
+
+class CyclicPermutation:
+    """
+    Visit every index of range(size) once, in pseudo-random order, in
+    constant memory.
+
+    The walk goes through the multiplicative group of integers modulo the
+    first prime p above size: starting from a random element and
+    multiplying by a random generator of the group visits every element
+    from 1 to p - 1 exactly once. Element x stands for index x - 1, and
+    elements past the end are skipped (less than half of them, usually a
+    handful). The same seed gives the same order.
+    """
+
+    # Constructor
+    def __init__(self, size: int, seed: Optional[int] = None):
+        self.size = size # Number of indexes to visit
+        self.seed = seed if seed is not None else random.getrandbits(32) # Chooses the generator and the start
+        self.prime = next_prime(size) # Order of the group plus one
+        rng = random.Random(self.seed)
+        self.generator = primitive_root(self.prime, rng) # Multiplier of each step
+        self.start = rng.randrange(1, self.prime) # First element of the walk
+
+    @property
+    def steps(self) -> int:
+        """Length of the walk, skipped elements included"""
+        return self.prime - 1
+
+    def __len__(self) -> int:
+        return self.size
+
+    def __iter__(self) -> Iterator[int]:
+        return self.walk(0, self.steps)
+
+    def walk(self, first: int, last: int) -> Iterator[int]:
+        """
+        Indexes visited between two steps of the walk.
+
+        Any part of the walk starts right away (one modular power), so
+        disjoint step ranges split the permutation into independent shards.
+
+        Args:
+            first: First step, from 0
+            last: Step after the last one, up to steps
+
+        Returns:
+            Iterator of indexes
+        """
+        size, prime, generator = self.size, self.prime, self.generator
+        element = self.start * pow(generator, first, prime) % prime
+        for _ in range(max(0, min(last, self.steps) - first)):
+            if element <= size:
+                yield element - 1
+            element = element * generator % prime
+
+def is_prime(number: int) -> bool:
+    """Miller-Rabin primality test, exact for the sizes of a scan"""
+    if number < 2:
+        return False
+    for witness in _WITNESSES:
+        if number % witness == 0:
+            return number == witness
+    odd, twos = number - 1, 0
+    while odd % 2 == 0:
+        odd //= 2
+        twos += 1
+    for witness in _WITNESSES:
+        value = pow(witness, odd, number)
+        if value in (1, number - 1):
+            continue
+        for _ in range(twos - 1):
+            value = value * value % number
+            if value == number - 1:
+                break
+        else:
+            return False
+    return True
+
+def next_prime(number: int) -> int:
+    """Smallest prime greater than number"""
+    candidate = number + 1
+    while not is_prime(candidate):
+        candidate += 1
+    return candidate
+
+def prime_factors(number: int) -> List[int]:
+    """Distinct prime factors, by trial division"""
+    factors = []
+    divisor = 2
+    while divisor * divisor <= number:
+        if number % divisor == 0:
+            factors.append(divisor)
+            while number % divisor == 0:
+                number //= divisor
+        divisor += 1 if divisor == 2 else 2
+    if number > 1:
+        factors.append(number)
+    return factors
+
+def primitive_root(prime: int, rng: Optional[random.Random] = None) -> int:
+    """
+    Find a generator of the multiplicative group modulo a prime.
+
+    Args:
+        prime: Prime modulus
+        rng: Random source, candidates are tried in ascending order when None
+
+    Returns:
+        An element whose powers are every element from 1 to prime - 1
+    """
+    if prime == 2:
+        return 1
+    order = prime - 1
+    factors = prime_factors(order)
+    candidates = iter(lambda: rng.randrange(2, prime), None) if rng else iter(range(2, prime))
+    for candidate in candidates: # A good share of the elements are generators
+        if all(pow(candidate, order // factor, prime) != 1 for factor in factors):
+            return candidate
+    raise ValueError(f"{prime} is not prime")
@@ -0,0 +1,154 @@
+import bisect
+from typing import Iterable, Iterator, List, Optional, Sequence, Tuple
+from core.services import ServiceRegistry, get_service_registry
+
+MAX_PORT = 65535
+
+class PortSet(Sequence):
+    """
+    Sorted set of ports stored as disjoint ranges.
+
+    A full range costs the same memory as a single port. Membership tests
+    and access by index are binary searches over the ranges, so the set can
+    be walked in any order without expanding it into a list.
+    """
+
+    # Constructor
+    def __init__(self, ranges: Iterable[Tuple[int, int]] = ()):
+        self._starts: List[int] = [] # First port of each range
+        self._ends: List[int] = [] # Last port of each range, included
+        self._offsets: List[int] = [] # Index of the first port of each range
+        self._size = 0 # Total number of ports
+        for start, end in sorted(ranges):
+            if self._ends and start <= self._ends[-1] + 1: # Overlapping or adjacent, merge
+                if end > self._ends[-1]:
+                    self._size += end - self._ends[-1]
+                    self._ends[-1] = end
+                continue
+            self._starts.append(start)
+            self._ends.append(end)
+            self._offsets.append(self._size)
+            self._size += end - start + 1
+
+    @classmethod
+    def from_ports(cls, ports: Iterable[int]) -> "PortSet":
+        """Build a set from single ports"""
+        return cls((port, port) for port in ports)
+
+    def ranges(self) -> List[Tuple[int, int]]:
+        """(first, last) port of every range, in ascending order"""
+        return list(zip(self._starts, self._ends))
+
+    def difference(self, other: "PortSet") -> "PortSet":
+        """Ports of this set that are not in the other one"""
+        ranges = []
+        for start, end in self.ranges():
+            position = bisect.bisect_left(other._ends, start) # First range of other that may overlap
+            while position < len(other._starts) and other._starts[position] <= end:
+                if other._starts[position] > start:
+                    ranges.append((start, other._starts[position] - 1))
+                start = other._ends[position] + 1
+                position += 1
+            if start <= end:
+                ranges.append((start, end))
+        return PortSet(ranges)
+
+    def __len__(self) -> int:
+        return self._size
+
+    def __getitem__(self, index: int) -> int:
+        if index < 0:
+            index += self._size
+        if not 0 <= index < self._size:
+            raise IndexError("port index out of range")
+        position = bisect.bisect_right(self._offsets, index) - 1
+        return self._starts[position] + index - self._offsets[position]
+
+    def __contains__(self, port: object) -> bool:
+        if not isinstance(port, int):
+            return False
+        position = bisect.bisect_right(self._starts, port) - 1
+        return position >= 0 and port <= self._ends[position]
+
+    def __iter__(self) -> Iterator[int]:
+        for start, end in zip(self._starts, self._ends):
+            yield from range(start, end + 1)
+
+    def __eq__(self, other: object) -> bool:
+        if isinstance(other, PortSet):
+            return self.ranges() == other.ranges()
+        return NotImplemented
+
+    def __hash__(self) -> int:
+        return hash(tuple(self.ranges()))
+
+    def __str__(self) -> str:
+        return ",".join(str(start) if start == end else f"{start}-{end}" for start, end in self.ranges())
+
+    def __repr__(self) -> str:
+        return f"PortSet('{self}')"
+
+def parse_ports(spec: str, protocol: str = "tcp", services: Optional[ServiceRegistry] = None,
+                exclude: str = "") -> PortSet:
+    """
+    Parse a port specification.
+
+    The specification is a comma separated list of:
+        - single ports: 22
+        - ranges, in any order: 1-1024 or 1024-1
+        - the most frequently open ports of the protocol: top-100
+        - exclusions of any of the above, applied last: !25 or !135-139
+
+    The ! prefix triggers history expansion in interactive shells, so the
+    exclusions can also be given apart, without it.
+
+    Args:
+        spec: Port specification (Example: top-100,8000-8100,!25)
+        protocol: "tcp" or "udp", chooses the top ports
+        services: Registry with the top ports (the shared one when None)
+        exclude: More ports to leave out, with the same syntax (Example:
+            25,135-139)
+
+    Returns:
+        PortSet with the ports to scan
+
+    Raises:
+        ValueError: If an item is malformed, a port is out of 0-65535 or no
+            port is left
+    """
+    included = []
+    excluded = []
+    items = [(item, included) for item in spec.split(",")]
+    items += [(item, excluded) for item in exclude.split(",")]
+    for item, ranges in items:
+        item = item.strip()
+        if not item:
+            continue
+        if item.startswith("!"):
+            ranges = excluded
+            item = item[1:].strip()
+        ranges.extend(_parse_item(item, protocol, services))
+    if not included and excluded: # Only exclusions, from every port
+        included.append((0, MAX_PORT))
+    ports = PortSet(included).difference(PortSet(excluded))
+    if not ports:
+        raise ValueError(f"No ports in {spec!r}")
+    return ports
+
+def _parse_item(item: str, protocol: str, services: Optional[ServiceRegistry]) -> List[Tuple[int, int]]:
+    if item.lower().startswith("top-"):
+        count = _parse_port(item[4:])
+        if count < 1:
+            raise ValueError(f"Invalid port count: {item!r}")
+        top = (services or get_service_registry()).top_ports(protocol, count)
+        return [(port, port) for port in top]
+    start, separator, end = item.partition("-")
+    start = _parse_port(start)
+    end = _parse_port(end) if separator else start
+    return [(min(start, end), max(start, end))]
+
+def _parse_port(text: str) -> int:
+    text = text.strip()
+    if not text.isdigit() or int(text) > MAX_PORT: # Also rejects signs, "-1-100" has an empty first port
+        raise ValueError(f"Invalid port: {text!r}")
+    return int(text)
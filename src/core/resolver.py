@@ -0,0 +1,114 @@
+import socket
+import ipaddress
+import threading
+import time
+from typing import Dict, Iterable, NamedTuple, Optional, Set, Tuple
+
+class ResolvedTarget(NamedTuple):
+    """A target whose hostname has already been turned into an address"""
+    hostname: str # Name as given by the user
+    family: int # socket.AF_INET or socket.AF_INET6
+    address: str # Numeric address used by every probe
+
+class Resolver:
+    """
+    Resolve targets once per scan and cache the answers.
+
+    The cache is shared by every Resolver instance, so several scanners (or
+    several scans by the same scanner) only hit the system resolver once per
+    hostname and TTL. Failed lookups are cached as well, with a shorter TTL.
+    """
+
+    _shared_cache: Dict[str, Tuple[float, Optional[ResolvedTarget], tuple]] = {}
+    _shared_lock = threading.Lock()
+
+    # Constructor
+    def __init__(self, ttl: float = 300, negative_ttl: float = 30):
+        self.ttl = ttl # Seconds a successful answer is kept
+        self.negative_ttl = negative_ttl # Seconds a failed lookup is kept
+
+    def resolve(self, target: str) -> ResolvedTarget:
+        """
+        Resolve a hostname or IP literal.
+
+        Args:
+            target: IP or hostname to resolve
+
+        Returns:
+            ResolvedTarget with the address family and numeric address
+
+        Raises:
+            socket.gaierror: If the hostname cannot be resolved (also when
+                the failure comes from the negative cache)
+        """
+        if isinstance(target, ResolvedTarget):
+            return target
+
+        literal = self._parse_literal(target)
+        if literal is not None: # IP literals never need the resolver
+            return literal
+
+        now = time.monotonic()
+        with self._shared_lock:
+            entry = self._shared_cache.get(target)
+        if entry is not None and entry[0] > now:
+            expires, resolved, error = entry
+            if resolved is None:
+                raise socket.gaierror(*error)
+            return resolved
+
+        try:
+            resolved = self._lookup(target)
+        except socket.gaierror as e:
+            with self._shared_lock:
+                self._shared_cache[target] = (now + self.negative_ttl, None, e.args)
+            raise
+
+        with self._shared_lock:
+            self._shared_cache[target] = (now + self.ttl, resolved, ())
+        return resolved
+
+    def resolve_all(self, targets: Iterable[str]) -> Set[str]:
+        """
+        Resolve every hostname of a list of targets, warming the cache.
+
+        Args:
+            targets: Hosts to resolve, a TargetList only resolves its hostnames
+
+        Returns:
+            Set of names that could not be resolved
+        """
+        names = targets.hostnames if hasattr(targets, "hostnames") else targets
+        unresolved = set()
+        for name in names:
+            try:
+                self.resolve(name)
+            except socket.gaierror:
+                unresolved.add(name)
+        return unresolved
+
+    @classmethod
+    def clear_cache(cls):
+        """Forget every cached answer"""
+        with cls._shared_lock:
+            cls._shared_cache.clear()
+
+    @staticmethod
+    def _parse_literal(target: str) -> Optional[ResolvedTarget]:
+        try:
+            ip = ipaddress.ip_address(target)
+        except ValueError:
+            return None
+        family = socket.AF_INET6 if ip.version == 6 else socket.AF_INET
+        return ResolvedTarget(target, family, str(ip))
+
+    @staticmethod
+    def _lookup(target: str) -> ResolvedTarget:
+        try:
+            infos = socket.getaddrinfo(target, None, socket.AF_UNSPEC, socket.SOCK_STREAM)
+        except (UnicodeError, ValueError) as e: # Malformed name (empty label, label over 63 characters...), rejected by the idna codec
+            raise socket.gaierror(socket.EAI_NONAME, f"Invalid hostname: {str(e)}") from e
+        # Prefer IPv4, which is what the scanner has always used
+        infos.sort(key=lambda info: info[0] != socket.AF_INET)
+        family, _, _, _, sockaddr = infos[0]
+        return ResolvedTarget(target, family, sockaddr[0])
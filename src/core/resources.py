@@ -0,0 +1,268 @@
+import os
+import socket
+import struct
+import threading
+from typing import Dict, Optional, Sequence, Set, Tuple
+import logging # Import logging module, used to log messages in the console
+
+try:
+    import resource
+except ImportError: # Windows, no file descriptor limit to read
+    resource = None
+
+PORT_RANGE_PATH = "/proc/sys/net/ipv4/ip_local_port_range"
+TCP_TABLE_PATHS = ("/proc/net/tcp", "/proc/net/tcp6")
+
+# Probes in flight left to a scan whatever the limits say, unless it asked for fewer
+MIN_IN_FLIGHT = 16
+
+# Linux default range, used when it cannot be read
+DEFAULT_PORT_RANGE = (32768, 60999)
+
+# SO_LINGER with a zero timeout: close() sends a RST and frees the port at once
+_LINGER_RESET = struct.pack("ii", 1, 0)
+
+_TCP_TIME_WAIT = "06" # State of a socket in TIME_WAIT, in /proc/net/tcp
+
+class ResourceGovernor:
+    """
+    Keep a scan within the sockets the system can give it.
+
+    Every TCP probe holds a file descriptor and an ephemeral port while it
+    connects, and a connection closed normally keeps its port in TIME_WAIT
+    for a minute after that. Past the RLIMIT_NOFILE soft limit or the
+    ephemeral port range, probes fail with EMFILE or EADDRNOTAVAIL and are
+    reported as errors.
+
+    The governor reads both limits when it is created, and the sockets in
+    TIME_WAIT the first time it caps a scan, then keeps them for the scans
+    that follow. It raises the soft file limit when the hard one allows it,
+    and caps the probes in flight of a scan to what fits, warning once. With abortive_close, connected sockets are
+    closed with a RST (SO_LINGER 0) instead of a FIN, so they never enter
+    TIME_WAIT and long sweeps do not run out of ports.
+
+    Processes scanning together (sharded scans) share the ephemeral ports
+    of the system: the parent splits its limits with share and hands each
+    process the governor settings of its part.
+
+    The scanners open and close their sockets through it, which keeps
+    count of them. Every method is thread safe.
+    """
+
+    # Constructor
+    def __init__(self, abortive_close: bool = False, reserved_fds: int = 64,
+                 port_range_path: str = PORT_RANGE_PATH, tcp_table_paths: Sequence[str] = TCP_TABLE_PATHS,
+                 free_ports: Optional[int] = None, max_fds: Optional[int] = None):
+        self.abortive_close = abortive_close # Close connected sockets with a RST, no TIME_WAIT
+        self.reserved_fds = reserved_fds # File descriptors left for logs, the state database, DNS...
+        self.tcp_table_paths = tcp_table_paths # Kernel TCP socket tables, for the sockets in TIME_WAIT
+        self.fd_limits = open_file_limits() # (soft, hard) RLIMIT_NOFILE, None when there is no limit to read
+        self.port_range = ephemeral_port_range(port_range_path) # (first, last) local port given to connect
+        self.free_ports = free_ports # Ephemeral ports not held in TIME_WAIT, read by the first cap when None
+        self.max_fds = max_fds # Share of the open files limit given by a parent process, None for the whole limit
+        self.opened = 0 # Sockets created
+        self.closed = 0 # Sockets closed, both ways
+        self.reset = 0 # Connected sockets closed with a RST
+        self.failed = 0 # Sockets that could not be created (EMFILE...)
+        self.in_use = 0 # Sockets open now
+        self.max_in_use = 0 # Highest number of sockets open at once
+        self._warned: Set[str] = set() # Warnings already logged
+        self._lock = threading.Lock()
+        self.logger = logging.getLogger(__name__) # Logger object
+
+    def max_in_flight(self, requested: int, extra_fds: int = 0) -> int:
+        """
+        Cap the probes in flight of a scan to the sockets available.
+
+        The soft file limit is raised up to the hard one when the scan
+        needs more descriptors than it allows, and max_fds caps them first
+        when it is set. Half of the free ephemeral
+        ports are left for the connections waiting in TIME_WAIT. Only the
+        sockets in TIME_WAIT on an ephemeral port are counted, the ones of
+        local servers (:80, :443...) do not hold a port a probe could use.
+
+        Args:
+            requested: Probes in flight asked for (threads, concurrency)
+            extra_fds: Descriptors held besides the probes, such as the
+                sockets waiting for service detection
+
+        Returns:
+            Number of probes in flight to use, at least MIN_IN_FLIGHT (or
+            requested when it is lower)
+        """
+        floor = min(requested, MIN_IN_FLIGHT)
+        allowed = requested
+        if self.max_fds is not None and self.max_fds - extra_fds - self.reserved_fds < allowed:
+            allowed = self.max_fds - extra_fds - self.reserved_fds
+            self._warn_once(f"Open files share is {self.max_fds}, probes in flight capped to {max(floor, allowed)}")
+        if self.fd_limits is not None and self.fd_limits[0] != resource.RLIM_INFINITY:
+            open_fds = count_open_fds()
+            needed = max(floor, allowed) + extra_fds + open_fds + self.reserved_fds
+            soft, hard = self.fd_limits
+            if needed > soft:
+                soft = self._raise_fd_limit(needed)
+            if soft - extra_fds - open_fds - self.reserved_fds < allowed:
+                allowed = soft - extra_fds - open_fds - self.reserved_fds
+                self._warn_once(
+                    f"Open files limit is {soft}, probes in flight capped to {max(floor, allowed)} "
+                    f"(raise it with ulimit -n)"
+                )
+        free_ports = self._free_ports()
+        if free_ports // 2 < allowed:
+            allowed = free_ports // 2
+            self._warn_once(f"{free_ports} ephemeral ports free, probes in flight capped to {max(floor, allowed)}")
+        return max(floor, allowed)
+
+    def share(self, processes: int) -> Dict[str, Optional[int]]:
+        """
+        Split the socket limits between processes scanning together.
+
+        Each process gets its part of the free ephemeral ports, which the
+        whole system shares, and of the open files limit (the hard one,
+        which every process can raise its soft limit to).
+
+        Args:
+            processes: Number of scanning processes
+
+        Returns:
+            Keyword arguments of the ResourceGovernor of each process:
+            free_ports and max_fds (None when there is no file limit)
+        """
+        processes = max(1, processes)
+        max_fds = None
+        if self.fd_limits is not None:
+            limit = self.fd_limits[0] if self.fd_limits[1] == resource.RLIM_INFINITY else self.fd_limits[1]
+            if limit != resource.RLIM_INFINITY:
+                max_fds = limit // processes
+        return {"free_ports": self._free_ports() // processes, "max_fds": max_fds}
+
+    def open(self, family: int, kind: int = socket.SOCK_STREAM) -> socket.socket:
+        """
+        Create a socket and count it.
+
+        Raises:
+            OSError: If the socket cannot be created, EMFILE when out of
+                file descriptors
+        """
+        try:
+            sock = socket.socket(family, kind)
+        except OSError:
+            with self._lock:
+                self.failed += 1
+            raise
+        with self._lock:
+            self.opened += 1
+            self.in_use += 1
+            self.max_in_use = max(self.max_in_use, self.in_use)
+        return sock
+
+    def close(self, sock: socket.socket, connected: bool = False):
+        """
+        Close a socket created by open.
+
+        Args:
+            sock: Socket to close
+            connected: Whether the connection was established, it is
+                reset instead of shut down in abortive_close mode
+        """
+        reset = False
+        if connected and self.abortive_close:
+            try:
+                sock.setsockopt(socket.SOL_SOCKET, socket.SO_LINGER, _LINGER_RESET)
+                reset = True
+            except OSError: # Already reset by the peer, a plain close does
+                pass
+        sock.close()
+        with self._lock:
+            self.closed += 1
+            self.in_use -= 1
+            self.reset += reset
+
+    def counts(self) -> Dict[str, int]:
+        """Socket lifecycle counters: opened, closed, reset, failed, in_use and max_in_use"""
+        with self._lock:
+            return {
+                "opened": self.opened,
+                "closed": self.closed,
+                "reset": self.reset,
+                "failed": self.failed,
+                "in_use": self.in_use,
+                "max_in_use": self.max_in_use,
+            }
+
+    def _free_ports(self) -> int:
+        if self.free_ports is None:
+            self.free_ports = self.port_range[1] - self.port_range[0] + 1 - time_wait_sockets(self.port_range, self.tcp_table_paths)
+        return self.free_ports
+
+    def _warn_once(self, message: str):
+        with self._lock:
+            if message in self._warned:
+                return
+            self._warned.add(message)
+        self.logger.warning(message)
+
+    def _raise_fd_limit(self, needed: int) -> int:
+        soft, hard = self.fd_limits
+        wanted = needed if hard == resource.RLIM_INFINITY else min(needed, hard)
+        if wanted <= soft:
+            return soft
+        try:
+            resource.setrlimit(resource.RLIMIT_NOFILE, (wanted, hard))
+        except (ValueError, OSError) as e: # Some systems cap it below the hard limit
+            self.logger.debug(f"Cannot raise the open files limit to {wanted}: {str(e)}")
+            return soft
+        self.logger.debug(f"Open files limit raised from {soft} to {wanted}")
+        self.fd_limits = (wanted, hard)
+        return wanted
+
+def open_file_limits() -> Optional[Tuple[int, int]]:
+    """(soft, hard) RLIMIT_NOFILE of the process, None where it does not exist"""
+    if resource is None:
+        return None
+    return resource.getrlimit(resource.RLIMIT_NOFILE)
+
+def ephemeral_port_range(path: str = PORT_RANGE_PATH) -> Tuple[int, int]:
+    """(first, last) local port the kernel gives to outgoing connections"""
+    try:
+        with open(path) as range_file:
+            first, last = map(int, range_file.read().split())
+        return first, last
+    except (OSError, ValueError):
+        return DEFAULT_PORT_RANGE
+
+def count_open_fds() -> int:
+    """File descriptors open in this process, 0 when they cannot be listed"""
+    for directory in ("/proc/self/fd", "/dev/fd"):
+        try:
+            return len(os.listdir(directory))
+        except OSError:
+            continue
+    return 0
+
+def time_wait_sockets(port_range: Tuple[int, int], paths: Sequence[str] = TCP_TABLE_PATHS) -> int:
+    """
+    Count the TCP sockets of the system in TIME_WAIT on a local port of a range.
+
+    Args:
+        port_range: (first, last) local port, the ephemeral port range
+        paths: Kernel TCP socket tables, IPv4 and IPv6
+
+    Returns:
+        Number of sockets, 0 when the tables cannot be read
+    """
+    first, last = port_range
+    count = 0
+    for path in paths:
+        try:
+            with open(path) as table:
+                next(table, None) # Header
+                for line in table:
+                    fields = line.split()
+                    # sl local_address rem_address st..., addresses are hex ADDRESS:PORT
+                    if len(fields) > 3 and fields[3] == _TCP_TIME_WAIT:
+                        if first <= int(fields[1].rpartition(":")[2], 16) <= last:
+                            count += 1
+        except (OSError, ValueError):
+            continue
+    return count
@@ -0,0 +1,272 @@
+from typing import Dict, Iterable, Iterator, List, Mapping, Optional, Sequence, Tuple
+
+# Port states, the index is the code stored in the packed arrays
+STATES = ("", "open", "closed", "filtered", "open|filtered", "error") # "" means not scanned
+_CODES = {state: code for code, state in enumerate(STATES)}
+
+_BLOCK = 512 # Ports allocated at a time, keeps reallocations rare without wasting memory
+
+class _HostPorts:
+    """Port states of one host, packed two ports per byte"""
+
+    __slots__ = ("base", "data", "counts", "details")
+
+    def __init__(self):
+        self.base = 0 # First port covered by data
+        self.data = bytearray() # 4 bits per port, starting at base
+        self.counts = [0] * len(STATES) # Ports by state code
+        self.details: Dict[int, Dict] = {} # Port -> extra fields (service, reason...) of open and error ports
+
+    def get(self, port: int) -> int:
+        offset = port - self.base
+        if not 0 <= offset < 2 * len(self.data):
+            return 0
+        return (self.data[offset >> 1] >> ((offset & 1) << 2)) & 0x0F
+
+    def set(self, port: int, code: int):
+        self._cover(port)
+        offset = port - self.base
+        shift = (offset & 1) << 2
+        byte = self.data[offset >> 1]
+        self.counts[(byte >> shift) & 0x0F] -= 1
+        self.counts[code] += 1
+        self.data[offset >> 1] = (byte & (0xF0 >> shift)) | (code << shift)
+
+    def ports(self) -> Iterator[Tuple[int, int]]:
+        """Scanned ports and their state codes, in ascending order"""
+        base = self.base
+        for index, byte in enumerate(self.data):
+            if byte:
+                if byte & 0x0F:
+                    yield base + 2 * index, byte & 0x0F
+                if byte >> 4:
+                    yield base + 2 * index + 1, byte >> 4
+
+    def _cover(self, port: int):
+        if not self.data:
+            self.base = port - port % _BLOCK
+            self.data = bytearray(_BLOCK // 2)
+            self.counts[0] += _BLOCK
+            return
+        end = self.base + 2 * len(self.data)
+        if port >= end: # Grow at the end, the usual case for ordered scans
+            new_end = port - port % _BLOCK + _BLOCK
+            self.data.extend(bytes((new_end - end) // 2))
+            self.counts[0] += new_end - end
+        elif port < self.base:
+            new_base = port - port % _BLOCK
+            self.data[0:0] = bytes((self.base - new_base) // 2)
+            self.counts[0] += self.base - new_base
+            self.base = new_base
+
+class ResultView(Sequence):
+    """
+    Read-only list of result dictionaries of one host, sorted by port.
+
+    The dictionaries are built on access, so the view costs nothing until
+    it is used. It is what the scanner used to return for a host.
+    """
+
+    def __init__(self, host_ports: _HostPorts):
+        self._host_ports = host_ports
+        self._index: Optional[List[int]] = None # Scanned ports, built on the first indexed access
+
+    def __len__(self) -> int:
+        return sum(self._host_ports.counts[1:])
+
+    def __iter__(self) -> Iterator[Dict]:
+        for port, code in self._host_ports.ports():
+            yield self._build(port, code)
+
+    def __getitem__(self, index):
+        if self._index is None:
+            self._index = [port for port, _ in self._host_ports.ports()]
+        if isinstance(index, slice):
+            return [self._build(port, self._host_ports.get(port)) for port in self._index[index]]
+        port = self._index[index]
+        return self._build(port, self._host_ports.get(port))
+
+    def __eq__(self, other) -> bool:
+        return list(self) == list(other)
+
+    def _build(self, port: int, code: int) -> Dict:
+        result = {"port": port, "state": STATES[code], "service": ""}
+        result.update(self._host_ports.details.get(port, ()))
+        return result
+
+class ScanResultSet(Mapping):
+    """
+    Compact store of the results of a scan.
+
+    Port states are kept per host in packed arrays (4 bits per port), and
+    only open and error ports keep their details (service, reason...) in a
+    sparse side table. A full range scan of a host takes 32 KB instead of
+    tens of MB of dictionaries.
+
+    It is a mapping of host to the usual list of result dictionaries, given
+    as a lazy ResultView, so it can stand in for the dictionary returned by
+    scan_targets.
+    """
+
+    # Constructor
+    def __init__(self, protocol: str = "tcp"):
+        self.protocol = protocol # Protocol of the scan
+        self._hosts: Dict[str, _HostPorts] = {} # Host -> port states, in insertion order
+
+    def add(self, host: str, result: Dict):
+        """
+        Store the result of a probe.
+
+        Args:
+            host: Host the result belongs to
+            result: Result dictionary as returned by the scanner
+        """
+        host_ports = self._hosts.get(host)
+        if host_ports is None:
+            host_ports = self._hosts[host] = _HostPorts()
+        port = result["port"]
+        state = result["state"]
+        host_ports.set(port, _CODES[state])
+        if state in ("open", "error"):
+            host_ports.details[port] = {key: value for key, value in result.items() if key not in ("port", "state")}
+        else:
+            host_ports.details.pop(port, None)
+
+    def update(self, results: Iterable[Tuple[str, Dict]]) -> "ScanResultSet":
+        """
+        Store (host, result) tuples, such as the ones yielded by iter_targets.
+
+        Returns:
+            The result set itself
+        """
+        for host, result in results:
+            self.add(host, result)
+        return self
+
+    @property
+    def hosts(self) -> List[str]:
+        """Hosts with at least one result, in the order they were first seen"""
+        return list(self._hosts)
+
+    def __len__(self) -> int:
+        return len(self._hosts)
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self._hosts)
+
+    def __getitem__(self, host: str) -> ResultView:
+        return ResultView(self._hosts[host])
+
+    def state(self, host: str, port: int) -> str:
+        """
+        Get the state of a port.
+
+        Returns:
+            The state, or "" when the port was not scanned
+        """
+        host_ports = self._hosts.get(host)
+        return STATES[host_ports.get(port)] if host_ports else ""
+
+    def details(self, host: str, port: int) -> Dict:
+        """Extra fields (service, reason...) stored for an open or error port"""
+        host_ports = self._hosts.get(host)
+        return dict(host_ports.details.get(port, ())) if host_ports else {}
+
+    def ports(self, host: str, state: str = "open") -> List[int]:
+        """
+        Get the ports of a host in a given state.
+
+        Args:
+            host: Host to query
+            state: One of STATES
+
+        Returns:
+            Sorted list of ports
+        """
+        host_ports = self._hosts.get(host)
+        if host_ports is None:
+            return []
+        code = _CODES[state]
+        if code == _CODES["open"]:
+            return sorted(port for port in host_ports.details if host_ports.get(port) == code)
+        return [port for port, port_code in host_ports.ports() if port_code == code]
+
+    def open_ports(self, host: str) -> List[int]:
+        """Sorted list of the open ports of a host"""
+        return self.ports(host, "open")
+
+    def counts(self, host: Optional[str] = None) -> Dict[str, int]:
+        """
+        Count scanned ports by state.
+
+        Args:
+            host: Host to count, all hosts together when None
+
+        Returns:
+            Dictionary by state, only states with at least one port
+        """
+        hosts = [self._hosts[host]] if host is not None else self._hosts.values()
+        counts = [0] * len(STATES)
+        for host_ports in hosts:
+            for code, count in enumerate(host_ports.counts):
+                counts[code] += count
+        return {STATES[code]: count for code, count in enumerate(counts) if code and count}
+
+    def diff(self, previous: "ScanResultSet") -> Dict[str, List[Tuple[str, int]]]:
+        """
+        Compare open ports with a previous scan.
+
+        Only ports scanned by this result set can be reported as closed, so a
+        partial re-scan does not report the ports it skipped.
+
+        Args:
+            previous: Result set of the earlier scan
+
+        Returns:
+            Dictionary with "opened" (open now, not before) and "closed"
+            (open before, scanned now and not open) lists of (host, port)
+        """
+        opened = []
+        closed = []
+        for host, host_ports in self._hosts.items():
+            before = previous._hosts.get(host)
+            for port in sorted(host_ports.details):
+                if host_ports.get(port) == _CODES["open"] and (before is None or before.get(port) != _CODES["open"]):
+                    opened.append((host, port))
+        for host, before in previous._hosts.items():
+            now = self._hosts.get(host)
+            if now is None:
+                continue
+            for port in sorted(before.details):
+                if before.get(port) == _CODES["open"] and now.get(port) not in (0, _CODES["open"]):
+                    closed.append((host, port))
+        return {"opened": opened, "closed": closed}
+
+    def export_host(self, host: str) -> Tuple[int, bytes, Dict[int, Dict]]:
+        """
+        Get the packed states of a host, to be stored and restored with
+        import_host.
+
+        Returns:
+            Tuple (first port, packed states, details by port)
+        """
+        host_ports = self._hosts[host]
+        return host_ports.base, bytes(host_ports.data), dict(host_ports.details)
+
+    def import_host(self, host: str, base: int, states: bytes, details: Dict[int, Dict]):
+        """
+        Restore the states of a host returned by export_host, replacing the
+        ones already stored.
+        """
+        host_ports = self._hosts[host] = _HostPorts()
+        host_ports.base = base
+        host_ports.data = bytearray(states)
+        host_ports.details = dict(details)
+        host_ports.counts[0] = 2 * len(states)
+        for _, code in host_ports.ports():
+            host_ports.counts[0] -= 1
+            host_ports.counts[code] += 1
+
+    def to_dict(self) -> Dict[str, List[Dict]]:
+        """Materialize every result, as returned by scan_targets"""
+        return {host: list(view) for host, view in self.items()}
@@ -1,133 +1,132 @@
 import socket
-import concurrent.futures
-from concurrent.futures import ThreadPoolExecutor
-from typing import List, Dict, Union
-import logging # Import logging module, used to log messages in the console
+import time
+from concurrent.futures import Future
+from typing import List, Dict, Union, Optional, Iterable, Iterator, Tuple
+from core.resolver import Resolver, ResolvedTarget
+from core.services import ServiceRegistry
+from core.scheduler import ProbeScheduler
+from core.timing import AdaptiveTiming
+from core.congestion import CongestionController
+from core.udp import UdpScanner
+from core.metrics import ScanMetrics
+from core.fingerprint import ServiceDetector
+from core.resources import ResourceGovernor
+from core.engine import ScanEngine
 
-class PortScanner:
+class PortScanner(ScanEngine):
     
     # Constructor
-    def __init__(self, timeout: float = 1, max_threads: int = 100):
-        self.timeout = timeout # Timeout for socket connection
-        self.max_threads = max_threads # Maximum number of threads
-        self.logger = logging.getLogger(__name__) # Logger object
+    def __init__(self, timeout: float = 1, max_threads: int = 100, resolver: Optional[Resolver] = None,
+                 max_per_host: Optional[int] = None, services: Optional[ServiceRegistry] = None,
+                 timing: Optional[AdaptiveTiming] = None, adaptive_concurrency: bool = False,
+                 udp_rate: Optional[float] = 100, metrics: Optional[ScanMetrics] = None,
+                 detector: Optional[ServiceDetector] = None, governor: Optional[ResourceGovernor] = None):
+        super().__init__(
+            timeout=timeout, resolver=resolver, max_per_host=max_per_host, services=services, timing=timing,
+            adaptive_concurrency=adaptive_concurrency, metrics=metrics, detector=detector, governor=governor,
+        )
+        self.max_threads = max_threads # Maximum number of threads, probes in flight (up to it with adaptive_concurrency)
+        self.udp_rate = udp_rate # UDP datagrams per second to a single host, hosts throttle their ICMP errors (None: no limit)
     
-    def scan_tcp_port(self, target: str, port: int) -> Dict[str, Union[int, str, bool]]:
+    def scan_tcp_port(self, target: Union[str, ResolvedTarget], port: int) -> Dict[str, Union[int, str, bool]]:
         """
         Scan an specific port in the given target using TCP protocol.
         
         Args:
-            target: IP or hostname to scan
+            target: IP or hostname to scan, or a target already resolved
+                by self.resolver (which skips the lookup)
             port: Number of port to scan
             
         Returns:
             Dictionary with the following keys:
                 - port: Port number
-                - state: State of the port (open/closed)
+                - state: State of the port (open/closed/filtered/error)
                 - service: Service running in the port
-                - error: Error message (if any)
+                - reason: What the state is based on (syn-ack, conn-refused,
+                  no-response, or the errno name such as EMFILE)
+              With a detector, open ports also get the version and banner
+              found by the detector, and service is the detected one.
         """
+        result = self._probe_tcp_port(target, port)
+        return result.result() if isinstance(result, Future) else result
+
+    def _probe_tcp_port(self, target: Union[str, ResolvedTarget], port: int) -> Union[Dict, Future]:
+        """Scan a port, open ports go on to the detector and give a Future of the result"""
+        started = self._probe_started(target)
+        result, sock = self._scan_tcp_port(target, port)
+        return self._probe_finished(target, result, sock, started)
+
+    def _scan_tcp_port(self, target: Union[str, ResolvedTarget], port: int) -> Tuple[Dict, Optional[socket.socket]]:
+        """Scan a port, return the result and, for an open port with a detector, the connected socket"""
+        sock = None
         try:
-            with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as sock: # Create a socket object using IPv4 (AF_INET) and TCP (SOCK_STREAM)	
-                sock.settimeout(self.timeout) # Set the timeout for the socket before leave the connection
-                result = sock.connect_ex((target, port)) # Connect to the target and port, return 0 if the connection is successful
-                is_open = result == 0 # Check if the connection is successful
-                
-                service = ""
-                if is_open: # If the connection is successful, get the service name
-                    try:
-                        service = socket.getservbyport(port) # Get the service name by port
-                    except:
-                        service = "unknown"
-                return { # Return the dictionary with the port, state, and service if the connection is successful
-                    "port": port,
-                    "state": "open" if is_open else "closed",
-                    "service": service if is_open else "",
-                }
-                
-        except socket.gaierror: # Handle the error of resolution of the hostname
-            self.logger.error(f"Error of resolution of the hostname: {target}") # Log the error
-            return {"port": port, "state": "error", "service": ""}
-        except Exception as e: # Handle the generic error
-            self.logger.error(f"Error scanning the port {port}: {str(e)}") # Log the error
-            return {"port": port, "state": "error", "service": ""}
+            resolved, timeout, attempts = self._tcp_start(target)
+            for _ in range(attempts):
+                result, rtt, sock = self._connect(resolved, port, timeout)
+                timeout = self._tcp_retry(result, rtt, timeout)
+                if timeout is None:
+                    break
+            return self._tcp_result(resolved, port, result, rtt), sock
+        except Exception as e: # Resolution, socket or generic error
+            return self._tcp_error(target, port, e, sock), None
 
-    def scan_udp_ports(self, target: str, ports: List[int]) -> List[Dict]:
+    def _connect(self, resolved: ResolvedTarget, port: int, timeout: float) -> Tuple[int, float, Optional[socket.socket]]:
+        """
+        Try a TCP connection, return the connect_ex result, the time it took
+        and, when it succeeded and there is a detector, the connected socket
+        for the caller to close.
+        """
+        sock = self.governor.open(resolved.family) # Create a socket object using the target family and TCP (SOCK_STREAM)
+        result = None
+        try:
+            sock.settimeout(timeout) # Set the timeout for the socket before leave the connection
+            started = time.perf_counter()
+            result = sock.connect_ex((resolved.address, port)) # Connect to the target and port, return 0 if the connection is successful
+            rtt = time.perf_counter() - started
+        finally:
+            if result != 0 or self.detector is None:
+                self.governor.close(sock, connected=result == 0) # Counted, and reset in abortive close mode
+        return result, rtt, sock if result == 0 and self.detector else None
+
+    def scan_udp_ports(self, target: Union[str, ResolvedTarget], ports: List[int]) -> List[Dict]:
         """
         Scan a specific port in the given target using UDP protocol.
         
         Args:
-            target: IP or hostname to scan
+            target: IP or hostname to scan, or an already resolved target
             ports: List of ports to scan
         
         Returns:
-            List of results by port
+            List of results by port, with the states described in UdpScanner
         """
-        results = []
-        
-        for port in ports:
-            try:
-                with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as sock:
-                    sock.settimeout(self.timeout)
-                    result = sock.connect_ex((target, port))
-                    is_open = result == 0
-                    
-                    service = ""
-                    if is_open:
-                        try:
-                            service = socket.getservbyport(port)
-                        except:
-                            service = "unknown"
-                    results.append({
-                        "port": port,
-                        "state": "open" if is_open else "closed",
-                        "service": service if is_open else "",
-                    })
-            except socket.gaierror:
-                self.logger.error(f"Error resolving hostname: {target}")
-                results.append({"port": port, "state": "error", "service": ""})
-            except Exception as e:
-                self.logger.error(f"Error scanning port {port}: {str(e)}")
-                results.append({"port": port, "state": "error", "service": ""})
-                
-        return results       
+        return self.udp_scanner().scan(target, ports)
 
-    def scan_port_range(self, target: str, start_port: int, end_port: int, protocol: str) -> List[Dict]:
-        """
-        Scan a range of ports using multithreading.
-        
-        Args:
-            target: IP or hostname target IP o hostname objetivo
-            start_port: Start port
-            end_port: End Port
-            
-        Returns:
-            List of results by port
-        """
-        ports = range(start_port, end_port + 1)
-        results = []
+    def udp_scanner(self) -> UdpScanner:
+        """UDP engine configured like this scanner"""
+        return UdpScanner(
+            timeout=self.timeout,
+            max_sockets=self.max_threads,
+            rate=self.udp_rate,
+            resolver=self.resolver,
+            services=self.services,
+        )
+
+    def _run_probes(self, probes: Iterable[Tuple[str, int]], protocol: str) -> Iterator[Tuple[str, Dict]]:
+        """Run TCP probes on a thread pool, UDP ones on the UdpScanner, and yield their results"""
+        if protocol == "udp":
+            yield from self.udp_scanner().iter_probes(probes)
+            return
         
-        protocol = protocol
-        if protocol == "tcp":
-            with ThreadPoolExecutor(max_workers=self.max_threads) as executor:
-                future_to_port = {
-                    executor.submit(self.scan_tcp_port, target, port): port for port in ports
-                }
-                
-                for future in concurrent.futures.as_completed(future_to_port):
-                    result = future.result()
-                    results.append(result)
-                    
-                    # Log in real time open ports
-                    if result["state"] == "open":
-                        self.logger.info(
-                            f"Port {result['port']} open - "
-                            f"Service: {result['service']}"
-                        )
-                        
-                return sorted(results, key=lambda x: x["port"])
-        elif protocol == "udp":
-            return self.scan_udp_ports(target, ports)
-        else:
-            self.logger.error(f"Invalid protocol: {protocol}")
-            return []
\ No newline at end of file
+        # Every probe holds a socket, and so does every open port waiting for detection
+        max_deferred = 4 * self.detector.max_workers if self.detector else None
+        max_in_flight = self.governor.max_in_flight(self.max_threads, extra_fds=max_deferred or 0)
+        if self.adaptive_concurrency:
+            self.controller = CongestionController(maximum=max_in_flight)
+        scheduler = ProbeScheduler(
+            self._probe_tcp_port if self.detector else self.scan_tcp_port, # Detections complete on their own pool
+            max_in_flight=max_in_flight,
+            max_per_host=self.max_per_host,
+            controller=self.controller if self.adaptive_concurrency else None,
+            max_deferred=max_deferred,
+        )
+        yield from scheduler.run(probes)
@@ -0,0 +1,179 @@
+import concurrent.futures
+from concurrent.futures import ThreadPoolExecutor
+from collections import defaultdict, deque
+from typing import Any, Callable, Dict, Iterable, Iterator, Optional, Sequence, Tuple
+import logging # Import logging module, used to log messages in the console
+from core.congestion import CongestionController
+from core.permutation import CyclicPermutation
+
+def interleave(targets: Sequence[Any], ports: Iterable[int]) -> Iterator[Tuple[Any, int]]:
+    """
+    Generate (host, port) probes one port at a time across every host.
+
+    Consecutive probes hit different hosts, so no host gets a burst of
+    connections and a slow host only delays its own probes.
+
+    Args:
+        targets: Hosts to scan (iterated once per port)
+        ports: Ports to scan
+
+    Returns:
+        Iterator of (host, port) tuples
+    """
+    for port in ports:
+        for host in targets:
+            yield host, port
+
+def shuffle(targets: Sequence[Any], ports: Sequence[int], seed: Optional[int] = None) -> Iterator[Tuple[Any, int]]:
+    """
+    Generate every (host, port) probe in pseudo-random order.
+
+    Probes are numbered like interleave numbers them and the numbers are
+    walked with a CyclicPermutation, so no host or port range gets a
+    sequential burst and the cross product is never built: the first probe
+    comes out right away and memory does not grow with the scan.
+
+    Args:
+        targets: Hosts to scan, indexable (a TargetList)
+        ports: Ports to scan, indexable (a PortSet or a range)
+        seed: Same seed, same order (random when None)
+
+    Returns:
+        Iterator of (host, port) tuples
+    """
+    hosts = len(targets)
+    for index in CyclicPermutation(hosts * len(ports), seed):
+        port, host = divmod(index, hosts)
+        yield targets[host], ports[port]
+
+class ProbeScheduler:
+    """
+    Run (host, port) probes on a thread pool with a global in-flight cap and
+    a per-host cap.
+
+    Probes for a host that already has max_per_host probes in flight are
+    parked until one of them completes, while probes for other hosts keep
+    going. Probes are pulled lazily, so the input can be arbitrarily large;
+    only the parked probes (at most max_parked) are held in memory.
+
+    With a congestion controller, the number of probes in flight follows
+    its window, and probes that failed because of local resource exhaustion
+    are queued again instead of being reported.
+
+    A probe may return a Future instead of a result, when part of its work
+    runs elsewhere (service detection on its own pool). Its slot is freed
+    right away and the result is yielded when the Future completes; at most
+    max_deferred of them are waited for before new probes stop starting.
+    """
+
+    # Constructor
+    def __init__(self, probe: Callable[[Any, int], Dict], max_in_flight: int = 100,
+                 max_per_host: Optional[int] = None, max_parked: Optional[int] = None,
+                 controller: Optional[CongestionController] = None, max_requeues: int = 3,
+                 max_deferred: Optional[int] = None):
+        self.probe = probe # Function that scans one port of one host
+        self.max_in_flight = max(1, max_in_flight) # Probes running at the same time, all hosts together
+        self.max_per_host = max(1, max_per_host or self.max_in_flight) # Probes running at the same time on one host
+        self.max_parked = max_parked or 64 * self.max_in_flight # Probes waiting for a busy host before we stop pulling new ones
+        self.controller = controller # Adapts the probes in flight (up to max_in_flight) to the errors seen, fixed when None
+        self.max_requeues = max_requeues # Times a probe is queued again after failing for lack of local resources
+        self.max_deferred = max_deferred or 4 * self.max_in_flight # Deferred results waited for before we stop starting probes
+        self.logger = logging.getLogger(__name__) # Logger object
+
+    def run(self, probes: Iterable[Tuple[Any, int]]) -> Iterator[Tuple[Any, Dict]]:
+        """
+        Run the probes and yield their results as they complete.
+
+        Args:
+            probes: Iterable of (host, port) tuples
+
+        Returns:
+            Iterator of (host, result) tuples, in completion order
+        """
+        probes = iter(probes)
+        pending = {} # Future -> (host, port)
+        deferred = {} # Future returned by a probe -> host
+        in_flight = defaultdict(int) # Host -> probes running
+        parked = defaultdict(deque) # Host -> ports waiting for a free slot on that host
+        ready = deque() # Hosts with parked ports that got a free slot back
+        requeues = {} # (host, port) -> times queued again
+        parked_count = 0
+        exhausted = False
+
+        with ThreadPoolExecutor(max_workers=self.max_in_flight) as executor:
+            def submit(host, port):
+                in_flight[host] += 1
+                pending[executor.submit(self.probe, host, port)] = (host, port)
+
+            try:
+                while True:
+                    limit = min(self.max_in_flight, self.controller.window) if self.controller else self.max_in_flight
+                    if len(deferred) >= self.max_deferred: # Let the deferred work catch up
+                        limit = 0
+
+                    # Parked probes first, their hosts have a free slot now
+                    while ready and len(pending) < limit:
+                        host = ready.popleft()
+                        queue = parked[host]
+                        while queue and len(pending) < limit and in_flight[host] < self.max_per_host:
+                            submit(host, queue.popleft())
+                            parked_count -= 1
+                        if not queue:
+                            del parked[host]
+                        elif in_flight[host] < self.max_per_host: # Out of global slots, try again later
+                            ready.appendleft(host)
+
+                    # Then new probes, until the pool or the parking area is full
+                    while not exhausted and len(pending) < limit and parked_count < self.max_parked:
+                        try:
+                            host, port = next(probes)
+                        except StopIteration:
+                            exhausted = True
+                            break
+                        if in_flight[host] < self.max_per_host and host not in parked:
+                            submit(host, port)
+                        else:
+                            parked[host].append(port)
+                            parked_count += 1
+
+                    if not pending and not deferred:
+                        break
+
+                    done, _ = concurrent.futures.wait(
+                        list(pending) + list(deferred), return_when=concurrent.futures.FIRST_COMPLETED
+                    )
+                    for future in done:
+                        if future in deferred:
+                            yield deferred.pop(future), future.result()
+                            continue
+                        host, port = pending.pop(future)
+                        in_flight[host] -= 1
+                        if not in_flight[host]:
+                            del in_flight[host]
+                        result = future.result()
+
+                        if isinstance(result, concurrent.futures.Future): # Finished elsewhere, the slot is free
+                            deferred[result] = host
+                            if host in parked and host not in ready:
+                                ready.append(host)
+                            continue
+
+                        requeued = False
+                        if self.controller and self.controller.record(result):
+                            attempts = requeues.get((host, port), 0)
+                            if attempts < self.max_requeues: # Try again once the window has shrunk
+                                requeues[(host, port)] = attempts + 1
+                                parked[host].appendleft(port)
+                                parked_count += 1
+                                requeued = True
+                        if not requeued:
+                            requeues.pop((host, port), None)
+
+                        if host in parked and host not in ready:
+                            ready.append(host)
+                        if not requeued:
+                            yield host, result
+            finally:
+                # The consumer may stop early, do not run what is still queued
+                for future in list(pending) + list(deferred):
+                    future.cancel()
@@ -0,0 +1,174 @@
+import threading
+from array import array
+from collections.abc import Collection
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+# Used when the services database is missing or incomplete
+_FALLBACK_SERVICES = {
+    "tcp": {
+        7: "echo", 20: "ftp-data", 21: "ftp", 22: "ssh", 23: "telnet", 25: "smtp",
+        53: "domain", 79: "finger", 80: "http", 88: "kerberos", 110: "pop3",
+        111: "sunrpc", 113: "auth", 119: "nntp", 135: "epmap", 139: "netbios-ssn",
+        143: "imap2", 179: "bgp", 389: "ldap", 443: "https", 445: "microsoft-ds",
+        465: "submissions", 514: "shell", 515: "printer", 548: "afpovertcp",
+        554: "rtsp", 587: "submission", 631: "ipp", 636: "ldaps", 873: "rsync",
+        993: "imaps", 995: "pop3s", 1433: "ms-sql-s", 1723: "pptp", 2049: "nfs",
+        3128: "squid", 3306: "mysql", 3389: "ms-wbt-server", 5060: "sip",
+        5432: "postgresql", 5900: "vnc", 6379: "redis", 8080: "http-alt",
+        8443: "https-alt", 9100: "jetdirect", 27017: "mongodb",
+    },
+    "udp": {
+        7: "echo", 53: "domain", 67: "bootps", 68: "bootpc", 69: "tftp",
+        88: "kerberos", 111: "sunrpc", 123: "ntp", 137: "netbios-ns",
+        138: "netbios-dgm", 161: "snmp", 162: "snmp-trap", 500: "isakmp",
+        514: "syslog", 520: "router", 1194: "openvpn", 1434: "ms-sql-m",
+        1701: "l2tp", 1812: "radius", 1900: "ssdp", 4500: "ipsec-nat-t",
+        5060: "sip", 5353: "mdns",
+    },
+}
+
+# Most frequently open ports first, from internet-wide scan statistics
+_TOP_PORTS = {
+    "tcp": (
+        80, 23, 443, 21, 22, 25, 3389, 110, 445, 139, 143, 53, 135, 3306, 8080,
+        1723, 111, 995, 993, 5900, 1025, 587, 8888, 199, 1720, 465, 548, 113, 81,
+        6001, 10000, 514, 5060, 179, 1026, 2000, 8443, 8000, 32768, 554, 26, 1433,
+        49152, 2001, 515, 8008, 49154, 1027, 5666, 646, 5000, 5631, 631, 49153,
+        8081, 2049, 88, 79, 5800, 106, 2121, 1110, 49155, 6000, 513, 990, 5357,
+        427, 49156, 543, 544, 5101, 144, 7, 389, 8009, 3128, 444, 9999, 5009,
+        7070, 5190, 3000, 5432, 1900, 3986, 13, 1029, 9, 5051, 6646, 49157, 1028,
+        873, 1755, 2717, 4899, 9100, 119, 37,
+    ),
+    "udp": (
+        631, 161, 137, 123, 138, 1434, 445, 135, 67, 53, 139, 500, 68, 520, 1900,
+        4500, 514, 49152, 162, 69, 5353, 111, 49154, 1701, 998, 996, 997, 999,
+        3283, 49153, 1812, 136, 2222, 2049, 32768, 5060, 1025, 1433, 3456, 80,
+        20031, 1026, 7, 1646, 1645, 593, 518, 2048, 31337, 515,
+    ),
+}
+
+class ServiceRegistry:
+    """
+    Port number to service name lookup, per protocol.
+
+    The services database is parsed once, the first time a name is needed,
+    into one array per protocol indexed by port number. Lookups are then a
+    plain array access, without the libc lock taken by socket.getservbyport.
+    """
+
+    # Constructor
+    def __init__(self, path: str = "/etc/services"):
+        self.path = path # Services database, in /etc/services format
+        self._tables: Optional[Dict[str, Tuple[array, List[str]]]] = None # Protocol -> (name index by port, names)
+        self._lock = threading.Lock()
+
+    def lookup(self, port: int, protocol: str = "tcp", default: str = "unknown") -> str:
+        """
+        Get the service name of a port.
+
+        Args:
+            port: Port number
+            protocol: "tcp" or "udp"
+            default: Value returned for unregistered ports
+
+        Returns:
+            Service name
+        """
+        table = self._get_tables().get(protocol)
+        if table is None or not 0 <= port <= 65535:
+            return default
+        index, names = table
+        return names[index[port]] if index[port] else default
+
+    def top_ports(self, protocol: str = "tcp", count: Optional[int] = None) -> List[int]:
+        """
+        Get ports ordered by how likely they are to be open.
+
+        The most frequently open ports come first, then the rest of the
+        registered ports in ascending order.
+
+        Args:
+            protocol: "tcp" or "udp"
+            count: Maximum number of ports to return (all when None)
+
+        Returns:
+            List of port numbers
+        """
+        top = _TOP_PORTS.get(protocol, ())
+        ports = list(top)
+        if count is None or count > len(ports):
+            index, _ = self._get_tables().get(protocol, (array("H"), []))
+            seen = set(top)
+            ports.extend(port for port in range(len(index)) if index[port] and port not in seen)
+        return ports if count is None else ports[:count]
+
+    def prioritize(self, ports: Iterable[int], protocol: str = "tcp") -> Iterator[int]:
+        """
+        Reorder ports so the most frequently open ones are probed first.
+
+        Ports from the top ports table that are part of the scan come first,
+        then the remaining ports in their original order. Ranges, sets and
+        port sets are never expanded into lists.
+
+        Args:
+            ports: Ports to scan
+            protocol: "tcp" or "udp"
+
+        Returns:
+            Iterator with the same ports in probing order
+        """
+        if isinstance(ports, (list, tuple)) or not isinstance(ports, Collection): # No fast membership test
+            ports = list(ports)
+            members = set(ports)
+        else:
+            members = ports
+        first = [port for port in _TOP_PORTS.get(protocol, ()) if port in members]
+        done = set(first)
+        yield from first
+        for port in ports:
+            if port not in done:
+                yield port
+
+    def _get_tables(self) -> Dict[str, Tuple[array, List[str]]]:
+        if self._tables is None:
+            with self._lock:
+                if self._tables is None: # Another thread may have loaded it meanwhile
+                    self._tables = self._load()
+        return self._tables
+
+    def _load(self) -> Dict[str, Tuple[array, List[str]]]:
+        tables = {}
+        for protocol in ("tcp", "udp"):
+            tables[protocol] = (array("H", bytes(2 * 65536)), [""]) # Name 0 means unregistered
+
+        def add(port, protocol, name):
+            if protocol not in tables or not 0 <= port <= 65535:
+                return
+            index, names = tables[protocol]
+            if index[port]: # Keep the first entry, like getservbyport
+                return
+            names.append(name)
+            index[port] = len(names) - 1
+
+        try:
+            with open(self.path, encoding="utf-8", errors="replace") as f:
+                for line in f:
+                    fields = line.split("#", 1)[0].split()
+                    if len(fields) < 2 or "/" not in fields[1]:
+                        continue
+                    port, _, protocol = fields[1].partition("/")
+                    if port.isdigit():
+                        add(int(port), protocol.lower(), fields[0])
+        except OSError:
+            pass # No database, the bundled table is used alone
+
+        for protocol, services in _FALLBACK_SERVICES.items():
+            for port, name in services.items():
+                add(port, protocol, name)
+        return tables
+
+_default_registry = ServiceRegistry()
+
+def get_service_registry() -> ServiceRegistry:
+    """Get the registry shared by every scanner"""
+    return _default_registry
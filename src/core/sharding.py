@@ -0,0 +1,439 @@
+import base64
+import json
+import os
+import queue
+import random
+import socket
+import socketserver
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from typing import Any, Collection, Dict, Iterator, List, NamedTuple, Optional, Sequence, Set, Tuple
+import logging # Import logging module, used to log messages in the console
+from core.fingerprint import ServiceDetector
+from core.permutation import CyclicPermutation
+from core.portspec import parse_ports
+from core.resources import ResourceGovernor
+from core.results import ScanResultSet
+from core.scanner import PortScanner
+from core.targets import TargetList
+
+DEFAULT_SHARD_SIZE = 4096
+
+class Shard(NamedTuple):
+    """Part of a scan, a range of probe numbers (or of steps of the random walk)"""
+    id: int # Position of the shard in the plan
+    first: int # First probe number
+    last: int # Probe number after the last one
+
+def make_job(targets: Sequence[str], ports: str, protocol: str = "tcp", exclude: Collection[str] = (),
+             randomize: bool = False, seed: Optional[int] = None, options: Optional[Dict[str, Any]] = None) -> Dict:
+    """
+    Describe a scan for the workers, as plain JSON data.
+
+    Args:
+        targets: Target specifications (IPs, hostnames, CIDR blocks)
+        ports: Port specification, see parse_ports
+        protocol: "tcp" or "udp"
+        exclude: Hosts to leave out, usually the names that did not resolve
+        randomize: Probe in pseudo-random order
+        seed: Order of a randomized scan, chosen here when None so every
+            worker walks the same permutation
+        options: Scanner settings: timeout, max_threads, max_per_host,
+            udp_rate, adaptive_concurrency, abortive_close, detect,
+            detect_timeout and detect_workers
+
+    Returns:
+        Job dictionary
+    """
+    if randomize and seed is None:
+        seed = random.getrandbits(32)
+    return {
+        "targets": list(targets),
+        "ports": ports,
+        "protocol": protocol,
+        "exclude": sorted(exclude),
+        "seed": seed if randomize else None,
+        "options": dict(options or {}),
+    }
+
+def plan_shards(job: Dict, shard_size: int = DEFAULT_SHARD_SIZE) -> List[Shard]:
+    """
+    Split a job into shards of about shard_size probes.
+
+    Probes are numbered like interleave orders them, port by port across
+    every host, so a shard spreads its probes over the hosts. The plan only
+    depends on the job: the coordinator and every worker agree on it.
+
+    Returns:
+        List of shards covering every probe once
+    """
+    size = len(TargetList(job["targets"])) * len(parse_ports(job["ports"], job["protocol"]))
+    if job["seed"] is not None: # Shards of the random walk, skipped steps included
+        size = CyclicPermutation(size, job["seed"]).steps
+    shard_size = max(1, shard_size)
+    return [Shard(index, first, min(first + shard_size, size)) for index, first in enumerate(range(0, size, shard_size))]
+
+class ShardScanner:
+    """
+    Scan the shards of a job with a PortScanner, in the worker process.
+
+    Targets, ports and the scanner are built once per job and reused for
+    every shard. The scanner keeps to the socket limits handed down by the
+    parent process, see ResourceGovernor.share.
+    """
+
+    # Constructor
+    def __init__(self, job: Dict, limits: Optional[Dict[str, Optional[int]]] = None):
+        options = job["options"]
+        self.job = job # Job being scanned
+        self.protocol = job["protocol"] # Protocol TCP or UDP
+        self.targets = TargetList(job["targets"]) # Hosts, by index
+        self.ports = parse_ports(job["ports"], self.protocol) # Ports, by index
+        self.exclude = set(job["exclude"]) # Hosts left out
+        self.permutation = None # Random order of the probes, probe number order when None
+        if job["seed"] is not None:
+            self.permutation = CyclicPermutation(len(self.targets) * len(self.ports), job["seed"])
+        self.detector = None # Service detection, when the job asks for it
+        if options.get("detect") and self.protocol == "tcp":
+            self.detector = ServiceDetector(
+                read_timeout=options.get("detect_timeout", 1.0), max_workers=options.get("detect_workers", 32)
+            )
+        self.scanner = PortScanner( # Engine of every shard
+            timeout=options.get("timeout", 1),
+            max_threads=options.get("max_threads", 100),
+            max_per_host=options.get("max_per_host"),
+            adaptive_concurrency=options.get("adaptive_concurrency", False),
+            udp_rate=options.get("udp_rate", 100),
+            detector=self.detector,
+            governor=ResourceGovernor(abortive_close=options.get("abortive_close", False), **(limits or {})),
+        )
+
+    def probes(self, shard: Shard) -> Iterator[Tuple[str, int]]:
+        """(host, port) probes of a shard"""
+        hosts = len(self.targets)
+        numbers = self.permutation.walk(shard.first, shard.last) if self.permutation else range(shard.first, shard.last)
+        for number in numbers:
+            port, host = divmod(number, hosts)
+            host = self.targets[host]
+            if host not in self.exclude:
+                yield host, self.ports[port]
+
+    def scan(self, shard: Shard) -> Dict:
+        """
+        Scan a shard.
+
+        Returns:
+            Shard result: shard id, number of probes and the packed results
+            by host (see encode_results)
+        """
+        results = ScanResultSet(self.protocol).update(self.scanner.iter_probes(self.probes(shard), self.protocol))
+        return {"shard": shard.id, "probes": sum(results.counts().values()), "hosts": encode_results(results)}
+
+    def close(self):
+        """Stop the detection pool"""
+        if self.detector:
+            self.detector.shutdown()
+
+def encode_results(results: ScanResultSet) -> List[List]:
+    """Packed results by host, as JSON data"""
+    encoded = []
+    for host in results.hosts:
+        base, states, details = results.export_host(host)
+        encoded.append([host, base, base64.b64encode(states).decode("ascii"), {str(port): fields for port, fields in details.items()}])
+    return encoded
+
+def decode_results(hosts: List[List], protocol: str = "tcp") -> ScanResultSet:
+    """Result set of the packed results of encode_results"""
+    results = ScanResultSet(protocol)
+    for host, base, states, details in hosts:
+        results.import_host(host, base, base64.b64decode(states), {int(port): fields for port, fields in details.items()})
+    return results
+
+def iter_shard_results(shard_result: Dict, protocol: str = "tcp") -> Iterator[Tuple[str, Dict]]:
+    """(host, result) of every probe of a shard result"""
+    for host, view in decode_results(shard_result["hosts"], protocol).items():
+        for result in view:
+            yield host, result
+
+_process_scanner: Optional[ShardScanner] = None # Scanner of the job, in each process of the local pool
+
+def _start_process(job: Dict, limits: Dict[str, Optional[int]]):
+    global _process_scanner
+    _process_scanner = ShardScanner(job, limits)
+
+def _scan_in_process(shard: Shard) -> Dict:
+    return _process_scanner.scan(shard)
+
+def run_local(job: Dict, shards: Sequence[Shard], processes: int,
+              governor: Optional[ResourceGovernor] = None) -> Iterator[Tuple[str, Dict]]:
+    """
+    Scan the shards of a job on a pool of local processes, each running its
+    own PortScanner, so the scan is not bound to one core.
+
+    Idle processes take the next shard, so a slow shard does not hold the
+    others. Only a few shards per process are queued at once.
+
+    Args:
+        job: Job returned by make_job
+        shards: Shards to scan, from plan_shards
+        processes: Number of worker processes
+        governor: Governor of this process, its socket limits are split
+            between the worker processes (a new one when None)
+
+    Returns:
+        Iterator of (host, result) tuples, a shard at a time as they complete
+    """
+    limits = (governor or ResourceGovernor()).share(processes)
+    remaining = iter(shards)
+    pending = set()
+    executor = ProcessPoolExecutor(max_workers=processes, initializer=_start_process, initargs=(job, limits))
+    try:
+        while True:
+            for shard in remaining:
+                pending.add(executor.submit(_scan_in_process, shard))
+                if len(pending) >= 2 * processes:
+                    break
+            if not pending:
+                break
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                yield from iter_shard_results(future.result(), job["protocol"])
+    finally:
+        executor.shutdown(wait=True, cancel_futures=True)
+
+class _Server(socketserver.ThreadingTCPServer):
+    allow_reuse_address = True # Restart on the same port right away
+    daemon_threads = True # A worker that hangs does not keep the process alive
+
+class Coordinator:
+    """
+    Hand out the shards of a job to remote workers over TCP and collect
+    their results.
+
+    The protocol is one JSON object per line. A worker says hello and gets
+    the job, then asks for the next shard and sends back its result, until
+    the coordinator answers done:
+
+        worker: {"type": "hello", "worker": "scanner-2:4711"}
+        coordinator: {"type": "job", "job": {...}}
+        worker: {"type": "next"}
+        coordinator: {"type": "shard", "shard": [id, first, last]}
+                     {"type": "wait", "seconds": 0.2} or {"type": "done"}
+        worker: {"type": "result", "result": {...}}
+
+    Workers pull shards, so fast workers scan more of them. Once every
+    shard has been handed out, idle workers steal the shards still running
+    elsewhere (the oldest first) and the first result of a shard wins, so a
+    slow worker does not hold the end of the scan. The shards of a worker
+    that disconnects are queued again.
+    """
+
+    # Constructor
+    def __init__(self, job: Dict, shards: Sequence[Shard], address: str = "127.0.0.1", port: int = 0,
+                 steal: bool = True):
+        self.job = job # Job sent to the workers
+        self.address = address # Address to listen on
+        self.port = port # Port to listen on, 0 picks a free one
+        self.steal = steal # Give idle workers a copy of the running shards
+        self.total = len(shards) # Shards in the job
+        self.stolen = 0 # Shards handed to a second worker
+        self.requeued = 0 # Shards queued again after their worker disconnected
+        self.completed: Dict[str, int] = {} # Worker -> shards it completed first
+        self._pending = deque(shards) # Shards not handed out yet
+        self._running: Dict[int, Tuple[Shard, Set[str]]] = {} # Shard id -> (shard, workers scanning it)
+        self._done: Set[int] = set() # Shards with a result
+        self._results: queue.Queue = queue.Queue() # First result of every shard
+        self._lock = threading.Lock()
+        self._server: Optional[_Server] = None
+        self._thread: Optional[threading.Thread] = None
+        self.logger = logging.getLogger(__name__) # Logger object
+
+    def start(self) -> "Coordinator":
+        """Start serving in a background thread"""
+        coordinator = self
+
+        class Handler(socketserver.StreamRequestHandler):
+            def handle(self):
+                worker = f"{self.client_address[0]}:{self.client_address[1]}"
+                try:
+                    for line in self.rfile:
+                        message = json.loads(line)
+                        if message.get("type") == "hello":
+                            worker = str(message.get("worker") or worker)
+                            coordinator.logger.info(f"Worker {worker} connected")
+                        reply = coordinator._handle(worker, message)
+                        if reply is not None:
+                            self.wfile.write(json.dumps(reply).encode() + b"\n")
+                except (OSError, ValueError, KeyError, TypeError) as e: # Broken connection or garbage, drop the worker
+                    coordinator.logger.error(f"Error talking to worker {worker}: {str(e)}")
+                finally:
+                    coordinator._release(worker)
+
+        self._server = _Server((self.address, self.port), Handler)
+        self.port = self._server.server_address[1]
+        self._thread = threading.Thread(target=self._server.serve_forever, name="coordinator", daemon=True)
+        self._thread.start()
+        self.logger.info(f"Waiting for workers on {self.address}:{self.port}, {self.total} shards to scan")
+        return self
+
+    def stop(self):
+        """Stop serving"""
+        if self._server:
+            self._server.shutdown()
+            self._server.server_close()
+        if self._thread:
+            self._thread.join()
+
+    def results(self) -> Iterator[Tuple[str, Dict]]:
+        """
+        Wait for the shards to complete.
+
+        Returns:
+            Iterator of (host, result) tuples, a shard at a time as they complete
+        """
+        for _ in range(self.total):
+            for host, view in self._results.get().items():
+                for result in view:
+                    yield host, result
+
+    def _handle(self, worker: str, message: Dict) -> Optional[Dict]:
+        if not isinstance(message, dict):
+            raise ValueError(f"Expected a JSON object, got {message!r}")
+        kind = message.get("type")
+        if kind == "hello":
+            return {"type": "job", "job": self.job}
+        if kind == "next":
+            return self._next_shard(worker)
+        if kind == "result":
+            self._complete(worker, message["result"])
+            return None
+        return {"type": "error", "message": f"Unknown message type: {kind}"}
+
+    def _next_shard(self, worker: str) -> Dict:
+        with self._lock:
+            if len(self._done) == self.total:
+                return {"type": "done"}
+            if self._pending:
+                shard = self._pending.popleft()
+                self._running[shard.id] = (shard, {worker})
+                return {"type": "shard", "shard": list(shard)}
+            if self.steal:
+                # Running shard this worker is not scanning, fewest copies first, then the oldest
+                candidates = [(len(workers), shard.id) for shard, workers in self._running.values() if worker not in workers]
+                if candidates:
+                    shard, workers = self._running[min(candidates)[1]]
+                    workers.add(worker)
+                    self.stolen += 1
+                    return {"type": "shard", "shard": list(shard)}
+            return {"type": "wait", "seconds": 0.2}
+
+    def _complete(self, worker: str, result: Dict):
+        """
+        Record the result of a shard.
+
+        Raises:
+            ValueError, KeyError, TypeError: If the result is malformed or
+                its shard is not one the worker is scanning
+        """
+        shard_id = result["shard"]
+        results = decode_results(result["hosts"], self.job["protocol"]) # Checked here, not in the thread reading the results
+        with self._lock:
+            if shard_id in self._done: # Stolen shard, the other worker was faster
+                return
+            running = self._running.get(shard_id)
+            if running is None or worker not in running[1]:
+                raise ValueError(f"Result of shard {shard_id!r}, which was not handed to the worker")
+            self._done.add(shard_id)
+            del self._running[shard_id]
+            self.completed[worker] = self.completed.get(worker, 0) + 1
+        self._results.put(results)
+
+    def _release(self, worker: str):
+        with self._lock:
+            for shard_id, (shard, workers) in list(self._running.items()):
+                workers.discard(worker)
+                if not workers: # Nobody else is scanning it
+                    del self._running[shard_id]
+                    self._pending.appendleft(shard)
+                    self.requeued += 1
+                    self.logger.warning(f"Worker {worker} left, shard {shard_id} queued again")
+
+def run_worker(address: str, port: int, name: Optional[str] = None,
+               limits: Optional[Dict[str, Optional[int]]] = None) -> int:
+    """
+    Scan shards for a coordinator until it has none left.
+
+    Args:
+        address: Address of the coordinator
+        port: Port of the coordinator
+        name: Name of the worker in the coordinator logs (host:pid when None)
+        limits: Share of the socket limits of the host, see
+            ResourceGovernor.share (the whole limits when None)
+
+    Returns:
+        Number of shards scanned
+    """
+    logger = logging.getLogger(__name__)
+    name = name or f"{socket.gethostname()}:{os.getpid()}"
+    scanned = 0
+    with socket.create_connection((address, port)) as sock:
+        stream = sock.makefile("rwb")
+
+        def send(message: Dict):
+            stream.write(json.dumps(message).encode() + b"\n")
+            stream.flush()
+
+        def receive() -> Dict:
+            line = stream.readline()
+            if not line:
+                raise ConnectionError("the coordinator closed the connection")
+            return json.loads(line)
+
+        send({"type": "hello", "worker": name})
+        scanner = ShardScanner(receive()["job"], limits)
+        try:
+            while True:
+                send({"type": "next"})
+                reply = receive()
+                if reply["type"] == "done":
+                    break
+                if reply["type"] == "wait":
+                    time.sleep(reply["seconds"])
+                    continue
+                send({"type": "result", "result": scanner.scan(Shard(*reply["shard"]))})
+                scanned += 1
+        except ConnectionError as e: # The coordinator stops once every shard has a result
+            logger.info(f"Worker {name} stopped: {str(e)}")
+        finally:
+            scanner.close()
+    return scanned
+
+def run_workers(address: str, port: int, processes: int = 1, governor: Optional[ResourceGovernor] = None) -> int:
+    """
+    Run worker processes for a coordinator, one per core to use.
+
+    The socket limits of the host, read by governor (a new one when None),
+    are split between the processes.
+
+    Returns:
+        Number of shards scanned by every process
+    """
+    if processes <= 1:
+        return run_worker(address, port)
+    limits = (governor or ResourceGovernor()).share(processes)
+    with ProcessPoolExecutor(max_workers=processes) as executor:
+        return sum(executor.map(run_worker, [address] * processes, [port] * processes, [None] * processes, [limits] * processes))
+
+def parse_address(text: str) -> Tuple[str, int]:
+    """
+    Parse an ADDRESS:PORT pair, the address defaults to 127.0.0.1.
+
+    Raises:
+        ValueError: If the port is missing or not a number
+    """
+    address, separator, port = text.rpartition(":")
+    if not separator or not port.isdigit() or int(port) > 65535:
+        raise ValueError(f"Expected ADDRESS:PORT, got {text!r}")
+    return address.strip("[]") or "127.0.0.1", int(port)
@@ -0,0 +1,197 @@
+import json
+import sqlite3
+import time
+import zlib
+from typing import Collection, Dict, Iterable, Optional, Set
+import logging # Import logging module, used to log messages in the console
+from core.results import ScanResultSet
+from core.portspec import PortSet
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS scans (
+    id INTEGER PRIMARY KEY,
+    spec TEXT NOT NULL,          -- Targets and ports, scans of the same spec can be resumed and compared
+    protocol TEXT NOT NULL,
+    mode TEXT NOT NULL,          -- full or incremental
+    status TEXT NOT NULL,        -- running, interrupted or complete
+    started REAL NOT NULL,
+    updated REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS hosts (
+    scan_id INTEGER NOT NULL REFERENCES scans(id) ON DELETE CASCADE,
+    host TEXT NOT NULL,
+    base INTEGER NOT NULL,       -- First port of the packed states
+    states BLOB NOT NULL,        -- Port states packed by ScanResultSet
+    details TEXT NOT NULL,       -- JSON details of open and error ports
+    PRIMARY KEY (scan_id, host)
+);
+CREATE INDEX IF NOT EXISTS scans_by_spec ON scans (spec, protocol, status);
+"""
+
+class ScanStore:
+    """
+    SQLite store of scan results, checkpointed while the scan runs.
+
+    Results are kept in a ScanResultSet and the packed states of the hosts
+    that changed are written every checkpoint_interval seconds, on
+    interrupt and at the end of the scan. A scan that did not complete can
+    be resumed, skipping the probes already done, and a complete scan is
+    the reference of the next incremental one.
+
+    The store is not thread safe, it is fed from the thread that collects
+    the results.
+    """
+
+    # Constructor
+    def __init__(self, path: str, checkpoint_interval: float = 30):
+        self.path = path # SQLite database file
+        self.checkpoint_interval = checkpoint_interval # Seconds between checkpoints
+        self.scan_id: Optional[int] = None # Scan being recorded
+        self.results: Optional[ScanResultSet] = None # Results of the scan being recorded, resumed ones included
+        self.resumed = False # Whether the scan continues an interrupted one
+        self._dirty: Set[str] = set() # Hosts changed since the last checkpoint
+        self._last_checkpoint = time.monotonic()
+        self.logger = logging.getLogger(__name__) # Logger object
+        self._db = sqlite3.connect(path)
+        self._db.execute("PRAGMA journal_mode=WAL") # Checkpoints do not block readers
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.execute("PRAGMA foreign_keys=ON")
+        self._db.executescript(_SCHEMA)
+
+    def start_scan(self, spec: str, protocol: str, mode: str = "full", resume: bool = False) -> ScanResultSet:
+        """
+        Start recording a scan.
+
+        Args:
+            spec: Description of the targets and ports, only scans with the
+                same spec are resumed or compared
+            protocol: "tcp" or "udp"
+            mode: "full" or "incremental"
+            resume: Continue the last full scan of the spec that did not
+                complete, when there is one
+
+        Returns:
+            The result set of the scan, with the results of the resumed scan
+        """
+        now = time.time()
+        row = None
+        if resume:
+            row = self._db.execute(
+                "SELECT id FROM scans WHERE spec = ? AND protocol = ? AND mode = 'full' AND status != 'complete' "
+                "ORDER BY id DESC LIMIT 1",
+                (spec, protocol),
+            ).fetchone()
+        with self._db:
+            if row:
+                self.scan_id = row[0]
+                self._db.execute("UPDATE scans SET status = 'running', updated = ? WHERE id = ?", (now, self.scan_id))
+            else:
+                self.scan_id = self._db.execute(
+                    "INSERT INTO scans (spec, protocol, mode, status, started, updated) VALUES (?, ?, ?, 'running', ?, ?)",
+                    (spec, protocol, mode, now, now),
+                ).lastrowid
+        self.resumed = row is not None
+        self.results = self._load(self.scan_id, protocol) if self.resumed else ScanResultSet(protocol)
+        if self.resumed:
+            self.logger.info(f"Resuming scan {self.scan_id}: {sum(self.results.counts().values())} probes already done")
+        self._dirty.clear()
+        self._last_checkpoint = time.monotonic()
+        return self.results
+
+    def record(self, host: str, result: Dict):
+        """
+        Store the result of a probe, checkpointing when the interval is over.
+
+        Args:
+            host: Host the result belongs to
+            result: Result dictionary as returned by the scanner
+        """
+        self.results.add(host, result)
+        self._dirty.add(host)
+        if time.monotonic() - self._last_checkpoint >= self.checkpoint_interval:
+            self.checkpoint()
+
+    def is_done(self, host: str, port: int) -> bool:
+        """Whether the scan already has a result for a probe"""
+        return self.results.state(host, port) != ""
+
+    def checkpoint(self):
+        """Write the hosts changed since the last checkpoint"""
+        rows = []
+        for host in self._dirty:
+            base, states, details = self.results.export_host(host)
+            rows.append((self.scan_id, host, base, states, json.dumps(details)))
+        with self._db:
+            self._db.executemany(
+                "INSERT OR REPLACE INTO hosts (scan_id, host, base, states, details) VALUES (?, ?, ?, ?, ?)", rows
+            )
+            self._db.execute("UPDATE scans SET updated = ? WHERE id = ?", (time.time(), self.scan_id))
+        self._dirty.clear()
+        self._last_checkpoint = time.monotonic()
+
+    def finish(self, status: str = "complete"):
+        """
+        Checkpoint and close the scan.
+
+        Args:
+            status: "complete", or "interrupted" for a scan to resume later
+        """
+        self.checkpoint()
+        with self._db:
+            self._db.execute("UPDATE scans SET status = ?, updated = ? WHERE id = ?", (status, time.time(), self.scan_id))
+
+    def last_complete(self, spec: str, protocol: str) -> Optional[ScanResultSet]:
+        """
+        Get the results of the last complete scan of a spec, before the one
+        being recorded.
+
+        Returns:
+            ScanResultSet, or None when the spec was never fully scanned
+        """
+        row = self._db.execute(
+            "SELECT id FROM scans WHERE spec = ? AND protocol = ? AND status = 'complete' AND id != ? "
+            "ORDER BY id DESC LIMIT 1",
+            (spec, protocol, self.scan_id or -1),
+        ).fetchone()
+        return self._load(row[0], protocol) if row else None
+
+    def close(self):
+        """Close the database"""
+        self._db.close()
+
+    def _load(self, scan_id: int, protocol: str) -> ScanResultSet:
+        results = ScanResultSet(protocol)
+        for host, base, states, details in self._db.execute(
+            "SELECT host, base, states, details FROM hosts WHERE scan_id = ?", (scan_id,)
+        ):
+            details = {int(port): fields for port, fields in json.loads(details).items()}
+            results.import_host(host, base, states, details)
+        return results
+
+class SamplingPolicy:
+    """
+    Choose the ports an incremental scan probes besides the ones that were
+    open in the previous scan.
+
+    The always ports (usually the most common ones) are probed on every
+    host, and a share of the others given by ratio. The choice depends on
+    the seed, so successive scans with different seeds cover different
+    ports and the whole space is covered over time.
+    """
+
+    # Constructor
+    def __init__(self, ratio: float = 0.1, seed: int = 0, always: Collection[int] = ()):
+        self.ratio = ratio # Share of the other ports to probe, 0 to 1
+        self.seed = seed # Varies the sample between scans
+        self.always = frozenset(always) # Ports probed on every host
+        self._threshold = int(ratio * 2**32)
+
+    def __call__(self, host: str, port: int) -> bool:
+        """Whether a probe is part of the sample"""
+        if port in self.always:
+            return True
+        return zlib.crc32(f"{self.seed}:{host}:{port}".encode()) < self._threshold
+
+def scan_spec(targets: Iterable[str], ports: PortSet) -> str:
+    """Spec of a scan, as given to ScanStore"""
+    return json.dumps({"targets": sorted(targets), "ports": str(ports)}, separators=(",", ":"))
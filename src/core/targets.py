@@ -0,0 +1,124 @@
+import bisect
+import ipaddress
+from typing import Iterable, Iterator, List, Sequence, Union
+
+Block = Union[str, ipaddress.IPv4Network, ipaddress.IPv6Network]
+
+class TargetList(Sequence):
+    """
+    Lazy, indexable list of hosts built from hostnames, IP addresses and
+    CIDR blocks.
+
+    Networks are never expanded into a list of addresses: a /16 costs the
+    same memory as a single host, and any host can be fetched by index.
+    """
+
+    # Constructor
+    def __init__(self, specs: Iterable[str] = ()):
+        self._blocks: List[Block] = [] # Hostnames, or networks (one block per spec)
+        self._starts: List[int] = [] # Index of the first host of each block
+        self._size = 0 # Total number of hosts
+        for spec in specs:
+            self.add(spec)
+
+    def add(self, spec: str):
+        """
+        Add a target specification.
+
+        Args:
+            spec: Hostname, IP address, CIDR block (10.0.0.0/24) or a comma
+                separated list of those
+
+        Raises:
+            ValueError: If a CIDR block is malformed
+        """
+        for item in spec.split(","):
+            item = item.strip()
+            if not item:
+                continue
+            block = parse_target(item)
+            self._blocks.append(block)
+            self._starts.append(self._size)
+            self._size += _block_size(block)
+
+    @property
+    def hostnames(self) -> List[str]:
+        """Targets given by name, the only ones that need resolving"""
+        return [block for block in self._blocks if isinstance(block, str) and not _is_ip(block)]
+
+    def __len__(self) -> int:
+        return self._size
+
+    def __getitem__(self, index: int) -> str:
+        if index < 0:
+            index += self._size
+        if not 0 <= index < self._size:
+            raise IndexError("target index out of range")
+        position = bisect.bisect_right(self._starts, index) - 1
+        return _block_host(self._blocks[position], index - self._starts[position])
+
+    def __iter__(self) -> Iterator[str]:
+        for block in self._blocks:
+            for offset in range(_block_size(block)):
+                yield _block_host(block, offset)
+
+def parse_target(spec: str) -> Block:
+    """
+    Parse a single target.
+
+    Args:
+        spec: Hostname, IP address or CIDR block
+
+    Returns:
+        The hostname or address as a string, or an ip_network for CIDR blocks
+
+    Raises:
+        ValueError: If a CIDR block is malformed
+    """
+    if "/" in spec:
+        return ipaddress.ip_network(spec, strict=False)
+    return spec
+
+def load_target_file(path: str) -> List[str]:
+    """
+    Read target specifications from a file.
+
+    Targets are separated by whitespace or commas, and everything after a
+    '#' is a comment.
+
+    Args:
+        path: Path of the file
+
+    Returns:
+        List of target specifications
+    """
+    specs = []
+    with open(path) as f:
+        for line in f:
+            line = line.split("#", 1)[0]
+            specs.extend(item for item in line.replace(",", " ").split() if item)
+    return specs
+
+def _is_ip(value: str) -> bool:
+    try:
+        ipaddress.ip_address(value)
+        return True
+    except ValueError:
+        return False
+
+def _host_offset(network) -> int:
+    # Skip the network address, except for point-to-point and single host blocks
+    return 1 if network.prefixlen < network.max_prefixlen - 1 else 0
+
+def _block_size(block: Block) -> int:
+    if isinstance(block, str):
+        return 1
+    offset = _host_offset(block)
+    if offset and block.version == 4: # IPv4 also skips the broadcast address
+        return block.num_addresses - 2
+    return block.num_addresses - offset
+
+def _block_host(block: Block, offset: int) -> str:
+    if isinstance(block, str):
+        return block
+    return str(block[_host_offset(block) + offset])
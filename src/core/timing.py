@@ -0,0 +1,117 @@
+import threading
+from typing import Dict, Optional
+
+class RttEstimator:
+    """Smoothed round trip time and variance of one host, as in RFC 6298"""
+
+    __slots__ = ("srtt", "rttvar", "samples")
+
+    ALPHA = 1 / 8 # Weight of a new sample in the smoothed RTT
+    BETA = 1 / 4 # Weight of a new sample in the RTT variance
+
+    # Constructor
+    def __init__(self):
+        self.srtt: Optional[float] = None # Smoothed RTT in seconds
+        self.rttvar: Optional[float] = None # RTT variance in seconds
+        self.samples = 0 # Number of measurements so far
+
+    def update(self, rtt: float):
+        """
+        Add a measurement.
+
+        Args:
+            rtt: Time it took the host to answer a connect, in seconds
+        """
+        if self.srtt is None:
+            self.srtt = rtt
+            self.rttvar = rtt / 2
+        else:
+            self.rttvar = (1 - self.BETA) * self.rttvar + self.BETA * abs(self.srtt - rtt)
+            self.srtt = (1 - self.ALPHA) * self.srtt + self.ALPHA * rtt
+        self.samples += 1
+
+    def timeout(self) -> float:
+        """Time to wait for an answer before giving up on a probe"""
+        return self.srtt + 4 * self.rttvar
+
+class AdaptiveTiming:
+    """
+    Per-host probe timeouts derived from the measured connect RTT.
+
+    Every probe that gets an answer (a completed connect or a RST) feeds
+    the estimator of its host. Until a host has answered once, its probes
+    use initial_timeout.
+    """
+
+    # Constructor
+    def __init__(self, initial_timeout: float = 1, min_timeout: float = 0.05,
+                 max_timeout: Optional[float] = None, retries: int = 1):
+        self.initial_timeout = initial_timeout # Timeout before any measurement
+        self.min_timeout = min_timeout # Floor, protects against timer granularity and jitter
+        self.max_timeout = max_timeout or initial_timeout # Ceiling, the slowest answer we wait for
+        self.retries = retries # Extra attempts for probes that time out
+        self._hosts: Dict[str, RttEstimator] = {} # Address -> estimator
+        self._lock = threading.Lock()
+
+    def timeout_for(self, host: str) -> float:
+        """
+        Get the timeout to use for the next probe of a host.
+
+        Args:
+            host: Address of the host
+
+        Returns:
+            Timeout in seconds, between min_timeout and max_timeout
+        """
+        with self._lock:
+            estimator = self._hosts.get(host)
+            if estimator is None or not estimator.samples:
+                return self.initial_timeout
+            timeout = estimator.timeout()
+        return min(self.max_timeout, max(self.min_timeout, timeout))
+
+    def retry_timeout(self, timeout: float) -> float:
+        """
+        Get the timeout of a retry, backing off after a probe timed out.
+
+        Args:
+            timeout: Timeout of the attempt that timed out
+
+        Returns:
+            Timeout in seconds, at most max_timeout
+        """
+        return min(self.max_timeout, 2 * timeout)
+
+    def record(self, host: str, rtt: float):
+        """
+        Add a RTT measurement for a host.
+
+        Args:
+            host: Address of the host
+            rtt: Time it took to get the answer, in seconds
+        """
+        with self._lock:
+            estimator = self._hosts.get(host)
+            if estimator is None:
+                estimator = self._hosts[host] = RttEstimator()
+            estimator.update(rtt)
+
+    def summary(self) -> Dict[str, Dict[str, float]]:
+        """
+        Get the timing state of every host that answered.
+
+        Returns:
+            Dictionary by host address with srtt, rttvar and the timeout used
+            for its probes (seconds), and the number of samples
+        """
+        with self._lock:
+            hosts = list(self._hosts.items())
+        return {
+            host: {
+                "srtt": estimator.srtt,
+                "rttvar": estimator.rttvar,
+                "timeout": self.timeout_for(host),
+                "samples": estimator.samples,
+            }
+            for host, estimator in hosts
+        }
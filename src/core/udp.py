@@ -0,0 +1,288 @@
+import selectors
+import socket
+import time
+from collections import deque
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+import logging # Import logging module, used to log messages in the console
+from core.resolver import Resolver, ResolvedTarget
+from core.services import ServiceRegistry, get_service_registry
+from core.errors import RESOURCE_ERRNOS, errno_name
+
+_DNS_QUERY = ( # Standard query for the NS records of the root zone
+    b"\x12\x34\x01\x00\x00\x01\x00\x00\x00\x00\x00\x00"
+    b"\x00\x00\x02\x00\x01"
+)
+
+# Payloads that make a service answer. Ports without one get an empty datagram
+UDP_PAYLOADS = {
+    53: _DNS_QUERY,
+    69: b"\x00\x01r7tftp.txt\x00octet\x00", # TFTP read request
+    111: ( # Portmapper NULL call
+        b"\x72\xfe\x1d\x13\x00\x00\x00\x00\x00\x00\x00\x02\x00\x01\x86\xa0"
+        b"\x00\x00\x00\x02\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00"
+        b"\x00\x00\x00\x00\x00\x00\x00\x00"
+    ),
+    123: b"\xe3" + b"\x00" * 47, # NTPv4 client request
+    137: ( # NetBIOS node status request
+        b"\x80\xf0\x00\x10\x00\x01\x00\x00\x00\x00\x00\x00"
+        b"\x20CKAAAAAAAAAAAAAAAAAAAAAAAAAAAAAA\x00\x00\x21\x00\x01"
+    ),
+    161: ( # SNMPv1 get-request of sysDescr.0, community "public"
+        b"\x30\x26\x02\x01\x00\x04\x06public\xa0\x19\x02\x01\x01\x02\x01\x00"
+        b"\x02\x01\x00\x30\x0e\x30\x0c\x06\x08\x2b\x06\x01\x02\x01\x01\x01\x00"
+        b"\x05\x00"
+    ),
+    1900: ( # SSDP discovery
+        b"M-SEARCH * HTTP/1.1\r\nHOST: 239.255.255.250:1900\r\n"
+        b"MAN: \"ssdp:discover\"\r\nMX: 1\r\nST: ssdp:all\r\n\r\n"
+    ),
+    5353: _DNS_QUERY,
+}
+
+class TokenBucket:
+    """Allow at most rate events per second, with bursts of up to burst events"""
+
+    __slots__ = ("rate", "burst", "tokens", "updated")
+
+    # Constructor
+    def __init__(self, rate: float, burst: Optional[float] = None):
+        self.rate = rate # Tokens added per second
+        self.burst = burst or max(1.0, rate / 10) # Maximum tokens saved
+        self.tokens = self.burst
+        self.updated = time.monotonic()
+
+    def delay(self) -> float:
+        """Seconds until a token is available (0 when one is available now)"""
+        self._refill()
+        return 0.0 if self.tokens >= 1 else (1 - self.tokens) / self.rate
+
+    def take(self):
+        """Consume a token"""
+        self._refill()
+        self.tokens -= 1
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+class _Probe:
+    """A UDP probe in progress"""
+
+    __slots__ = ("host", "port", "resolved", "attempt", "deadline")
+
+    def __init__(self, host, port: int, resolved: ResolvedTarget):
+        self.host = host
+        self.port = port
+        self.resolved = resolved
+        self.attempt = 0 # Datagrams sent so far
+        self.deadline = 0.0 # When the current attempt times out
+
+class UdpScanner:
+    """
+    UDP scan engine.
+
+    Probes are sent from a small pool of connected UDP sockets and their
+    answers are multiplexed through a selector. On a connected UDP socket,
+    the ICMP port unreachable sent by a closed port comes back as
+    ECONNREFUSED, which is how closed ports are told apart from ports that
+    do not answer. Ports are reported as:
+        - open: the service answered
+        - closed: ICMP port unreachable
+        - filtered: other ICMP unreachable (host, network...)
+        - open|filtered: no answer at all, after every retry
+
+    Hosts throttle their ICMP errors: Linux sends about one per second to
+    each peer, after a burst of a few. Closed ports probed faster than that
+    get no error back and are reported as open|filtered. The probes sent to
+    each host are rate limited, the default of 100 per second favours speed
+    and keeps the datagrams from flooding the host, a rate of 1 per second
+    is needed to tell every closed port apart on Linux targets.
+    """
+
+    # Constructor
+    def __init__(self, timeout: float = 1, retries: int = 1, max_sockets: int = 64,
+                 rate: Optional[float] = 100, resolver: Optional[Resolver] = None,
+                 services: Optional[ServiceRegistry] = None):
+        self.timeout = timeout # Time to wait for an answer to each datagram
+        self.retries = retries # Extra datagrams sent to ports that did not answer
+        self.max_sockets = max(1, max_sockets) # Probes in flight, one socket each
+        self.rate = rate # Datagrams per second to a single host (None: no limit)
+        self.resolver = resolver or Resolver() # Shared DNS cache
+        self.services = services or get_service_registry() # Port to service name table
+        self.logger = logging.getLogger(__name__) # Logger object
+
+    def scan(self, target: str, ports: Iterable[int]) -> List[Dict]:
+        """
+        Scan UDP ports of a single host.
+
+        Args:
+            target: IP or hostname to scan
+            ports: Ports to scan
+
+        Returns:
+            List of results by port
+        """
+        results = [result for _, result in self.iter_probes((target, port) for port in ports)]
+        return sorted(results, key=lambda x: x["port"])
+
+    def iter_probes(self, probes: Iterable[Tuple[str, int]]) -> Iterator[Tuple[str, Dict]]:
+        """
+        Scan (host, port) probes and yield the results as they complete.
+
+        Args:
+            probes: Iterable of (host, port) tuples
+
+        Returns:
+            Iterator of (host, result) tuples, in completion order
+        """
+        probes = iter(probes)
+        exhausted = False
+        selector = selectors.DefaultSelector()
+        idle: Dict[int, List[socket.socket]] = {} # Family -> sockets without a probe
+        active: Dict[socket.socket, _Probe] = {} # Socket -> probe waiting for an answer
+        waiting = deque() # Probes that could not be sent yet (rate limit or retry)
+        buckets: Dict[str, TokenBucket] = {} # Host address -> rate limiter
+
+        def bucket_for(address):
+            if self.rate is None:
+                return None
+            bucket = buckets.get(address)
+            if bucket is None:
+                bucket = buckets[address] = TokenBucket(self.rate)
+            return bucket
+
+        def release(sock):
+            selector.unregister(sock)
+            del active[sock]
+            _drain(sock)
+            idle.setdefault(sock.family, []).append(sock)
+
+        def send(probe, sock):
+            bucket = bucket_for(probe.resolved.address)
+            if bucket:
+                bucket.take()
+            probe.attempt += 1
+            probe.deadline = time.monotonic() + self.timeout
+            sock.connect((probe.resolved.address, probe.port))
+            # Late answers to the previous probe of the socket may have arrived while it was idle.
+            # Once connected, the socket only takes datagrams and ICMP errors from the new port
+            _drain(sock)
+            sock.send(UDP_PAYLOADS.get(probe.port, b""))
+
+        try:
+            while True:
+                now_delay = None # Shortest wait for a rate limited host
+
+                # Start probes while there are sockets available
+                while len(active) < self.max_sockets:
+                    probe = None
+                    for _ in range(len(waiting)): # Retries and rate limited probes first
+                        candidate = waiting.popleft()
+                        bucket = bucket_for(candidate.resolved.address)
+                        delay = bucket.delay() if bucket else 0.0
+                        if delay == 0.0:
+                            probe = candidate
+                            break
+                        waiting.append(candidate)
+                        now_delay = delay if now_delay is None else min(now_delay, delay)
+                    if probe is None:
+                        if exhausted or len(waiting) >= 4 * self.max_sockets:
+                            break
+                        try:
+                            host, port = next(probes)
+                        except StopIteration:
+                            exhausted = True
+                            break
+                        try:
+                            probe = _Probe(host, port, self.resolver.resolve(host))
+                        except socket.gaierror:
+                            self.logger.error(f"Error resolving hostname: {host}")
+                            yield host, {"port": port, "state": "error", "service": "", "reason": "resolution"}
+                            continue
+                        bucket = bucket_for(probe.resolved.address)
+                        delay = bucket.delay() if bucket else 0.0
+                        if delay:
+                            waiting.append(probe)
+                            now_delay = delay if now_delay is None else min(now_delay, delay)
+                            continue
+
+                    family = probe.resolved.family
+                    sock = None
+                    try:
+                        if idle.get(family):
+                            sock = idle[family].pop()
+                        else:
+                            sock = socket.socket(family, socket.SOCK_DGRAM)
+                            sock.setblocking(False)
+                        send(probe, sock)
+                    except OSError as e:
+                        if sock is not None:
+                            sock.close()
+                        yield probe.host, self._error_result(probe.port, e)
+                        continue
+                    active[sock] = probe
+                    selector.register(sock, selectors.EVENT_READ)
+
+                if not active and not waiting and exhausted:
+                    break
+
+                # Wait for answers, the next deadline or the next rate limit token
+                now = time.monotonic()
+                wait = min((probe.deadline for probe in active.values()), default=now + 0.05) - now
+                if now_delay is not None:
+                    wait = min(wait, now_delay)
+                for key, _ in selector.select(max(0.0, wait)):
+                    sock = key.fileobj
+                    probe = active[sock]
+                    try:
+                        sock.recv(4096)
+                        state, reason = "open", "udp-response"
+                    except ConnectionRefusedError: # ICMP port unreachable
+                        state, reason = "closed", "port-unreach"
+                    except BlockingIOError:
+                        continue
+                    except OSError as e: # Other ICMP unreachable codes
+                        state, reason = "filtered", errno_name(e.errno) if e.errno else "oserror"
+                    release(sock)
+                    yield probe.host, self._result(probe.port, state, reason)
+
+                # Ports that did not answer in time
+                now = time.monotonic()
+                for sock, probe in list(active.items()):
+                    if probe.deadline > now:
+                        continue
+                    release(sock)
+                    if probe.attempt <= self.retries:
+                        waiting.appendleft(probe)
+                    else:
+                        yield probe.host, self._result(probe.port, "open|filtered", "no-response")
+        finally:
+            for sock in list(active):
+                selector.unregister(sock)
+                sock.close()
+            for family_sockets in idle.values():
+                for sock in family_sockets:
+                    sock.close()
+            selector.close()
+
+    def _result(self, port: int, state: str, reason: str) -> Dict:
+        service = self.services.lookup(port, "udp") if state in ("open", "open|filtered") else ""
+        return {"port": port, "state": state, "service": service, "reason": reason}
+
+    def _error_result(self, port: int, error: OSError) -> Dict:
+        if error.errno in RESOURCE_ERRNOS:
+            self.logger.debug(f"Out of resources scanning port {port}: {str(error)}")
+        else:
+            self.logger.error(f"Error scanning port {port}: {str(error)}")
+        return {"port": port, "state": "error", "service": "", "reason": errno_name(error.errno) if error.errno else "oserror"}
+
+def _drain(sock: socket.socket):
+    """Drop the datagrams and the ICMP error queued on a non-blocking socket"""
+    while True:
+        try:
+            sock.recv(4096)
+        except BlockingIOError: # Nothing left
+            return
+        except OSError: # ICMP error of an earlier probe, reported once
+            continue
@@ -1,52 +1,93 @@
 import argparse
+import itertools
 import sys
+import threading
+import time
 import logging
 from datetime import datetime
 from core.scanner import PortScanner
+from core.async_scanner import AsyncPortScanner
+from core.targets import TargetList, load_target_file
+from core.output import NdjsonWriter
+from core.results import ScanResultSet
+from core.timing import AdaptiveTiming
+from core.metrics import PHASES, ScanMetrics, MetricsFile, MetricsServer
+from core.state import ScanStore, SamplingPolicy, scan_spec
+from core.fingerprint import ServiceDetector
+from core.portspec import PortSet, parse_ports
+from core.resources import ResourceGovernor
+from core.sharding import DEFAULT_SHARD_SIZE, Coordinator, make_job, parse_address, plan_shards, run_local, run_workers
 
-def setup_logging(verbose: bool):
+def setup_logging(verbose: bool, stream=None):
     """Configure the logging system"""
     level = logging.DEBUG if verbose else logging.INFO
     logging.basicConfig(
         level=level,
         format='%(asctime)s - %(levelname)s - %(message)s',
         handlers=[
-            logging.StreamHandler(sys.stdout)
+            logging.StreamHandler(stream or sys.stdout)
         ]
     )
 
-def validate_ports(port_range: str) -> tuple:
-    """Validate and parse the port range argument"""
+def validate_ports(port_spec: str, protocol: str = "tcp", exclude: str = "") -> PortSet:
+    """Validate and parse the port specification and exclusion arguments"""
     try:
-        start, end = map(int, port_range.split('-'))
-        if not (0 <= start <= 65535 and 0 <= end <= 65535):
-            raise ValueError
-        if start > end:
-            start, end = end, start
-        return start, end
-    except ValueError:
+        return parse_ports(port_spec, protocol, exclude=exclude)
+    except ValueError as e:
         raise argparse.ArgumentTypeError(
-            "The range of ports must be between 0 and 65535"
+            f"Ports must be between 0 and 65535, as a list of ports, ranges, top-N and !exclusions: {str(e)}"
         )
 
+def validate_address(address: str) -> tuple:
+    """Validate and parse an ADDRESS:PORT argument"""
+    try:
+        return parse_address(address)
+    except ValueError as e:
+        raise argparse.ArgumentTypeError(str(e))
+
 def main():
     parser = argparse.ArgumentParser(
         description='Scanner ports with multithreading\n\n'
-                   'Usage: python main.py <target> [-p port-range] [-t timeout] [--threads threads] [--tcp || --udp] [-v]\n'
-                   'Example: python main.py localhost -p 80-443 -t 0.5 --threads 50 --tcp -v'
+                   'Usage: python main.py <target> [<target> ...] [-iL file] [-p ports] [--exclude-ports ports] [--randomize [--seed n]] [-t timeout] [--adaptive-timeout [--min-timeout s] [--max-timeout s] [--retries n]] [--threads threads] [--engine threads|asyncio] [--concurrency n] [--adaptive-concurrency] [--max-per-host n] [--abortive-close] [--tcp [--detect] || --udp [--udp-rate pps]] [--output text|ndjson] [--metrics-file file] [--metrics-port port] [--state-db file [--resume | --incremental [--sample-ratio r]]] [--processes n] [--coordinator addr:port] [--shard-size n] [-v]\n'
+                   '       python main.py --worker addr:port [--processes n]\n'
+                   'Example: python main.py localhost 192.168.1.0/24 -p 80-443 -t 0.5 --threads 50 --tcp -v'
     )
     
     parser.add_argument(
         'target',
-        help='IP or hostname to scan'
+        nargs='*',
+        help='IPs, hostnames or CIDR blocks to scan (Example: 10.0.0.1 example.com 10.0.1.0/24)'
+    )
+    
+    parser.add_argument(
+        '-iL', '--target-file',
+        help='File with targets to scan, separated by spaces, commas or new lines'
     )
     
     # Well known ports: 0-1023
     parser.add_argument(
         '-p', '--ports',
         default='1-1024',
-        help='Ports range (Example: 1-1024)',
-        type=validate_ports
+        help='Ports to scan: ports, ranges and top-N (most common ports), comma separated (Example: 1-1024,8080 or top-100). '
+             'Items prefixed with ! are excluded, quote them from the shell: \'top-100,!25\''
+    )
+    
+    parser.add_argument(
+        '--exclude-ports',
+        default='',
+        help='Ports to leave out, with the syntax of --ports (Example: 25,135-139)'
+    )
+    
+    parser.add_argument(
+        '--randomize',
+        action='store_true',
+        help='Probe every (host, port) pair in pseudo-random order instead of the most common ports first'
+    )
+    
+    parser.add_argument(
+        '--seed',
+        type=int,
+        help='Seed of the --randomize order, the same seed gives the same order (default: random)'
     )
     
     parser.add_argument(
@@ -56,11 +97,71 @@ def main():
         help='Timeout for socket connection (default: 1.0 second)'
     )
     
+    parser.add_argument(
+        '--adaptive-timeout',
+        action='store_true',
+        help='Derive the timeout of every host from its measured RTT, starting from --timeout'
+    )
+    
+    parser.add_argument(
+        '--min-timeout',
+        type=float,
+        default=0.05,
+        help='Lowest adaptive timeout (default: 0.05 seconds)'
+    )
+    
+    parser.add_argument(
+        '--max-timeout',
+        type=float,
+        default=None,
+        help='Highest adaptive timeout (default: same as --timeout)'
+    )
+    
+    parser.add_argument(
+        '--retries',
+        type=int,
+        default=1,
+        help='Extra attempts for probes that time out in adaptive mode (default: 1)'
+    )
+    
     parser.add_argument(
         '--threads',
         type=int,
         default=100,
-        help='Maximum number of threads (default: 100)'
+        help='Maximum number of threads, all hosts together (default: 100)'
+    )
+    
+    parser.add_argument(
+        '--engine',
+        choices=['threads', 'asyncio'],
+        default='threads',
+        help='Scan engine: one thread per probe or a single asyncio event loop, TCP only (default: threads)'
+    )
+    
+    parser.add_argument(
+        '--concurrency',
+        type=int,
+        default=5000,
+        help='Maximum number of probes in flight for the asyncio engine, all hosts together (default: 5000)'
+    )
+    
+    parser.add_argument(
+        '--adaptive-concurrency',
+        action='store_true',
+        help='Grow the probes in flight while answers are clean and shrink them on timeout spikes or local resource errors (up to --threads or --concurrency)'
+    )
+    
+    parser.add_argument(
+        '--max-per-host',
+        type=int,
+        default=None,
+        help='Maximum number of probes in flight against a single host (default: no limit)'
+    )
+    
+    parser.add_argument(
+        '--abortive-close',
+        action='store_true',
+        help='Close connections to open ports with a RST (SO_LINGER 0) instead of a FIN, so they do not hold an ephemeral port in TIME_WAIT during long sweeps'
     )
     
     parser.add_argument(
@@ -75,6 +176,118 @@ def main():
         help='Scan UDP ports'
     )
     
+    parser.add_argument(
+        '--detect',
+        action='store_true',
+        help='Identify the service and version of open TCP ports from their banner or the answer to a small probe, on the connection of the scan'
+    )
+    
+    parser.add_argument(
+        '--detect-timeout',
+        type=float,
+        default=1.0,
+        help='Time to wait for a banner, then for the answer to the probe, in --detect mode (default: 1.0 second)'
+    )
+    
+    parser.add_argument(
+        '--detect-workers',
+        type=int,
+        default=32,
+        help='Service detections running at the same time, apart from the port scan (default: 32)'
+    )
+    
+    parser.add_argument(
+        '--udp-rate',
+        type=float,
+        default=100,
+        help='UDP probes per second to a single host (default: 100, 0 for no limit). Hosts throttle their ICMP port unreachable replies, Linux to about 1 per second: faster, most closed ports are reported open|filtered'
+    )
+    
+    parser.add_argument(
+        '--output',
+        choices=['text', 'ndjson'],
+        default='text',
+        help='Output format. ndjson streams one JSON object per open port while the scan runs (default: text)'
+    )
+    
+    parser.add_argument(
+        '--metrics-file',
+        help='Write scan metrics (probes by outcome, connect latency, probes in flight, time by phase) to this file in the Prometheus text format while the scan runs'
+    )
+    
+    parser.add_argument(
+        '--metrics-port',
+        type=int,
+        default=None,
+        help='Serve scan metrics in the Prometheus text format on http://127.0.0.1:<port>/metrics while the scan runs'
+    )
+    
+    parser.add_argument(
+        '--metrics-interval',
+        type=float,
+        default=5.0,
+        help='Seconds between writes of --metrics-file (default: 5)'
+    )
+    
+    parser.add_argument(
+        '--state-db',
+        help='SQLite file where results are checkpointed while the scan runs, needed by --resume and --incremental'
+    )
+    
+    parser.add_argument(
+        '--checkpoint-interval',
+        type=float,
+        default=30.0,
+        help='Seconds between checkpoints of --state-db (default: 30)'
+    )
+    
+    state_mode = parser.add_mutually_exclusive_group()
+    state_mode.add_argument(
+        '--resume',
+        action='store_true',
+        help='Continue the last interrupted scan of the same targets and ports, skipping the probes already done'
+    )
+    
+    state_mode.add_argument(
+        '--incremental',
+        action='store_true',
+        help='Probe again the ports open in the last complete scan of the same targets and ports, then a sample of the others, and show what changed'
+    )
+    
+    parser.add_argument(
+        '--sample-ratio',
+        type=float,
+        default=0.1,
+        help='Share of the other ports probed by --incremental, on top of the 100 most common ones (default: 0.1)'
+    )
+    
+    parser.add_argument(
+        '--processes',
+        type=int,
+        help='Split the scan in shards and run them on N local processes; with --coordinator, local workers started next to it; with --worker, worker processes of this host (default: 1, no sharding)'
+    )
+    
+    parser.add_argument(
+        '--coordinator',
+        metavar='ADDRESS:PORT',
+        type=validate_address,
+        help='Hand out the shards of the scan to the workers that connect to this address (Example: 0.0.0.0:7400)'
+    )
+    
+    parser.add_argument(
+        '--worker',
+        metavar='ADDRESS:PORT',
+        type=validate_address,
+        help='Scan shards for the coordinator at this address, instead of scanning targets'
+    )
+    
+    parser.add_argument(
+        '--shard-size',
+        type=int,
+        default=DEFAULT_SHARD_SIZE,
+        help=f'Probes by shard, with --processes or --coordinator (default: {DEFAULT_SHARD_SIZE})'
+    )
+    
     parser.add_argument(
         '-v', '--verbose',
         action='store_true',
@@ -84,56 +297,273 @@ def main():
     # Add the argument to the parser
     # You access to the arguments using the args object
     args = parser.parse_args()
-    setup_logging(args.verbose)
+    # Keep stdout clean for machine readable output
+    setup_logging(args.verbose, sys.stderr if args.output == 'ndjson' else sys.stdout)
     logger = logging.getLogger(__name__)
+    exporters = [] # Metrics file writer and HTTP server, stopped when the scan ends
+    store = None # Scan state database
+    detector = None # Service detection pool
+    coordinator = None # Shard server for remote workers
     
     try:
-        scanner = PortScanner(
-            timeout=args.timeout,
-            max_threads=args.threads
-        )
+        if args.worker:
+            shards = run_workers(*args.worker, processes=args.processes or 1)
+            logger.info(f"Scanned {shards} shard(s) for {args.worker[0]}:{args.worker[1]}")
+            return
+        
+        targets = TargetList(args.target)
+        target_specs = list(args.target) # Targets as given, identify the scan in the state database
+        if args.target_file:
+            for spec in load_target_file(args.target_file):
+                targets.add(spec)
+                target_specs.append(spec)
+        if not len(targets):
+            parser.error("at least one target is required")
+        if (args.resume or args.incremental) and not args.state_db:
+            parser.error("--resume and --incremental need --state-db")
+        sharded = args.coordinator is not None or (args.processes or 1) > 1 # Scanned by other processes or hosts
+        if sharded and (args.resume or args.incremental or args.adaptive_timeout or args.engine == 'asyncio'):
+            parser.error("--processes and --coordinator do not support --resume, --incremental, --adaptive-timeout or --engine asyncio")
+        if args.engine == 'asyncio' and args.udp:
+            parser.error("--engine asyncio does not support --udp")
+        try:
+            ports = validate_ports(args.ports, "udp" if args.udp else "tcp", args.exclude_ports) # Top ports depend on the protocol
+        except argparse.ArgumentTypeError as e:
+            parser.error(f"argument -p/--ports or --exclude-ports: {str(e)}")
+        
+        timing = None
+        if args.adaptive_timeout:
+            timing = AdaptiveTiming(
+                initial_timeout=args.timeout,
+                min_timeout=args.min_timeout,
+                max_timeout=args.max_timeout,
+                retries=args.retries
+            )
+        
+        metrics = None
+        if args.metrics_file or args.metrics_port is not None:
+            metrics = ScanMetrics()
+            if args.metrics_file:
+                exporters.append(MetricsFile(metrics, args.metrics_file, args.metrics_interval).start())
+            if args.metrics_port is not None:
+                server = MetricsServer(metrics, args.metrics_port).start()
+                exporters.append(server)
+                logger.info(f"Serving metrics on http://{server.address}:{server.port}/metrics")
+        
+        # Probes in flight are capped to the open files limit and the ephemeral ports
+        governor = ResourceGovernor(abortive_close=args.abortive_close)
+        
+        if args.detect and not args.udp:
+            detector = ServiceDetector(read_timeout=args.detect_timeout, max_workers=args.detect_workers)
+        
+        if args.engine == 'asyncio':
+            scanner = AsyncPortScanner(
+                timeout=args.timeout,
+                max_concurrency=args.concurrency,
+                max_per_host=args.max_per_host,
+                timing=timing,
+                adaptive_concurrency=args.adaptive_concurrency,
+                metrics=metrics,
+                detector=detector,
+                governor=governor
+            )
+        else:
+            scanner = PortScanner(
+                timeout=args.timeout,
+                max_threads=args.threads,
+                max_per_host=args.max_per_host,
+                timing=timing,
+                adaptive_concurrency=args.adaptive_concurrency,
+                udp_rate=args.udp_rate or None,
+                metrics=metrics,
+                detector=detector,
+                governor=governor
+            )
         
         start_time = datetime.now()
-        logger.info(f"Starting scan of {args.target}")
-        logger.info(f"Ports range: {args.ports[0]}-{args.ports[1]}")
-        logger.info(f"Protocol: {'TCP' if args.tcp else 'UDP'}")
-        
-        # Scan the ports using the function located in the scanner object
-        results = scanner.scan_port_range(
-            args.target,
-            args.ports[0],
-            args.ports[1],
-            "udp" if args.udp else "tcp", # Protocol TCP or UDP. TCP by default
-        )
+        logger.info(f"Starting scan of {len(targets)} host(s)")
+        excluded = f" except {args.exclude_ports}" if args.exclude_ports else ""
+        logger.info(f"Ports: {args.ports}{excluded} ({len(ports)} per host)")
+        logger.info(f"Protocol: {'UDP' if args.udp else 'TCP'}")
+        
+        # Resolve the hostnames once, the scanner reuses the cached addresses
+        unresolved = scanner.resolve_targets(targets)
+        resolve_time = datetime.now() - start_time
+        if unresolved and len(unresolved) == len(targets):
+            sys.exit(1)
+        
+        # Scan the ports using the function located in the scanner object.
+        # Results are consumed as they arrive and packed in a compact result set
+        protocol = "udp" if args.udp else "tcp" # Protocol TCP or UDP. TCP by default
+        writer = NdjsonWriter(sys.stdout, protocol) if args.output == 'ndjson' else None
+        previous = None # Results of the last complete scan, for --incremental
+        if args.state_db:
+            store = ScanStore(args.state_db, args.checkpoint_interval)
+            spec = scan_spec(target_specs, ports)
+            results = store.start_scan(spec, protocol, "incremental" if args.incremental else "full", resume=args.resume)
+            if args.incremental:
+                previous = store.last_complete(spec, protocol)
+                if previous is None:
+                    logger.info("No complete scan of these targets and ports yet, scanning every port")
+            record = store.record
+        else:
+            results = ScanResultSet(protocol)
+            record = results.add
+        
+        scan_start = datetime.now()
+        if sharded:
+            # Every shard is scanned by a PortScanner in another process, or on another host
+            job = make_job(
+                target_specs, str(ports), protocol, exclude=unresolved, randomize=args.randomize, seed=args.seed,
+                options={
+                    "timeout": args.timeout,
+                    "max_threads": args.threads,
+                    "max_per_host": args.max_per_host,
+                    "adaptive_concurrency": args.adaptive_concurrency,
+                    "udp_rate": args.udp_rate or None,
+                    "abortive_close": args.abortive_close,
+                    "detect": args.detect,
+                    "detect_timeout": args.detect_timeout,
+                    "detect_workers": args.detect_workers,
+                },
+            )
+            shards = plan_shards(job, args.shard_size)
+            if args.coordinator:
+                coordinator = Coordinator(job, shards, *args.coordinator).start()
+                if args.processes:
+                    local = "127.0.0.1" if coordinator.address in ("", "0.0.0.0") else coordinator.address
+                    threading.Thread(
+                        target=run_workers, args=(local, coordinator.port, args.processes, governor), name="local-workers", daemon=True
+                    ).start()
+                scans = coordinator.results()
+            else:
+                scans = run_local(job, shards, args.processes, governor) # Each process gets a share of the socket limits
+        elif previous is not None:
+            # Ports open last time first, then a sample of the others
+            policy = SamplingPolicy(args.sample_ratio, seed=store.scan_id, always=scanner.services.top_ports(protocol, 100))
+            reprobe = [(host, port) for host in previous if host not in unresolved for port in previous.open_ports(host)]
+            scans = itertools.chain(
+                scanner.iter_probes(reprobe, protocol),
+                scanner.iter_targets(targets, ports, protocol, unresolved=unresolved,
+                                     exclude=lambda host, port: store.is_done(host, port) or not policy(host, port),
+                                     randomize=args.randomize, seed=args.seed),
+            )
+        else:
+            scans = scanner.iter_targets(targets, ports, protocol, unresolved=unresolved,
+                                         exclude=store.is_done if store and store.resumed else None,
+                                         randomize=args.randomize, seed=args.seed)
+        for host, result in scans:
+            output_start = time.perf_counter()
+            record(host, result)
+            if writer and result["state"] == "open":
+                writer.write(host, result)
+            if metrics:
+                metrics.add_phase("output", time.perf_counter() - output_start)
+        if store:
+            store.finish()
+        changes = results.diff(previous) if previous is not None else None
         
         # Show the results
-        open_ports = [r for r in results if r["state"] == "open"]
-        scan_time = datetime.now() - start_time
+        scan_time = datetime.now() - scan_start
+        total_time = datetime.now() - start_time
+        counts = results.counts()
+        total_open = counts.get("open", 0)
+        
+        if writer:
+            logger.info(
+                f"Scanned {len(ports)} ports on {len(targets) - len(unresolved)} host(s) in {total_time}: "
+                f"{total_open} open"
+            )
+            if timing:
+                for address, state in timing.summary().items():
+                    logger.info(f"{address}: adaptive timeout {state['timeout'] * 1000:.1f} ms")
+            if changes:
+                for host, port in changes["opened"]:
+                    logger.info(f"{host}: Port {port} opened since the last scan")
+                for host, port in changes["closed"]:
+                    logger.info(f"{host}: Port {port} closed since the last scan")
+            return
         
         print("\nResults of the scan:")
-        print(f"Target: {args.target}")
-        print(f"Total time: {scan_time}")
-        print(f"Scanned ports: {args.ports[1] - args.ports[0] + 1}")
-        print(f"Openned ports: {len(open_ports)}")
-        
-        if open_ports:
-            print("\nOpenned ports:")
-            for result in open_ports:
+        print(f"Targets: {len(targets) - len(unresolved)}")
+        print(f"Resolution time: {resolve_time}")
+        print(f"Scan time: {scan_time}")
+        print(f"Total time: {total_time}")
+        print(f"Scanned ports: {len(ports)} per host")
+        if previous is not None:
+            print(f"Probes sent: {sum(counts.values())} (incremental)")
+        print(f"Openned ports: {total_open}")
+        if args.udp:
+            print(f"Open|filtered ports: {counts.get('open|filtered', 0)}")
+        elif not sharded: # Workers count their own sockets
+            sockets = governor.counts()
+            print(
+                f"Sockets: {sockets['opened']} opened, {sockets['reset']} closed with RST, "
+                f"{sockets['failed']} failed, {sockets['max_in_use']} open at most"
+            )
+        
+        if scanner.controller:
+            stats = scanner.controller.stats
+            print(
+                f"Final concurrency: {scanner.controller.window} "
+                f"({stats['decreases']} decreases, {stats['requeued']} probes queued again)"
+            )
+        
+        if metrics:
+            phases = metrics.snapshot()["phases"]
+            print("Time by phase (all threads): " + ", ".join(
+                f"{phase} {phases[phase]['seconds']:.3f}s" for phase in PHASES if phase in phases
+            ))
+        
+        if timing:
+            print("\nAdaptive timeouts:")
+            for address, state in timing.summary().items():
                 print(
-                    f"Port {result['port']}\t"
-                    f"open\t{result['service']}"
+                    f"{address}\ttimeout {state['timeout'] * 1000:.1f} ms\t"
+                    f"srtt {state['srtt'] * 1000:.1f} ms\t"
+                    f"({state['samples']} samples)"
                 )
-                if args.tcp:
-                    logger.info("/tcp")
-                if args.udp:
-                    logger.info("/udp")
+        
+        for host in results:
+            host_open = results.open_ports(host)
+            if not host_open:
+                continue
+            print(f"\nOpenned ports on {host}:")
+            for port in host_open:
+                details = results.details(host, port)
+                print(
+                    f"Port {port}\t"
+                    f"open\t{details['service']}"
+                    + (f"\t{details['version']}" if details.get("version") else "")
+                )
+        
+        if changes is not None:
+            print(f"\nChanges since the last complete scan: {len(changes['opened'])} opened, {len(changes['closed'])} closed")
+            for host, port in changes["opened"]:
+                print(f"Opened\t{host}\tport {port}")
+            for host, port in changes["closed"]:
+                print(f"Closed\t{host}\tport {port}")
                 
     except KeyboardInterrupt:
         logger.info("Scan canceled by user")
+        if store and store.scan_id:
+            store.finish("interrupted")
+            logger.info("Results saved, continue with --resume")
         sys.exit(1)
     except Exception as e:
         logger.error(f"Error: {str(e)}")
+        if store and store.scan_id:
+            store.finish("interrupted")
         sys.exit(1)
+    finally:
+        if coordinator:
+            coordinator.stop()
+        if detector:
+            detector.shutdown()
+        for exporter in exporters:
+            exporter.stop()
+        if store:
+            store.close()
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
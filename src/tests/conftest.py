@@ -0,0 +1,16 @@
+import socket
+import pytest
+
+@pytest.fixture
+def listening_socket():
+    """Open a TCP listener on localhost"""
+    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    sock.bind(("127.0.0.1", 0))
+    sock.listen(64)
+    yield sock
+    sock.close()
+
+@pytest.fixture
+def listener(listening_socket):
+    """Port of a TCP listener on localhost"""
+    return listening_socket.getsockname()[1]
@@ -0,0 +1,82 @@
+import asyncio
+import errno
+import socket
+import pytest
+from unittest.mock import patch
+from core.async_scanner import AsyncPortScanner
+from core.resolver import Resolver
+from core.scheduler import interleave
+
+@pytest.fixture
+def scanner():
+    return AsyncPortScanner(timeout=0.5, max_concurrency=50)
+
+def test_async_scanner_initialization():
+    """Test scanner initialization with default values"""
+    scanner = AsyncPortScanner()
+    assert scanner.timeout == 1
+    assert scanner.max_concurrency == 5000
+
+def test_async_scan_open_port(scanner, listener):
+    """Test that a listening port is reported open"""
+    results = scanner.scan_port_range("127.0.0.1", listener, listener, "tcp")
+    assert len(results) == 1
+    assert results[0]["port"] == listener
+    assert results[0]["state"] == "open"
+    assert results[0]["reason"] == "syn-ack"
+
+def test_async_scan_range_sorted(scanner, listener):
+    """Test that results have the same shape as the threaded engine"""
+    results = scanner.scan_port_range("127.0.0.1", listener - 2, listener + 2, "tcp")
+    assert [r["port"] for r in results] == list(range(listener - 2, listener + 3))
+    assert all("port" in r and "state" in r and "service" in r for r in results)
+    assert listener in [r["port"] for r in results if r["state"] == "open"]
+
+def test_async_invalid_hostname(scanner):
+    """Test scanning with invalid hostname"""
+    results = scanner.scan_port_range("invalid.host.name", 80, 80, "tcp")
+    assert results[0]["state"] == "error"
+    assert results[0]["reason"] == "resolution"
+
+def test_async_invalid_protocol(scanner):
+    """Test scanning with a protocol the engine does not support"""
+    assert scanner.scan_port_range("localhost", 80, 81, "udp") == []
+
+def test_async_scan_targets(scanner, listener):
+    """Test scanning several hosts with a per-host limit"""
+    scanner.max_per_host = 1
+    results = scanner.scan_targets(["127.0.0.1", "localhost"], [listener], "tcp")
+    assert results["127.0.0.1"][0]["state"] == "open"
+    assert set(results) == {"127.0.0.1", "localhost"}
+
+def test_async_iter_scan_stops_early(scanner):
+    """Test that the event loop stops when the consumer does"""
+    results = scanner.iter_scan("127.0.0.1", 1, 65535, "tcp")
+    assert "state" in next(results)
+    results.close()
+
+def test_async_expired_names_are_not_looked_up_on_the_loop(listener):
+    """Test that the probes do not resolve names again when the cache TTL expires"""
+    Resolver.clear_cache()
+    answer = [(socket.AF_INET, socket.SOCK_STREAM, 6, "", ("127.0.0.1", 0))]
+    scanner = AsyncPortScanner(timeout=0.5, max_concurrency=10, resolver=Resolver(ttl=0))
+    with patch('socket.getaddrinfo', return_value=answer) as mock_getaddrinfo:
+        results = scanner.scan_port_range("expired.test", listener - 4, listener + 5, "tcp")
+    assert [r["state"] for r in results if r["port"] == listener] == ["open"]
+    assert mock_getaddrinfo.call_count == 2 # iter_scan, then the first probe
+    Resolver.clear_cache()
+
+def test_async_slow_host_does_not_stall_others():
+    """Test that fast hosts finish while probes of a slow host wait for its slot"""
+    scanner = AsyncPortScanner(timeout=0.5, max_concurrency=4, max_per_host=1)
+
+    async def connect(resolved, port, timeout):
+        if resolved.address == "192.0.2.1": # Slow host, answers after a while
+            await asyncio.sleep(0.2)
+        return errno.ECONNREFUSED, 0.001, None
+
+    with patch.object(scanner, "_connect", connect):
+        results = scanner.iter_probes(interleave(["192.0.2.1", "127.0.0.1"], range(1, 11)), "tcp")
+        first = [next(results) for _ in range(10)]
+        assert all(host == "127.0.0.1" for host, _ in first)
+        assert sorted(result["port"] for host, result in results) == list(range(1, 11))
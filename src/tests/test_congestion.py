@@ -0,0 +1,90 @@
+import errno
+from core.congestion import CongestionController
+from core.errors import classify_connect_errno, is_resource_error
+from core.scheduler import ProbeScheduler
+
+def result(state, reason):
+    return {"port": 1, "state": state, "service": "", "reason": reason}
+
+OPEN = result("open", "syn-ack")
+CLOSED = result("closed", "conn-refused")
+TIMEOUT = result("filtered", "no-response")
+EMFILE = result("error", "EMFILE")
+
+def test_classify_connect_errno():
+    """Test the state and reason of common connect results"""
+    assert classify_connect_errno(0) == ("open", "syn-ack")
+    assert classify_connect_errno(errno.ECONNREFUSED) == ("closed", "conn-refused")
+    assert classify_connect_errno(errno.EAGAIN) == ("filtered", "no-response")
+    assert classify_connect_errno(errno.EHOSTUNREACH) == ("filtered", "host-unreach")
+    assert classify_connect_errno(errno.EMFILE) == ("error", "EMFILE")
+    assert classify_connect_errno(errno.EADDRNOTAVAIL) == ("error", "EADDRNOTAVAIL")
+
+def test_is_resource_error():
+    """Test which results count as local resource exhaustion"""
+    assert is_resource_error(EMFILE)
+    assert not is_resource_error(CLOSED)
+    assert not is_resource_error(result("error", "resolution"))
+
+def test_window_grows_on_clean_answers():
+    """Test slow start up to the maximum"""
+    controller = CongestionController(maximum=50, initial=5)
+    for _ in range(100):
+        controller.record(CLOSED)
+    assert controller.window == 50
+
+def test_resource_error_halves_window_once_per_window():
+    """Test that a burst of EMFILE is a single congestion event"""
+    controller = CongestionController(maximum=100, initial=40)
+    assert controller.record(EMFILE) is True
+    assert controller.window == 20
+    for _ in range(10):
+        controller.record(EMFILE)
+    assert controller.window == 20
+    assert controller.stats["requeued"] == 11
+
+def test_window_never_below_minimum():
+    """Test the lower bound of the window"""
+    controller = CongestionController(maximum=100, minimum=4, initial=5)
+    for _ in range(200):
+        controller.record(EMFILE)
+    assert controller.window == 4
+
+def test_timeout_spike_shrinks_window():
+    """Test that timeouts jumping above their usual level shrink the window"""
+    controller = CongestionController(maximum=100, initial=100)
+    for _ in range(200):
+        controller.record(CLOSED)
+    for _ in range(5):
+        controller.record(TIMEOUT)
+    assert controller.window < 100
+
+def test_steady_timeouts_do_not_shrink_window():
+    """Test that a host that always drops does not collapse the window"""
+    controller = CongestionController(maximum=100, initial=100)
+    for _ in range(200):
+        controller.record(TIMEOUT)
+    assert controller.window == 100
+
+def test_scheduler_requeues_resource_errors():
+    """Test that ports failing with EMFILE are scanned again, not reported"""
+    calls = {}
+
+    def probe(host, port):
+        calls[port] = calls.get(port, 0) + 1
+        if port == 7 and calls[port] == 1:
+            return dict(EMFILE, port=port)
+        return dict(CLOSED, port=port)
+
+    scheduler = ProbeScheduler(probe, max_in_flight=4, controller=CongestionController(maximum=4))
+    results = list(scheduler.run(("h", port) for port in range(10)))
+    assert len(results) == 10
+    assert all(r["state"] == "closed" for _, r in results)
+    assert calls[7] == 2
+
+def test_scheduler_gives_up_after_max_requeues():
+    """Test that persistent resource errors are finally reported"""
+    scheduler = ProbeScheduler(lambda host, port: dict(EMFILE, port=port), max_in_flight=2,
+                               controller=CongestionController(maximum=2), max_requeues=2)
+    results = list(scheduler.run([("h", 1)]))
+    assert [r["reason"] for _, r in results] == ["EMFILE"]
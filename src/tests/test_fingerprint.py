@@ -0,0 +1,95 @@
+import socket
+import threading
+from concurrent.futures import Future
+import pytest
+from core.async_scanner import AsyncPortScanner
+from core.fingerprint import ServiceDetector, SignatureMatcher, Signature, get_default_matcher
+from core.scanner import PortScanner
+from core.scheduler import ProbeScheduler
+
+@pytest.fixture
+def banner_server():
+    """Serve a banner on localhost to every connection and return the port"""
+    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    sock.bind(("127.0.0.1", 0))
+    sock.listen(16)
+
+    def serve():
+        while True:
+            try:
+                conn, _ = sock.accept()
+            except OSError:
+                return
+            conn.sendall(b"SSH-2.0-OpenSSH_9.6\r\n")
+            conn.close()
+
+    threading.Thread(target=serve, daemon=True).start()
+    yield sock.getsockname()[1]
+    sock.close()
+
+def test_match_ssh_version():
+    """Test that the version group is reported"""
+    assert get_default_matcher().match(b"SSH-2.0-OpenSSH_9.6p1 Ubuntu-3\r\n") == {
+        "service": "ssh", "version": "OpenSSH_9.6p1 Ubuntu-3"
+    }
+
+def test_match_http_server_header():
+    """Test that the Server header gives the version of an HTTP service"""
+    answer = b"HTTP/1.1 404 Not Found\r\nDate: now\r\nServer: Apache/2.4.58\r\n\r\n"
+    assert get_default_matcher().match(answer) == {"service": "http", "version": "Apache/2.4.58"}
+    assert get_default_matcher().match(b"HTTP/1.0 200 OK\r\n\r\n") == {"service": "http"}
+
+def test_match_redis_and_unknown():
+    """Test a probe answer and an answer no signature knows"""
+    assert get_default_matcher().match(b"-NOAUTH Authentication required.\r\n") == {"service": "redis"}
+    assert get_default_matcher().match(b"hello\r\n") is None
+
+def test_first_signature_wins():
+    """Test that signatures are tried in order"""
+    matcher = SignatureMatcher([Signature("first", rb"ab"), Signature("second", rb"a(?P<version>b)")])
+    assert matcher.match(b"abc") == {"service": "first"}
+
+def test_detector_reads_banner(banner_server):
+    """Test detection on a connected socket, which is closed afterwards"""
+    sock = socket.create_connection(("127.0.0.1", banner_server))
+    result = ServiceDetector(read_timeout=1).detect(sock, {"port": banner_server, "state": "open", "service": ""})
+    assert result["service"] == "ssh"
+    assert result["version"] == "OpenSSH_9.6"
+    assert result["banner"].startswith("SSH-2.0")
+    assert sock.fileno() == -1
+
+def test_scanner_detects_on_scan_connection(banner_server):
+    """Test that the threaded engine reports the detected service"""
+    detector = ServiceDetector(read_timeout=1)
+    scanner = PortScanner(timeout=0.5, max_threads=4, detector=detector)
+    results = scanner.scan_port_range("127.0.0.1", banner_server - 1, banner_server + 1, "tcp")
+    detector.shutdown()
+    assert [r["port"] for r in results] == [banner_server - 1, banner_server, banner_server + 1]
+    opened = [r for r in results if r["state"] == "open"]
+    assert opened[0]["service"] == "ssh"
+    assert opened[0]["version"] == "OpenSSH_9.6"
+
+def test_async_scanner_detects_on_scan_connection(banner_server):
+    """Test that the asyncio engine reports the detected service"""
+    detector = ServiceDetector(read_timeout=1)
+    scanner = AsyncPortScanner(timeout=0.5, max_concurrency=10, detector=detector)
+    results = scanner.scan_port_range("127.0.0.1", banner_server, banner_server, "tcp")
+    detector.shutdown()
+    assert results[0]["service"] == "ssh"
+    assert results[0]["version"] == "OpenSSH_9.6"
+
+def test_scheduler_yields_deferred_results():
+    """Test that results completed on another pool are yielded"""
+    futures = []
+
+    def probe(host, port):
+        if port % 2:
+            return {"port": port}
+        future = Future()
+        futures.append(future)
+        threading.Timer(0.01, future.set_result, [{"port": port, "deferred": True}]).start()
+        return future
+
+    results = list(ProbeScheduler(probe, max_in_flight=2, max_deferred=2).run(("h", port) for port in range(10)))
+    assert sorted(r["port"] for _, r in results) == list(range(10))
+    assert sum(1 for _, r in results if r.get("deferred")) == 5
@@ -0,0 +1,31 @@
+from benchmarks.loopback import LoopbackTargets, run_benchmark, compare, percentile
+
+def test_loopback_targets_and_run():
+    """Test a small benchmark run against the stand-in targets"""
+    with LoopbackTargets("127.0.0.2", 23000, 23099, open_every=10, blackhole_every=50) as targets:
+        run = run_benchmark(targets, timeout=0.1, threads=20)
+    assert run["probes"] == 100
+    assert run["mismatches"] == 0
+    assert run["states"]["open"] == len(targets.open_ports)
+    assert run["states"]["filtered"] == len(targets.blackhole_ports) == 2
+    assert run["probes_per_sec"] > 0
+    assert run["latency_p99_ms"] >= run["latency_p50_ms"]
+    assert run["peak_threads"] > 1
+
+def test_percentile():
+    """Test nearest-rank percentiles"""
+    values = list(range(1, 101))
+    assert percentile(values, 0.5) == 50
+    assert percentile(values, 0.99) == 99
+    assert percentile([], 0.5) == 0.0
+
+def test_compare_reports_regressions():
+    """Test that slower runs are reported and faster ones are not"""
+    baseline_run = {
+        "ports": "1-10", "timeout": 0.1, "threads": 10, "probes_per_sec": 1000.0,
+        "latency_p99_ms": 5.0, "peak_rss_mb": 20.0, "peak_threads": 12, "mismatches": 0,
+    }
+    baseline = {"ports=1-10,timeout=0.1,threads=10": baseline_run}
+    assert compare([dict(baseline_run, probes_per_sec=1100.0)], baseline) == []
+    regressions = compare([dict(baseline_run, probes_per_sec=500.0, latency_p99_ms=9.0)], baseline)
+    assert len(regressions) == 2
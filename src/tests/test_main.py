@@ -2,15 +2,16 @@ import pytest
 from unittest.mock import patch
 import sys
 from main import validate_ports, setup_logging
+from core.portspec import PortSet
 import argparse
 import logging
 
 def test_validate_ports_valid_range():
     """Test valid port range validation"""
-    assert validate_ports("80-443") == (80, 443)
-    assert validate_ports("1-65535") == (1, 65535)
+    assert validate_ports("80-443") == PortSet([(80, 443)])
+    assert validate_ports("1-65535") == PortSet([(1, 65535)])
     # Test auto-correction of reversed range
-    assert validate_ports("443-80") == (80, 443)
+    assert validate_ports("443-80") == PortSet([(80, 443)])
 
 def test_validate_ports_invalid_range():
     """Test invalid port range validation"""
@@ -37,25 +38,76 @@ def test_setup_logging_info():
 def mock_args():
     """Fixture to create mock command line arguments"""
     class Args:
-        target = "localhost"
-        ports = (80, 443)
+        target = ["localhost"]
+        target_file = None
+        ports = "80-443"
+        exclude_ports = ""
+        randomize = False
+        seed = None
         timeout = 1.0
+        adaptive_timeout = False
+        min_timeout = 0.05
+        max_timeout = None
+        retries = 1
         threads = 100
+        engine = "threads"
+        concurrency = 5000
+        adaptive_concurrency = False
+        max_per_host = None
+        abortive_close = False
         tcp = True
         udp = False
+        udp_rate = 100
+        detect = False
+        detect_timeout = 1.0
+        detect_workers = 32
+        output = "text"
+        metrics_file = None
+        metrics_port = None
+        metrics_interval = 5.0
+        state_db = None
+        checkpoint_interval = 30.0
+        resume = False
+        incremental = False
+        sample_ratio = 0.1
+        processes = None
+        coordinator = None
+        worker = None
+        shard_size = 4096
         verbose = False
     return Args()
 
+@patch('main.PortScanner')
 @patch('argparse.ArgumentParser.parse_args')
-def test_main_argument_parsing(mock_parse_args, mock_args):
-    """Test command line argument parsing"""
+def test_main_argument_parsing(mock_parse_args, mock_scanner, mock_args):
+    """Test command line arguments reach the scanner"""
     mock_parse_args.return_value = mock_args
+    scanner = mock_scanner.return_value
+    scanner.resolve_targets.return_value = set()
+    scanner.iter_targets.return_value = iter([])
+    scanner.controller = None
     from main import main
-    
-    # This will raise SystemExit if argument parsing fails
+
+    main()  # Would raise SystemExit on any error
+
+    scanner.iter_targets.assert_called_once()
+    targets, ports, protocol = scanner.iter_targets.call_args[0][:3]
+    assert list(targets) == ["localhost"]
+    assert ports == PortSet([(80, 443)])
+    assert protocol == "tcp"
+
+@patch('argparse.ArgumentParser.parse_args')
+def test_main_asyncio_engine_rejects_udp(mock_parse_args, mock_args):
+    """Test the asyncio engine is not silently replaced for UDP scans"""
+    mock_args.engine = "asyncio"
+    mock_args.tcp = False
+    mock_args.udp = True
+    mock_parse_args.return_value = mock_args
+    from main import main
+
     with pytest.raises(SystemExit) as pytest_wrapped_e:
         main()
-    assert pytest_wrapped_e.type == SystemExit
+    assert pytest_wrapped_e.value.code == 2
 
 def test_main_keyboard_interrupt():
     """Test handling of keyboard interrupt"""
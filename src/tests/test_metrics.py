@@ -0,0 +1,52 @@
+import urllib.request
+from core.metrics import Histogram, ScanMetrics, MetricsFile, MetricsServer
+from core.scanner import PortScanner
+
+def test_histogram_buckets():
+    """Test cumulative buckets and quantiles"""
+    histogram = Histogram((0.1, 1.0))
+    for value in (0.05, 0.1, 0.5, 3.0):
+        histogram.observe(value)
+    assert histogram.cumulative() == [(0.1, 2), (1.0, 3), (float("inf"), 4)]
+    assert histogram.quantile(0.5) == 0.1
+    assert histogram.count == 4
+
+def test_scanner_feeds_metrics(listener):
+    """Test counters, latency and phases of a TCP scan"""
+    metrics = ScanMetrics()
+    scanner = PortScanner(timeout=0.5, max_threads=10, metrics=metrics)
+    scanner.scan_port_range("127.0.0.1", listener, listener + 1, "tcp")
+    snapshot = metrics.snapshot()
+    assert snapshot["probes"]["tcp/open/syn-ack"] == 1
+    assert snapshot["in_flight"] == 0
+    assert snapshot["max_in_flight"] >= 1
+    assert snapshot["connect_latency"]["count"] == 2
+    assert {"resolve", "connect", "service"} <= set(snapshot["phases"])
+    assert metrics.finished is not None
+
+def test_hooks_get_events(listener):
+    """Test that hooks see every probe and that a broken hook is ignored"""
+    events = []
+    metrics = ScanMetrics()
+    metrics.add_hook(lambda event, fields: events.append(event))
+    metrics.add_hook(lambda event, fields: 1 / 0)
+    PortScanner(metrics=metrics).scan_tcp_port("127.0.0.1", listener)
+    assert events.count("probe_started") == events.count("probe_finished") == 1
+    assert "phase" in events
+
+def test_prometheus_file_and_server(tmp_path):
+    """Test the text format through the file writer and the HTTP endpoint"""
+    metrics = ScanMetrics()
+    metrics.probe_finished("h", {"port": 1, "state": "closed", "reason": "conn-refused"}, protocol="udp")
+    path = tmp_path / "scan.prom"
+    MetricsFile(metrics, str(path)).stop()
+    text = path.read_text()
+    assert 'portscan_probes_total{protocol="udp",state="closed",reason="conn-refused"} 1' in text
+    assert 'portscan_connect_seconds_bucket{le="+Inf"} 0' in text
+
+    server = MetricsServer(metrics, 0).start()
+    try:
+        with urllib.request.urlopen(f"http://127.0.0.1:{server.port}/metrics") as response:
+            assert response.read().decode() == metrics.render_prometheus()
+    finally:
+        server.stop()
@@ -0,0 +1,25 @@
+import io
+import json
+from core.output import NdjsonWriter
+
+def test_ndjson_one_object_per_line():
+    """Test that every result is written as a JSON line"""
+    stream = io.StringIO()
+    writer = NdjsonWriter(stream, "tcp")
+    writer.write("10.0.0.1", {"port": 22, "state": "open", "service": "ssh"})
+    writer.write("10.0.0.2", {"port": 80, "state": "open", "service": "http"})
+    lines = stream.getvalue().splitlines()
+    assert [json.loads(line) for line in lines] == [
+        {"host": "10.0.0.1", "protocol": "tcp", "port": 22, "state": "open", "service": "ssh"},
+        {"host": "10.0.0.2", "protocol": "tcp", "port": 80, "state": "open", "service": "http"},
+    ]
+
+def test_ndjson_flushes_every_line():
+    """Test that lines are visible before the scan finishes"""
+    class Stream(io.StringIO):
+        flushes = 0
+        def flush(self):
+            self.flushes += 1
+    stream = Stream()
+    NdjsonWriter(stream, "udp").write("localhost", {"port": 53, "state": "open", "service": "domain"})
+    assert stream.flushes == 1
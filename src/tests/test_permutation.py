@@ -0,0 +1,43 @@
+from core.permutation import CyclicPermutation, is_prime, next_prime, primitive_root
+
+def test_primes():
+    """Test primality against a sieve"""
+    sieve = [n for n in range(2, 2000) if all(n % d for d in range(2, int(n ** 0.5) + 1))]
+    assert [n for n in range(2000) if is_prime(n)] == sieve
+    assert next_prime(65536) == 65537
+    assert is_prime(2 ** 61 - 1)
+
+def test_primitive_root_generates_the_group():
+    """Test that the powers of the root are every element"""
+    for prime in (2, 3, 5, 101, 65537):
+        root = primitive_root(prime)
+        element, seen = 1, set()
+        for _ in range(prime - 1):
+            element = element * root % prime
+            seen.add(element)
+        assert seen == set(range(1, prime))
+
+def test_permutation_visits_every_index_once():
+    """Test every size, including the empty and single index cases"""
+    for size in (0, 1, 2, 3, 10, 1000, 4097):
+        order = list(CyclicPermutation(size, seed=size))
+        assert sorted(order) == list(range(size))
+
+def test_permutation_order():
+    """Test that the order depends on the seed only and is not sequential"""
+    assert list(CyclicPermutation(1000, seed=1)) == list(CyclicPermutation(1000, seed=1))
+    assert list(CyclicPermutation(1000, seed=1)) != list(CyclicPermutation(1000, seed=2))
+    assert list(CyclicPermutation(1000, seed=1)) != list(range(1000))
+
+def test_large_permutation_starts_immediately():
+    """Test that a multi-billion index space is walked lazily"""
+    walk = iter(CyclicPermutation(256 * 65536 * 1000, seed=7))
+    first = [next(walk) for _ in range(1000)]
+    assert len(set(first)) == 1000
+    assert all(0 <= index < 256 * 65536 * 1000 for index in first)
+
+def test_walk_parts_make_the_whole_permutation():
+    """Test that consecutive parts of the walk join into the full order"""
+    permutation = CyclicPermutation(1000, seed=5)
+    parts = [list(permutation.walk(first, first + 97)) for first in range(0, permutation.steps, 97)]
+    assert [index for part in parts for index in part] == list(permutation)
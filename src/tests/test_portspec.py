@@ -0,0 +1,48 @@
+import pytest
+from core.portspec import PortSet, parse_ports
+from core.services import get_service_registry
+
+def test_ranges_are_merged():
+    """Test that overlapping and adjacent ranges become one"""
+    ports = PortSet([(80, 90), (85, 100), (101, 110), (22, 22)])
+    assert ports.ranges() == [(22, 22), (80, 110)]
+    assert len(ports) == 32
+    assert str(ports) == "22,80-110"
+
+def test_index_and_membership():
+    """Test access by index and membership without expanding the ranges"""
+    ports = parse_ports("1-1000,2000-65535")
+    assert len(ports) == 64536
+    assert ports[0] == 1
+    assert ports[999] == 1000
+    assert ports[1000] == 2000
+    assert ports[-1] == 65535
+    assert 1500 not in ports and 2000 in ports and 0 not in ports
+    with pytest.raises(IndexError):
+        ports[64536]
+    assert list(parse_ports("5,3,1-2")) == [1, 2, 3, 5]
+
+def test_exclusions():
+    """Test that exclusions apply to every item, wherever they are"""
+    assert str(parse_ports("!139,1-1024,!135-137")) == "1-134,138,140-1024"
+    assert str(parse_ports("!1-65535")) == "0"
+
+def test_exclude_argument():
+    """Test exclusions given apart, without the ! prefix"""
+    assert str(parse_ports("1-1024", exclude="139,135-137")) == "1-134,138,140-1024"
+    assert parse_ports("top-10", exclude="80") == parse_ports("top-10,!80")
+    with pytest.raises(ValueError):
+        parse_ports("1-10", exclude="1-10")
+
+def test_top_ports():
+    """Test top-N by protocol"""
+    registry = get_service_registry()
+    assert parse_ports("top-10") == PortSet.from_ports(registry.top_ports("tcp", 10))
+    assert parse_ports("top-10", "udp") == PortSet.from_ports(registry.top_ports("udp", 10))
+    assert 80 not in parse_ports("top-10,!80")
+
+@pytest.mark.parametrize("spec", ["", "abc", "1-2-3", "70000", "-1-100", "top-0", "top-x", "!0-65535", "1,,x"])
+def test_invalid_specs(spec):
+    """Test malformed and empty specifications"""
+    with pytest.raises(ValueError):
+        parse_ports(spec)
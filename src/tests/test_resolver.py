@@ -0,0 +1,66 @@
+import socket
+import pytest
+from unittest.mock import patch
+from core.resolver import Resolver, ResolvedTarget
+
+@pytest.fixture(autouse=True)
+def clear_cache():
+    Resolver.clear_cache()
+    yield
+    Resolver.clear_cache()
+
+def test_resolve_ip_literal():
+    """Test that IP literals skip the system resolver"""
+    with patch('socket.getaddrinfo') as mock_getaddrinfo:
+        resolved = Resolver().resolve("127.0.0.1")
+    assert resolved == ResolvedTarget("127.0.0.1", socket.AF_INET, "127.0.0.1")
+    mock_getaddrinfo.assert_not_called()
+
+def test_resolve_ipv6_literal():
+    """Test that IPv6 literals keep their family"""
+    assert Resolver().resolve("::1").family == socket.AF_INET6
+
+def test_resolve_is_cached_across_instances():
+    """Test that a hostname is looked up once for every resolver"""
+    answer = [(socket.AF_INET, socket.SOCK_STREAM, 6, "", ("10.0.0.1", 0))]
+    with patch('socket.getaddrinfo', return_value=answer) as mock_getaddrinfo:
+        first = Resolver().resolve("example.test")
+        second = Resolver().resolve("example.test")
+    assert first == second == ResolvedTarget("example.test", socket.AF_INET, "10.0.0.1")
+    assert mock_getaddrinfo.call_count == 1
+
+def test_resolve_prefers_ipv4():
+    """Test that IPv4 answers win over IPv6 ones"""
+    answer = [
+        (socket.AF_INET6, socket.SOCK_STREAM, 6, "", ("::1", 0, 0, 0)),
+        (socket.AF_INET, socket.SOCK_STREAM, 6, "", ("127.0.0.1", 0)),
+    ]
+    with patch('socket.getaddrinfo', return_value=answer):
+        assert Resolver().resolve("dual.test").address == "127.0.0.1"
+
+def test_negative_cache():
+    """Test that failed lookups are cached and raised again"""
+    error = socket.gaierror(socket.EAI_NONAME, "Name or service not known")
+    with patch('socket.getaddrinfo', side_effect=error) as mock_getaddrinfo:
+        resolver = Resolver()
+        for _ in range(3):
+            with pytest.raises(socket.gaierror):
+                resolver.resolve("missing.test")
+    assert mock_getaddrinfo.call_count == 1
+
+def test_expired_entries_are_refreshed():
+    """Test that entries are looked up again after their TTL"""
+    answer = [(socket.AF_INET, socket.SOCK_STREAM, 6, "", ("10.0.0.1", 0))]
+    with patch('socket.getaddrinfo', return_value=answer) as mock_getaddrinfo:
+        resolver = Resolver(ttl=0)
+        resolver.resolve("example.test")
+        resolver.resolve("example.test")
+    assert mock_getaddrinfo.call_count == 2
+
+@pytest.mark.parametrize("name", ["foo..bar", "a" * 64 + ".test"])
+def test_malformed_name_is_a_resolution_error(name):
+    """Test that names the idna codec rejects fail like unknown names, and are cached"""
+    resolver = Resolver()
+    with pytest.raises(socket.gaierror):
+        resolver.resolve(name)
+    assert resolver.resolve_all(["127.0.0.1", name]) == {name}
@@ -0,0 +1,104 @@
+import socket
+import pytest
+from core import resources
+from core.resources import ResourceGovernor, ephemeral_port_range, time_wait_sockets
+from core.scanner import PortScanner
+
+TCP_HEADER = "  sl  local_address rem_address   st tx_queue rx_queue tr tm->when retrnsmt   uid  timeout inode\n"
+
+def tcp_line(local_port: int, state: str) -> str:
+    return f"   0: 0100007F:{local_port:04X} 0100007F:0050 {state} 00000000:00000000 00:00000000 00000000     0        0 0\n"
+
+@pytest.fixture
+def proc(tmp_path):
+    """Port range of 200 ports and 40 sockets in TIME_WAIT on it"""
+    port_range = tmp_path / "ip_local_port_range"
+    port_range.write_text("40000\t40199\n")
+    tcp = tmp_path / "tcp"
+    tcp.write_text(TCP_HEADER + "".join(tcp_line(40000 + i, "06") for i in range(30)) + tcp_line(40100, "01"))
+    tcp6 = tmp_path / "tcp6"
+    # Server side TIME_WAIT on :443 and :80, outside of the ephemeral range
+    tcp6.write_text(TCP_HEADER + "".join(tcp_line(40150 + i, "06") for i in range(10)) + tcp_line(443, "06") * 500 + tcp_line(80, "06"))
+    return str(port_range), (str(tcp), str(tcp6))
+
+def test_read_proc_files(proc, tmp_path):
+    """Test the port range and TIME_WAIT count, and their fallbacks"""
+    port_range, tcp_tables = proc
+    assert ephemeral_port_range(port_range) == (40000, 40199)
+    assert time_wait_sockets((40000, 40199), tcp_tables) == 40
+    assert time_wait_sockets((1, 1024), tcp_tables) == 501
+    (tmp_path / "bad").write_text("garbage")
+    assert ephemeral_port_range(str(tmp_path / "bad")) == resources.DEFAULT_PORT_RANGE
+    assert time_wait_sockets((40000, 40199), [str(tmp_path / "missing")]) == 0
+
+def test_cap_by_ephemeral_ports(proc):
+    """Test that half of the free ephemeral ports are left for TIME_WAIT"""
+    governor = ResourceGovernor(port_range_path=proc[0], tcp_table_paths=proc[1])
+    assert governor.max_in_flight(1000) == 80
+    assert governor.max_in_flight(10) == 10
+
+def test_time_wait_read_once(proc, monkeypatch, caplog):
+    """Test that the sockets in TIME_WAIT are read and warned about once per governor"""
+    reads = []
+    monkeypatch.setattr(resources, "time_wait_sockets", lambda *args: reads.append(args) or 40)
+    governor = ResourceGovernor(port_range_path=proc[0], tcp_table_paths=proc[1])
+    with caplog.at_level("WARNING", logger="core.resources"):
+        assert governor.max_in_flight(1000) == 80
+        assert governor.max_in_flight(1000) == 80
+        assert governor.max_in_flight(10) == 10
+    assert len(reads) == 1
+    assert [record.getMessage() for record in caplog.records] == ["160 ephemeral ports free, probes in flight capped to 80"]
+
+def test_share_splits_limits(proc):
+    """Test that sharded processes each get a part of the ports and files"""
+    governor = ResourceGovernor(port_range_path=proc[0], tcp_table_paths=proc[1])
+    governor.fd_limits = (100, 1000)
+    limits = governor.share(4)
+    assert limits == {"free_ports": 40, "max_fds": 250}
+    worker = ResourceGovernor(reserved_fds=10, tcp_table_paths=["missing"], **limits)
+    worker.fd_limits = None
+    assert worker.max_in_flight(1000) == 20
+    assert worker.max_in_flight(1000, extra_fds=225) == resources.MIN_IN_FLIGHT
+
+def test_cap_has_a_floor(proc, tmp_path):
+    """Test that a scan is never capped below MIN_IN_FLIGHT probes"""
+    port_range = tmp_path / "small_range"
+    port_range.write_text("40000 40019\n")
+    governor = ResourceGovernor(port_range_path=str(port_range), tcp_table_paths=proc[1])
+    assert governor.max_in_flight(1000) == resources.MIN_IN_FLIGHT
+    assert governor.max_in_flight(4) == 4
+
+def test_cap_by_open_files(proc, monkeypatch):
+    """Test that the soft limit is raised up to the hard one, then caps"""
+    monkeypatch.setattr(resources, "count_open_fds", lambda: 10)
+    calls = []
+    monkeypatch.setattr(resources.resource, "setrlimit", lambda kind, limits: calls.append(limits))
+    governor = ResourceGovernor(reserved_fds=10, tcp_table_paths=proc[1])
+    governor.fd_limits = (100, 150)
+    assert governor.max_in_flight(50) == 50
+    assert calls == []
+    assert governor.max_in_flight(200, extra_fds=20) == 110
+    assert calls == [(150, 150)]
+    assert governor.fd_limits == (150, 150)
+
+def test_abortive_close(listening_socket):
+    """Test that a connected socket is reset and counted"""
+    governor = ResourceGovernor(abortive_close=True)
+    sock = governor.open(socket.AF_INET)
+    sock.connect(listening_socket.getsockname())
+    accepted, _ = listening_socket.accept()
+    governor.close(sock, connected=True)
+    with pytest.raises(ConnectionResetError):
+        accepted.recv(1)
+    accepted.close()
+    assert governor.counts() == {"opened": 1, "closed": 1, "reset": 1, "failed": 0, "in_use": 0, "max_in_use": 1}
+
+def test_scanner_sockets_are_counted(listener):
+    """Test that every probe socket goes through the governor"""
+    governor = ResourceGovernor()
+    scanner = PortScanner(timeout=0.5, max_threads=4, governor=governor)
+    results = scanner.scan_port_range("127.0.0.1", listener - 2, listener + 2, "tcp")
+    assert len(results) == 5
+    counts = governor.counts()
+    assert counts["opened"] == counts["closed"] == 5
+    assert counts["in_use"] == 0
@@ -0,0 +1,96 @@
+import sys
+from core.results import ScanResultSet
+
+def result(port, state, service=""):
+    return {"port": port, "state": state, "service": service}
+
+def test_states_and_counts():
+    """Test that states are stored and counted by host and overall"""
+    results = ScanResultSet()
+    results.add("10.0.0.1", result(22, "open", "ssh"))
+    results.add("10.0.0.1", result(23, "closed"))
+    results.add("10.0.0.1", result(24, "filtered"))
+    results.add("10.0.0.2", result(22, "closed"))
+    assert results.state("10.0.0.1", 22) == "open"
+    assert results.state("10.0.0.1", 24) == "filtered"
+    assert results.state("10.0.0.1", 25) == ""
+    assert results.counts("10.0.0.1") == {"open": 1, "closed": 1, "filtered": 1}
+    assert results.counts() == {"open": 1, "closed": 2, "filtered": 1}
+
+def test_open_ports_keep_details():
+    """Test that open ports keep their service and reason"""
+    results = ScanResultSet()
+    results.add("h", {"port": 443, "state": "open", "service": "https", "reason": "syn-ack"})
+    results.add("h", {"port": 80, "state": "open", "service": "http", "reason": "syn-ack"})
+    results.add("h", {"port": 81, "state": "closed", "service": "", "reason": "conn-refused"})
+    assert results.open_ports("h") == [80, 443]
+    assert results.details("h", 443) == {"service": "https", "reason": "syn-ack"}
+    assert results.details("h", 81) == {}
+
+def test_state_overwrite():
+    """Test that a later result for the same port replaces the earlier one"""
+    results = ScanResultSet()
+    results.add("h", result(80, "open", "http"))
+    results.add("h", result(80, "closed"))
+    assert results.open_ports("h") == []
+    assert results.counts("h") == {"closed": 1}
+
+def test_sparse_ports_grow_both_ways():
+    """Test ports far apart and in descending order"""
+    results = ScanResultSet()
+    for port in (65535, 1, 30000, 0):
+        results.add("h", result(port, "closed"))
+    assert results.ports("h", "closed") == [0, 1, 30000, 65535]
+    assert results.counts("h") == {"closed": 4}
+
+def test_lazy_view_matches_dicts():
+    """Test that a host view looks like the list returned by scan_targets"""
+    results = ScanResultSet()
+    results.add("h", result(3, "closed"))
+    results.add("h", result(1, "open", "tcpmux"))
+    view = results["h"]
+    expected = [result(1, "open", "tcpmux"), result(3, "closed")]
+    assert len(view) == 2
+    assert view == expected
+    assert view[-1] == expected[-1]
+    assert dict(results) == {"h": expected}
+    assert results.to_dict() == {"h": expected}
+
+def test_diff():
+    """Test opened and closed ports against a previous scan"""
+    before = ScanResultSet()
+    before.add("h", result(22, "open"))
+    before.add("h", result(80, "open"))
+    before.add("h", result(443, "closed"))
+    after = ScanResultSet()
+    after.add("h", result(22, "open"))
+    after.add("h", result(80, "closed"))
+    after.add("h", result(443, "open"))
+    after.add("new", result(8080, "open"))
+    assert after.diff(before) == {"opened": [("h", 443), ("new", 8080)], "closed": [("h", 80)]}
+
+def test_diff_ignores_ports_not_rescanned():
+    """Test that a partial scan does not report skipped ports as closed"""
+    before = ScanResultSet()
+    before.add("h", result(22, "open"))
+    after = ScanResultSet()
+    after.add("h", result(80, "closed"))
+    assert after.diff(before) == {"opened": [], "closed": []}
+
+def test_full_range_is_compact():
+    """Test that a full range scan of a host stays a few tens of KB"""
+    results = ScanResultSet()
+    for port in range(65536):
+        results.add("h", result(port, "closed"))
+    assert len(results["h"]) == 65536
+    assert sys.getsizeof(results._hosts["h"].data) < 40 * 1024
+
+def test_export_import_host():
+    """Test that packed states survive a round trip"""
+    results = ScanResultSet()
+    results.add("h", result(22, "open", "ssh"))
+    results.add("h", result(1000, "filtered"))
+    restored = ScanResultSet()
+    restored.import_host("h", *results.export_host("h"))
+    assert restored.to_dict() == results.to_dict()
+    assert restored.counts() == {"open": 1, "filtered": 1}
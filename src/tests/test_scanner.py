@@ -1,6 +1,9 @@
 import pytest
 from unittest.mock import patch, MagicMock
+import socket
 from core.scanner import PortScanner
+from core.resolver import Resolver, ResolvedTarget
+from core.portspec import parse_ports
 
 @pytest.fixture
 def scanner():
@@ -37,7 +40,7 @@ def test_tcp_scan_open_port(mock_socket, scanner):
     # Configure mock
     mock_sock = MagicMock()
     mock_sock.connect_ex.return_value = 0
-    mock_socket.return_value.__enter__.return_value = mock_sock
+    mock_socket.return_value = mock_sock
     
     result = scanner.scan_tcp_port("localhost", 80)
     assert result["state"] == "open"
@@ -49,7 +52,7 @@ def test_tcp_scan_closed_port(mock_socket, scanner):
     # Configure mock
     mock_sock = MagicMock()
     mock_sock.connect_ex.return_value = 1
-    mock_socket.return_value.__enter__.return_value = mock_sock
+    mock_socket.return_value = mock_sock
     
     result = scanner.scan_tcp_port("localhost", 80)
     assert result["state"] == "closed"
@@ -64,4 +67,72 @@ def test_concurrent_scanning(scanner):
     """Test concurrent port scanning"""
     results = scanner.scan_port_range("localhost", 80, 85, "tcp")
     assert len(results) == 6  # Should have results for all ports
-    assert all(isinstance(r, dict) for r in results)
\ No newline at end of file
+    assert all(isinstance(r, dict) for r in results)
+
+@patch('socket.getaddrinfo')
+def test_scan_port_range_resolves_once(mock_getaddrinfo, scanner):
+    """Test that a range scan does a single lookup for a hostname"""
+    Resolver.clear_cache()
+    mock_getaddrinfo.return_value = [(socket.AF_INET, socket.SOCK_STREAM, 6, "", ("127.0.0.1", 0))]
+    results = scanner.scan_port_range("scan-once.test", 80, 89, "tcp")
+    assert len(results) == 10
+    assert mock_getaddrinfo.call_count == 1
+    Resolver.clear_cache()
+
+def test_scan_targets(scanner):
+    """Test scanning several hosts at once"""
+    results = scanner.scan_targets(["127.0.0.1", "localhost"], range(80, 83), "tcp")
+    assert set(results) == {"127.0.0.1", "localhost"}
+    assert all([r["port"] for r in host_results] == [80, 81, 82] for host_results in results.values())
+
+def test_scan_targets_skips_unresolved(scanner):
+    """Test that hosts that cannot be resolved are left out"""
+    results = scanner.scan_targets(["127.0.0.1", "invalid.host.name"], range(80, 82), "tcp")
+    assert list(results) == ["127.0.0.1"]
+
+def test_iter_targets_randomized(scanner):
+    """Test that a randomized scan probes every pair of a port set once"""
+    ports = parse_ports("80-85,!82")
+    results = list(scanner.iter_targets(["127.0.0.1", "localhost"], ports, "tcp", randomize=True, seed=1))
+    assert sorted((host, r["port"]) for host, r in results) == sorted(
+        (host, port) for host in ["127.0.0.1", "localhost"] for port in (80, 81, 83, 84, 85)
+    )
+
+def test_iter_scan_is_lazy(scanner):
+    """Test that results are yielded as they complete"""
+    results = scanner.iter_scan("localhost", 1, 65535, "tcp")
+    first = next(results)
+    assert "port" in first and "state" in first
+    results.close() # Stopping early must not scan the rest of the range
+
+def test_iter_scan_invalid_hostname(scanner):
+    """Test that an unresolvable target yields an error for every port"""
+    results = list(scanner.iter_scan("invalid.host.name", 80, 82, "tcp"))
+    assert [r["state"] for r in results] == ["error"] * 3
+    assert [r["reason"] for r in results] == ["resolution"] * 3
+
+@patch('socket.getaddrinfo')
+def test_probes_get_resolved_targets(mock_getaddrinfo, scanner):
+    """Test that names are resolved once per scan and the probes get the address"""
+    Resolver.clear_cache()
+    mock_getaddrinfo.return_value = [(socket.AF_INET, socket.SOCK_STREAM, 6, "", ("127.0.0.1", 0))]
+    scanner.resolver = Resolver(ttl=0) # Every call to the resolver would look the name up again
+    targets = []
+
+    def probe(target, port):
+        targets.append(target)
+        return {"port": port, "state": "closed", "service": "", "reason": "conn-refused"}
+
+    scanner.scan_tcp_port = probe
+    results = list(scanner.iter_targets(["resolve-once.test"], range(80, 90), "tcp"))
+    assert [host for host, _ in results] == ["resolve-once.test"] * 10
+    assert targets == [ResolvedTarget("resolve-once.test", socket.AF_INET, "127.0.0.1")] * 10
+    assert mock_getaddrinfo.call_count == 2 # resolve_targets, then the first probe
+    Resolver.clear_cache()
+
+def test_scan_targets_with_malformed_name(scanner):
+    """Test that a malformed name is left out and the other targets are scanned"""
+    results = scanner.scan_targets(["127.0.0.1", "foo..bar"], range(80, 82), "tcp")
+    assert list(results) == ["127.0.0.1"]
+    probes = list(scanner.iter_probes([("foo..bar", 80), ("127.0.0.1", 80)], "tcp"))
+    assert sorted((host, r["reason"]) for host, r in probes if r["state"] == "error") == [("foo..bar", "resolution")]
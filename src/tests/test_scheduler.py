@@ -0,0 +1,58 @@
+import threading
+import time
+from core.scheduler import ProbeScheduler, interleave, shuffle
+
+def test_interleave_alternates_hosts():
+    """Test that consecutive probes go to different hosts"""
+    assert list(interleave(["a", "b"], [1, 2])) == [("a", 1), ("b", 1), ("a", 2), ("b", 2)]
+
+def test_scheduler_runs_every_probe():
+    """Test that every probe yields exactly one result"""
+    scheduler = ProbeScheduler(lambda host, port: {"port": port}, max_in_flight=4)
+    results = list(scheduler.run(interleave(["a", "b", "c"], range(10))))
+    assert len(results) == 30
+    assert sorted((host, r["port"]) for host, r in results) == sorted(interleave(["a", "b", "c"], range(10)))
+
+def test_scheduler_respects_per_host_cap():
+    """Test that a host never has more than max_per_host probes in flight"""
+    lock = threading.Lock()
+    in_flight = {}
+    peaks = {}
+
+    def probe(host, port):
+        with lock:
+            in_flight[host] = in_flight.get(host, 0) + 1
+            peaks[host] = max(peaks.get(host, 0), in_flight[host])
+        time.sleep(0.005)
+        with lock:
+            in_flight[host] -= 1
+        return {"port": port}
+
+    scheduler = ProbeScheduler(probe, max_in_flight=8, max_per_host=2)
+    list(scheduler.run((host, port) for port in range(20) for host in ["a", "b"]))
+    assert max(peaks.values()) <= 2
+
+def test_slow_host_does_not_stall_others():
+    """Test that fast hosts finish while a slow host is still running"""
+    release = threading.Event()
+
+    def probe(host, port):
+        if host == "slow":
+            release.wait(5)
+        return {"port": port}
+
+    scheduler = ProbeScheduler(probe, max_in_flight=4, max_per_host=1)
+    run = scheduler.run(interleave(["slow", "fast"], range(20)))
+    fast = [next(run) for _ in range(20)]
+    assert all(host == "fast" for host, _ in fast)
+    release.set()
+    assert len(list(run)) == 20
+
+def test_shuffle_covers_every_pair():
+    """Test that the random order has every probe of interleave once"""
+    targets = ["a", "b", "c"]
+    ports = range(100, 150)
+    shuffled = list(shuffle(targets, ports, seed=3))
+    assert sorted(shuffled) == sorted(interleave(targets, ports))
+    assert shuffled != list(interleave(targets, ports))
+    assert shuffled == list(shuffle(targets, ports, seed=3))
@@ -0,0 +1,66 @@
+import pytest
+from core.services import ServiceRegistry
+
+@pytest.fixture
+def services_file(tmp_path):
+    path = tmp_path / "services"
+    path.write_text(
+        "# Network services\n"
+        "ssh\t\t22/tcp\t\t\t# SSH Remote Login Protocol\n"
+        "domain\t\t53/tcp\n"
+        "domain\t\t53/udp\n"
+        "http\t\t80/tcp\t\twww\n"
+        "http-dup\t80/tcp\n"
+        "custom\t\t40000/udp\n"
+        "broken line\n"
+    )
+    return str(path)
+
+def test_lookup_from_database(services_file):
+    """Test names read from the services database"""
+    registry = ServiceRegistry(services_file)
+    assert registry.lookup(22) == "ssh"
+    assert registry.lookup(40000, "udp") == "custom"
+
+def test_lookup_is_per_protocol(services_file):
+    """Test that UDP ports do not get TCP names"""
+    registry = ServiceRegistry(services_file)
+    assert registry.lookup(22, "udp") == "unknown"
+    assert registry.lookup(40000, "tcp") == "unknown"
+
+def test_first_entry_wins(services_file):
+    """Test that duplicated ports keep the first name"""
+    assert ServiceRegistry(services_file).lookup(80) == "http"
+
+def test_fallback_table(tmp_path):
+    """Test that the bundled table is used without a database"""
+    registry = ServiceRegistry(str(tmp_path / "missing"))
+    assert registry.lookup(443) == "https"
+    assert registry.lookup(123, "udp") == "ntp"
+    assert registry.lookup(1, "sctp") == "unknown"
+    assert registry.lookup(70000) == "unknown"
+
+def test_loaded_lazily(services_file):
+    """Test that nothing is parsed until the first lookup"""
+    registry = ServiceRegistry(services_file)
+    assert registry._tables is None
+    registry.lookup(22)
+    assert registry._tables is not None
+
+def test_top_ports():
+    """Test the frequency ordering of ports"""
+    registry = ServiceRegistry()
+    assert registry.top_ports("tcp", 3) == [80, 23, 443]
+    assert registry.top_ports("udp", 2) == [631, 161]
+    ports = registry.top_ports("tcp")
+    assert len(ports) == len(set(ports))
+
+def test_prioritize_keeps_every_port():
+    """Test that likely ports come first and nothing is lost"""
+    ordered = list(ServiceRegistry().prioritize(range(1, 1001), "tcp"))
+    assert ordered[:3] == [80, 23, 443]
+    assert sorted(ordered) == list(range(1, 1001))
+
+def test_prioritize_lists():
+    """Test that lists keep their order after the likely ports"""
+    assert list(ServiceRegistry().prioritize([5, 4, 22, 3], "tcp")) == [22, 5, 4, 3]
@@ -0,0 +1,136 @@
+import json
+import socket
+import threading
+import pytest
+from core.results import ScanResultSet
+from core.sharding import (
+    Coordinator, ShardScanner, decode_results, encode_results, make_job, parse_address, plan_shards, run_local,
+    run_worker,
+)
+
+def local_job(port, randomize=False):
+    return make_job(["127.0.0.1", "localhost"], f"{port - 20}-{port + 20}", randomize=randomize,
+                    options={"timeout": 0.5, "max_threads": 8})
+
+def expected_probes(port):
+    return sorted((host, p) for host in ["127.0.0.1", "localhost"] for p in range(port - 20, port + 21))
+
+def connect(port):
+    """Raw connection to a coordinator, to play a worker by hand"""
+    sock = socket.create_connection(("127.0.0.1", port))
+    stream = sock.makefile("rwb")
+
+    def exchange(message):
+        stream.write(json.dumps(message).encode() + b"\n")
+        stream.flush()
+        return json.loads(stream.readline())
+
+    return sock, exchange
+
+@pytest.mark.parametrize("randomize", [False, True])
+def test_shards_cover_every_probe_once(randomize):
+    """Test that the shards of a plan split the probes without overlap"""
+    job = local_job(1000, randomize)
+    scanner = ShardScanner(job)
+    probes = [probe for shard in plan_shards(job, 7) for probe in scanner.probes(shard)]
+    assert sorted(probes) == expected_probes(1000)
+    assert plan_shards(job, 7) == plan_shards(job, 7)
+
+def test_excluded_hosts_are_skipped():
+    """Test that hosts that did not resolve are left out"""
+    job = make_job(["127.0.0.1", "invalid.host.name"], "1-10", exclude={"invalid.host.name"})
+    scanner = ShardScanner(job)
+    assert {host for shard in plan_shards(job, 4) for host, _ in scanner.probes(shard)} == {"127.0.0.1"}
+
+def test_shard_scanner_keeps_to_its_limits():
+    """Test that the governor of a worker process gets its share of the limits"""
+    governor = ShardScanner(make_job(["127.0.0.1"], "1-10"), {"free_ports": 100, "max_fds": 200}).scanner.governor
+    assert (governor.free_ports, governor.max_fds) == (100, 200)
+
+def test_encoded_results_round_trip():
+    """Test that packed results survive JSON"""
+    results = ScanResultSet()
+    results.add("h", {"port": 22, "state": "open", "service": "ssh", "reason": "syn-ack"})
+    results.add("h", {"port": 23, "state": "closed", "service": "", "reason": "conn-refused"})
+    assert decode_results(json.loads(json.dumps(encode_results(results)))).to_dict() == results.to_dict()
+
+def test_run_local(listener):
+    """Test a scan sharded over local processes"""
+    job = local_job(listener)
+    results = ScanResultSet().update(run_local(job, plan_shards(job, 10), 2))
+    assert sorted((host, result["port"]) for host in results for result in results[host]) == expected_probes(listener)
+    assert results.open_ports("127.0.0.1") == [listener]
+    assert results.open_ports("localhost") == [listener]
+
+def test_coordinator_with_workers(listener):
+    """Test a coordinator and two workers on localhost"""
+    job = local_job(listener, randomize=True)
+    shards = plan_shards(job, 10)
+    coordinator = Coordinator(job, shards).start()
+    workers = [threading.Thread(target=run_worker, args=("127.0.0.1", coordinator.port, f"w{i}")) for i in range(2)]
+    for worker in workers:
+        worker.start()
+    results = ScanResultSet().update(coordinator.results())
+    for worker in workers:
+        worker.join(5)
+    coordinator.stop()
+    assert sorted((host, result["port"]) for host in results for result in results[host]) == expected_probes(listener)
+    assert results.open_ports("localhost") == [listener]
+    assert sum(coordinator.completed.values()) == len(shards)
+
+def test_shards_of_a_lost_worker_are_queued_again(listener):
+    """Test that a worker that disconnects does not lose its shard"""
+    job = local_job(listener)
+    coordinator = Coordinator(job, plan_shards(job, 10), steal=False).start()
+    sock, exchange = connect(coordinator.port)
+    assert exchange({"type": "hello", "worker": "lost"})["type"] == "job"
+    assert exchange({"type": "next"})["type"] == "shard"
+    sock.shutdown(socket.SHUT_RDWR) # The stream keeps the socket open after close
+    sock.close()
+    run_worker("127.0.0.1", coordinator.port)
+    results = ScanResultSet().update(coordinator.results())
+    coordinator.stop()
+    assert sum(results.counts().values()) == len(expected_probes(listener))
+    assert coordinator.requeued == 1
+
+def test_bogus_results_drop_the_worker(listener):
+    """Test that malformed results and results of shards not handed out are refused"""
+    job = local_job(listener)
+    coordinator = Coordinator(job, plan_shards(job, 10), steal=False).start()
+    for take_shard, result in ((True, {"probes": 0}), (False, {"shard": 0, "hosts": []}), (False, {"shard": 999, "hosts": []})):
+        sock, exchange = connect(coordinator.port)
+        exchange({"type": "hello", "worker": "bogus"})
+        if take_shard:
+            assert exchange({"type": "next"})["shard"][0] == 0
+        stream = sock.makefile("rwb")
+        stream.write(json.dumps({"type": "result", "result": result}).encode() + b"\n")
+        stream.flush()
+        assert stream.readline() == b"" # Dropped
+        sock.close()
+    run_worker("127.0.0.1", coordinator.port)
+    results = ScanResultSet().update(coordinator.results())
+    coordinator.stop()
+    assert sum(results.counts().values()) == len(expected_probes(listener))
+    assert coordinator.requeued == 1
+
+def test_idle_worker_steals_running_shard(listener):
+    """Test that a stuck worker does not hold the end of the scan"""
+    job = local_job(listener)
+    coordinator = Coordinator(job, plan_shards(job, 10)).start()
+    sock, exchange = connect(coordinator.port)
+    exchange({"type": "hello", "worker": "stuck"})
+    assert exchange({"type": "next"})["type"] == "shard" # Never answered
+    run_worker("127.0.0.1", coordinator.port)
+    results = ScanResultSet().update(coordinator.results())
+    sock.close()
+    coordinator.stop()
+    assert sum(results.counts().values()) == len(expected_probes(listener))
+    assert coordinator.stolen == 1
+
+def test_parse_address():
+    """Test ADDRESS:PORT arguments"""
+    assert parse_address("10.0.0.1:7400") == ("10.0.0.1", 7400)
+    assert parse_address(":7400") == ("127.0.0.1", 7400)
+    assert parse_address("[::1]:7400") == ("::1", 7400)
+    with pytest.raises(ValueError):
+        parse_address("10.0.0.1")
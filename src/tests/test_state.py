@@ -0,0 +1,81 @@
+from core.portspec import PortSet
+from core.state import ScanStore, SamplingPolicy, scan_spec
+from core.scanner import PortScanner
+
+SPEC = scan_spec(["127.0.0.1"], PortSet([(1, 100)]))
+
+def result(port, state, service=""):
+    return {"port": port, "state": state, "service": service}
+
+def test_resume_interrupted_scan(tmp_path):
+    """Test that an interrupted scan is resumed with its results"""
+    path = str(tmp_path / "state.db")
+    store = ScanStore(path)
+    store.start_scan(SPEC, "tcp")
+    store.record("127.0.0.1", result(22, "open", "ssh"))
+    store.record("127.0.0.1", result(23, "closed"))
+    store.finish("interrupted")
+    store.close()
+
+    store = ScanStore(path)
+    results = store.start_scan(SPEC, "tcp", resume=True)
+    assert store.resumed
+    assert store.is_done("127.0.0.1", 23)
+    assert not store.is_done("127.0.0.1", 24)
+    assert results.details("127.0.0.1", 22) == {"service": "ssh"}
+    store.close()
+
+def test_resume_ignores_other_specs_and_complete_scans(tmp_path):
+    """Test that only unfinished scans of the same targets and ports are resumed"""
+    store = ScanStore(str(tmp_path / "state.db"))
+    store.start_scan(SPEC, "tcp")
+    store.record("127.0.0.1", result(22, "open"))
+    store.finish()
+    store.start_scan(SPEC, "tcp", resume=True)
+    assert not store.resumed
+    store.finish("interrupted")
+    store.start_scan(scan_spec(["127.0.0.1"], PortSet([(1, 200)])), "tcp", resume=True)
+    assert not store.resumed
+    store.close()
+
+def test_last_complete(tmp_path):
+    """Test that incremental scans compare with the last complete scan"""
+    store = ScanStore(str(tmp_path / "state.db"))
+    assert store.last_complete(SPEC, "tcp") is None
+    store.start_scan(SPEC, "tcp")
+    store.record("127.0.0.1", result(22, "open"))
+    store.finish()
+    current = store.start_scan(SPEC, "tcp", mode="incremental")
+    previous = store.last_complete(SPEC, "tcp")
+    assert previous.open_ports("127.0.0.1") == [22]
+    store.record("127.0.0.1", result(22, "closed"))
+    assert current.diff(previous) == {"opened": [], "closed": [("127.0.0.1", 22)]}
+    store.close()
+
+def test_checkpoint_interval(tmp_path):
+    """Test that results reach the database without an explicit checkpoint"""
+    path = str(tmp_path / "state.db")
+    store = ScanStore(path, checkpoint_interval=0)
+    store.start_scan(SPEC, "tcp")
+    store.record("127.0.0.1", result(80, "open", "http"))
+    reader = ScanStore(path)
+    reader.start_scan(SPEC, "tcp", resume=True)
+    assert reader.is_done("127.0.0.1", 80)
+    reader.close()
+    store.close()
+
+def test_sampling_policy():
+    """Test that the sample keeps the common ports and about the given share of the others"""
+    policy = SamplingPolicy(0.25, seed=1, always=[80])
+    assert policy("h", 80)
+    sampled = sum(policy("h", port) for port in range(1000, 5000))
+    assert 800 < sampled < 1200
+    assert [policy("h", port) for port in range(100)] == [policy("h", port) for port in range(100)]
+    other = SamplingPolicy(0.25, seed=2)
+    assert [policy("h", port) for port in range(1000, 1100)] != [other("h", port) for port in range(1000, 1100)]
+
+def test_iter_targets_exclude():
+    """Test that excluded probes are not sent"""
+    scanner = PortScanner(timeout=0.5, max_threads=10)
+    results = scanner.iter_targets(["127.0.0.1"], range(1, 11), "tcp", exclude=lambda host, port: port % 2 == 0)
+    assert sorted(result["port"] for _, result in results) == [1, 3, 5, 7, 9]
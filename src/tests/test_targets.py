@@ -0,0 +1,46 @@
+import pytest
+from core.targets import TargetList, load_target_file
+
+def test_single_hosts():
+    """Test hostnames and IP addresses"""
+    targets = TargetList(["localhost", "10.0.0.1"])
+    assert list(targets) == ["localhost", "10.0.0.1"]
+    assert targets.hostnames == ["localhost"]
+
+def test_comma_separated_list():
+    """Test comma separated targets in a single spec"""
+    assert list(TargetList(["10.0.0.1,10.0.0.2, localhost"])) == ["10.0.0.1", "10.0.0.2", "localhost"]
+
+def test_cidr_skips_network_and_broadcast():
+    """Test that IPv4 blocks only contain usable hosts"""
+    targets = TargetList(["192.168.1.0/30"])
+    assert list(targets) == ["192.168.1.1", "192.168.1.2"]
+
+@pytest.mark.parametrize("spec, expected", [
+    ("10.0.0.5/32", ["10.0.0.5"]),
+    ("10.0.0.4/31", ["10.0.0.4", "10.0.0.5"]),
+])
+def test_small_cidr_blocks(spec, expected):
+    """Test /31 and /32 blocks"""
+    assert list(TargetList([spec])) == expected
+
+def test_large_cidr_is_lazy():
+    """Test that a /16 is indexable without being expanded"""
+    targets = TargetList(["10.1.0.0/16", "localhost"])
+    assert len(targets) == 65534 + 1
+    assert targets[0] == "10.1.0.1"
+    assert targets[65533] == "10.1.255.254"
+    assert targets[-1] == "localhost"
+    with pytest.raises(IndexError):
+        targets[len(targets)]
+
+def test_invalid_cidr():
+    """Test that malformed blocks are rejected"""
+    with pytest.raises(ValueError):
+        TargetList(["10.0.0.0/33"])
+
+def test_load_target_file(tmp_path):
+    """Test reading targets with comments and mixed separators"""
+    path = tmp_path / "targets.txt"
+    path.write_text("# inventory\n10.0.0.1, 10.0.0.2\nlocalhost  # dev box\n\n10.0.1.0/24\n")
+    assert load_target_file(str(path)) == ["10.0.0.1", "10.0.0.2", "localhost", "10.0.1.0/24"]
@@ -0,0 +1,61 @@
+import errno
+import pytest
+from unittest.mock import patch
+from core.timing import RttEstimator, AdaptiveTiming
+from core.scanner import PortScanner
+
+def test_estimator_first_sample():
+    """Test that the first sample initializes srtt and rttvar"""
+    estimator = RttEstimator()
+    estimator.update(0.1)
+    assert estimator.srtt == pytest.approx(0.1)
+    assert estimator.rttvar == pytest.approx(0.05)
+    assert estimator.timeout() == pytest.approx(0.3)
+
+def test_estimator_converges():
+    """Test that a stable RTT shrinks the variance"""
+    estimator = RttEstimator()
+    for _ in range(50):
+        estimator.update(0.02)
+    assert estimator.srtt == pytest.approx(0.02)
+    assert estimator.timeout() < 0.021
+
+def test_initial_timeout_before_samples():
+    """Test that unknown hosts get the initial timeout"""
+    timing = AdaptiveTiming(initial_timeout=1.5, max_timeout=3)
+    assert timing.timeout_for("10.0.0.1") == 1.5
+
+def test_timeout_floor_and_ceiling():
+    """Test that adaptive timeouts stay within their bounds"""
+    timing = AdaptiveTiming(initial_timeout=1, min_timeout=0.05, max_timeout=2)
+    timing.record("fast", 0.0002)
+    timing.record("slow", 5)
+    assert timing.timeout_for("fast") == 0.05
+    assert timing.timeout_for("slow") == 2
+
+def test_retry_backoff():
+    """Test that retries double the timeout up to the ceiling"""
+    timing = AdaptiveTiming(initial_timeout=1, max_timeout=1.5)
+    assert timing.retry_timeout(0.5) == 1
+    assert timing.retry_timeout(1) == 1.5
+
+def test_summary():
+    """Test the per-host summary"""
+    timing = AdaptiveTiming(initial_timeout=1, min_timeout=0.01)
+    timing.record("10.0.0.1", 0.1)
+    summary = timing.summary()
+    assert summary["10.0.0.1"]["samples"] == 1
+    assert summary["10.0.0.1"]["timeout"] == pytest.approx(0.3)
+
+def test_scanner_records_rst_and_retries_timeouts():
+    """Test that the scanner measures RSTs and retries probes without answer"""
+    timing = AdaptiveTiming(initial_timeout=0.5, retries=2)
+    scanner = PortScanner(timing=timing)
+    with patch.object(PortScanner, "_connect", return_value=(errno.ECONNREFUSED, 0.01, None)):
+        assert scanner.scan_tcp_port("127.0.0.1", 80)["state"] == "closed"
+    assert timing.summary()["127.0.0.1"]["samples"] == 1
+
+    with patch.object(PortScanner, "_connect", return_value=(errno.EAGAIN, 0.5, None)) as mock_connect:
+        scanner.scan_tcp_port("127.0.0.1", 81)
+    assert mock_connect.call_count == 3
+    assert timing.summary()["127.0.0.1"]["samples"] == 1
@@ -0,0 +1,127 @@
+import socket
+import threading
+import time
+import pytest
+from core.udp import UdpScanner, TokenBucket, UDP_PAYLOADS
+from core.scanner import PortScanner
+
+@pytest.fixture
+def echo_server():
+    """UDP server that answers every datagram"""
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    sock.bind(("127.0.0.1", 0))
+    sock.settimeout(0.1)
+    stop = threading.Event()
+
+    def serve():
+        while not stop.is_set():
+            try:
+                data, address = sock.recvfrom(4096)
+            except socket.timeout:
+                continue
+            sock.sendto(b"pong", address)
+
+    thread = threading.Thread(target=serve, daemon=True)
+    thread.start()
+    yield sock.getsockname()[1]
+    stop.set()
+    thread.join()
+    sock.close()
+
+@pytest.fixture
+def silent_socket():
+    """Bound UDP socket that never answers"""
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    sock.bind(("127.0.0.1", 0))
+    yield sock
+    sock.close()
+
+def free_udp_port():
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    sock.bind(("127.0.0.1", 0))
+    port = sock.getsockname()[1]
+    sock.close()
+    return port
+
+def test_udp_open_port(echo_server):
+    """Test that a port that answers is open"""
+    result = UdpScanner(timeout=0.5, rate=None).scan("127.0.0.1", [echo_server])[0]
+    assert result["state"] == "open"
+    assert result["reason"] == "udp-response"
+
+def test_udp_closed_port():
+    """Test that ICMP port unreachable means closed"""
+    result = UdpScanner(timeout=0.5, rate=None).scan("127.0.0.1", [free_udp_port()])[0]
+    assert result["state"] == "closed"
+    assert result["reason"] == "port-unreach"
+
+def test_udp_silent_port_is_retried(silent_socket):
+    """Test that a port without answer is open|filtered after every retry"""
+    port = silent_socket.getsockname()[1]
+    result = UdpScanner(timeout=0.1, retries=2, rate=None).scan("127.0.0.1", [port])[0]
+    assert result["state"] == "open|filtered"
+    silent_socket.settimeout(0.1)
+    received = 0
+    try:
+        while True:
+            silent_socket.recv(4096)
+            received += 1
+    except socket.timeout:
+        pass
+    assert received == 3
+
+def test_udp_many_ports_few_sockets(echo_server):
+    """Test that many probes go through a small socket pool"""
+    ports = list(range(40000, 40200)) + [echo_server]
+    results = UdpScanner(timeout=0.5, max_sockets=8, rate=None).scan("127.0.0.1", ports)
+    assert [r["port"] for r in results] == sorted(ports)
+    assert {r["port"] for r in results if r["state"] == "open"} == {echo_server}
+
+def test_udp_late_answer_is_not_taken_by_next_probe(silent_socket):
+    """Test that a late answer queued on a reused socket is dropped"""
+    late = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    late.bind(("127.0.0.1", 0))
+
+    def answer_late():
+        data, address = late.recvfrom(4096)
+        time.sleep(0.4)
+        late.sendto(b"pong", address)
+
+    thread = threading.Thread(target=answer_late, daemon=True)
+    thread.start()
+    ports = [late.getsockname()[1], silent_socket.getsockname()[1]]
+    scanner = UdpScanner(timeout=0.3, retries=0, max_sockets=1, rate=1)
+    results = {r["port"]: r for _, r in scanner.iter_probes(("127.0.0.1", port) for port in ports)}
+    thread.join()
+    late.close()
+    assert [results[port]["state"] for port in ports] == ["open|filtered", "open|filtered"]
+
+def test_udp_rate_limit():
+    """Test that probes to a host are rate limited"""
+    started = time.monotonic()
+    UdpScanner(timeout=0.5, rate=50).scan("127.0.0.1", range(40000, 40030))
+    assert time.monotonic() - started >= 0.4
+
+def test_udp_invalid_hostname():
+    """Test scanning with invalid hostname"""
+    results = UdpScanner(timeout=0.1).scan("invalid.host.name", [53])
+    assert results[0]["state"] == "error"
+
+def test_udp_payloads():
+    """Test that well known services get a protocol payload"""
+    assert UDP_PAYLOADS[123][0] == 0xe3
+    assert b"public" in UDP_PAYLOADS[161]
+    assert all(isinstance(payload, bytes) and payload for payload in UDP_PAYLOADS.values())
+
+def test_token_bucket():
+    """Test that an empty bucket asks to wait"""
+    bucket = TokenBucket(rate=10, burst=1)
+    assert bucket.delay() == 0
+    bucket.take()
+    assert 0 < bucket.delay() <= 0.1
+
+def test_port_scanner_udp(echo_server):
+    """Test that the scanner reports open UDP ports"""
+    scanner = PortScanner(timeout=0.5, udp_rate=None)
+    results = scanner.scan_port_range("127.0.0.1", echo_server, echo_server + 1, "udp")
+    assert results[0]["state"] == "open"